@@ -0,0 +1,241 @@
+"""
+Admission control and load shedding for ConfianceBoost
+Caps the number of requests handled concurrently. Requests over the cap
+wait in a bounded priority queue: cheap catalog reads are admitted ahead of
+expensive Shopify-facing calls. A request that cannot be queued or that
+waits too long gets a fast 503. The cap follows MongoDB latency
+(additive increase, multiplicative decrease), so a slow database sheds
+load instead of piling it up inside uvicorn.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from metrics import counter, gauge
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', '200'))
+ADMISSION_MIN_CONCURRENCY = int(os.environ.get('ADMISSION_MIN_CONCURRENCY', '10'))
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', '100'))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_MS', '2000'))
+ADMISSION_MONGO_TARGET_MS = float(os.environ.get('ADMISSION_MONGO_TARGET_MS', '50'))
+ADMISSION_ADJUST_INTERVAL_S = float(os.environ.get('ADMISSION_ADJUST_INTERVAL_S', '1'))
+
+admission_limit = gauge(
+    "confianceboost_admission_concurrency_limit", "Current adaptive concurrency limit"
+)
+admission_queue_depth = gauge(
+    "confianceboost_admission_queue_depth", "Requests waiting for admission", ("route_class",)
+)
+admission_shed_total = counter(
+    "confianceboost_admission_shed_total", "Requests rejected with 503 by admission control",
+    ("route_class", "reason")
+)
+
+class RouteClass:
+    """Requests sharing a priority (lower is admitted first) and a share of the limit"""
+
+    def __init__(self, name: str, priority: int, max_share: float = 1.0):
+        self.name = name
+        self.priority = priority
+        self.max_share = max_share
+        self.active = 0
+        self.queued = 0
+        self.queue_gauge = admission_queue_depth.labels(name)
+
+CHEAP = RouteClass("cheap", priority=0)
+STANDARD = RouteClass("standard", priority=1)
+# Shopify round trips hold a slot for a long time; never let them take the whole limit
+EXPENSIVE = RouteClass("expensive", priority=2, max_share=0.25)
+
+ROUTE_CLASSES: List[Tuple[str, 're.Pattern', Optional[RouteClass]]] = [
+    # Live event streams stay open for hours: they must not hold a concurrency slot
+    ("GET", re.compile(r"^/api/user/events$"), None),
+    ("GET", re.compile(r"^/api/?$"), CHEAP),
+    ("GET", re.compile(r"^/api/modules(/\d+)?$"), CHEAP),
+    ("GET", re.compile(r"^/api/stats$"), CHEAP),
+    ("GET", re.compile(r"^/api/search$"), CHEAP),
+    ("POST", re.compile(r"^/api/shopify/validate-access$"), EXPENSIVE),
+    ("POST", re.compile(r"^/api/shopify/webhook/"), EXPENSIVE),
+    ("GET", re.compile(r"^/api/shopify/user/"), EXPENSIVE),
+    ("GET", re.compile(r"^/api/admin/"), EXPENSIVE),
+]
+
+def classify(method: str, path: str) -> Optional[RouteClass]:
+    """Returns the route class, or None for paths outside the API (e.g. /metrics) and live streams"""
+    if not path.startswith("/api"):
+        return None
+    for route_method, pattern, route_class in ROUTE_CLASSES:
+        if method == route_method and pattern.match(path):
+            return route_class
+    return STANDARD
+
+class MongoLatencyTracker(monitoring.CommandListener):
+    """Exponentially weighted moving average of MongoDB command latency"""
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.ewma_ms = 0.0
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.ewma_ms += self.alpha * (event.duration_micros / 1000 - self.ewma_ms)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+mongo_latency_tracker = MongoLatencyTracker()
+
+class AdmissionController:
+    def __init__(self, max_limit: int = ADMISSION_MAX_CONCURRENCY, min_limit: int = ADMISSION_MIN_CONCURRENCY,
+                 queue_size: int = ADMISSION_QUEUE_SIZE, queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_MS / 1000,
+                 latency_target_ms: float = ADMISSION_MONGO_TARGET_MS,
+                 latency_tracker: MongoLatencyTracker = mongo_latency_tracker):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = float(max_limit)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.latency_target_ms = latency_target_ms
+        self.latency_tracker = latency_tracker
+        self.active = 0
+        # Requests waiting across every route class; queue_size bounds this total
+        self.queued = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future, RouteClass]] = []
+        self._sequence = itertools.count()
+        self._last_adjust = time.monotonic()
+        admission_limit.set(self.limit)
+
+    def _has_room(self, route_class: RouteClass) -> bool:
+        limit = int(self.limit)
+        return self.active < limit and route_class.active < max(1, int(limit * route_class.max_share))
+
+    def _admit(self, route_class: RouteClass) -> None:
+        self.active += 1
+        route_class.active += 1
+
+    async def acquire(self, route_class: RouteClass) -> Optional[str]:
+        """Returns None once admitted, otherwise the reason the request is shed"""
+        if not self._waiters and self._has_room(route_class):
+            self._admit(route_class)
+            return None
+        if self.queued >= self.queue_size:
+            return "queue_full"
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (route_class.priority, next(self._sequence), future, route_class))
+        self.queued += 1
+        route_class.queued += 1
+        route_class.queue_gauge.inc()
+        self._wake()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+            return None
+        except asyncio.TimeoutError:
+            if future.done():
+                # Admitted just as the timeout fired; keep the slot
+                return None
+            future.cancel()
+            self._dequeue(route_class)
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            # Client gone or server shutting down: never leave an orphan to be admitted later
+            if future.done():
+                self.release(route_class)
+            else:
+                future.cancel()
+                self._dequeue(route_class)
+            raise
+
+    def _dequeue(self, route_class: RouteClass) -> None:
+        self.queued -= 1
+        route_class.queued -= 1
+        route_class.queue_gauge.dec()
+
+    def release(self, route_class: RouteClass) -> None:
+        self.active -= 1
+        route_class.active -= 1
+        self._maybe_adjust()
+        self._wake()
+
+    def _wake(self) -> None:
+        skipped = []
+        while self._waiters and self.active < int(self.limit):
+            entry = heapq.heappop(self._waiters)
+            future, route_class = entry[2], entry[3]
+            if future.done():
+                continue
+            if not self._has_room(route_class):
+                skipped.append(entry)
+                continue
+            self._dequeue(route_class)
+            self._admit(route_class)
+            future.set_result(None)
+        for entry in skipped:
+            heapq.heappush(self._waiters, entry)
+
+    def _maybe_adjust(self) -> None:
+        now = time.monotonic()
+        if now - self._last_adjust < ADMISSION_ADJUST_INTERVAL_S:
+            return
+        self._last_adjust = now
+        if self.latency_tracker.ewma_ms > self.latency_target_ms:
+            self.limit = max(float(self.min_limit), self.limit * 0.9)
+        else:
+            self.limit = min(float(self.max_limit), self.limit + max(1.0, self.max_limit * 0.02))
+        admission_limit.set(self.limit)
+
+_SHED_BODY = json.dumps(
+    {"detail": "Service temporairement surchargé, veuillez réessayer"}, ensure_ascii=False
+).encode()
+
+class AdmissionControlMiddleware:
+    """ASGI middleware running every API request through an AdmissionController"""
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or AdmissionController()
+        self._shed_counters: Dict[Tuple[str, str], object] = {}
+
+    async def __call__(self, scope, receive, send):
+        route_class = classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await self.controller.acquire(route_class)
+        if reason is not None:
+            self._count_shed(route_class, reason)
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(_SHED_BODY)).encode()),
+                    (b"retry-after", b"1"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": _SHED_BODY})
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class)
+
+    def _count_shed(self, route_class: RouteClass, reason: str) -> None:
+        key = (route_class.name, reason)
+        child = self._shed_counters.get(key)
+        if child is None:
+            child = self._shed_counters[key] = admission_shed_total.labels(*key)
+        child.inc()
@@ -0,0 +1,241 @@
+"""
+Cohort funnel analytics for ConfianceBoost
+Streams users from MongoDB in cursor batches, together with their
+completion bitmaps and first certificate, then the users moved to cold
+storage (users_archive), whose bundles already hold both. A user restored
+while the report runs may be counted in neither or both passes. Each batch becomes a small set of
+NumPy arrays that is folded into fixed-size accumulators, so memory stays
+bounded by the batch size whatever the number of users. Reports:
+- the module funnel: users who completed module 1, 1-2, ..., 1-6;
+- time from purchase to first certificate;
+- completion by purchase month.
+
+numpy is imported lazily so the API process only loads it when an admin
+asks for a report. Run offline with:
+    python analytics.py funnel --batch-size 5000 --output funnel.json
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+import database
+from archive_format import unpack_archive
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_BATCH_SIZE = int(os.environ.get('ANALYTICS_BATCH_SIZE', '5000'))
+# Upper edges (days) of the time-to-certificate histogram buckets
+TIME_TO_CERTIFICATE_EDGES = (1, 3, 7, 14, 30, 60, 90, 180, 365)
+
+class FunnelAccumulator:
+    """Running totals for the funnel report; size depends on modules and months only"""
+
+    def __init__(self, module_ids: List[int], full_masks: List[int]):
+        import numpy as np
+
+        self.np = np
+        self.module_ids = module_ids
+        self.full_masks = np.array(full_masks, dtype=np.int64)
+        self.users = 0
+        self.completed_per_module = np.zeros(len(module_ids), dtype=np.int64)
+        self.funnel = np.zeros(len(module_ids), dtype=np.int64)
+        self.edges = np.array((0,) + TIME_TO_CERTIFICATE_EDGES + (np.inf,), dtype=np.float64)
+        self.certificate_histogram = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.certificate_days_sum = 0.0
+        self.certified = 0
+        # month ("YYYY-MM") -> [buyers, completed every module, certified]
+        self.months: Dict[str, List[int]] = {}
+
+    def add_batch(self, bitmaps, purchased, certified_at) -> None:
+        """
+        bitmaps: (n, modules) int64 completion bitmaps
+        purchased: (n,) datetime64[ms] purchase (or enrollment) dates
+        certified_at: (n,) datetime64[ms] first certificate, NaT if none
+        """
+        np = self.np
+        self.users += len(bitmaps)
+
+        completed = (bitmaps & self.full_masks) == self.full_masks
+        self.completed_per_module += completed.sum(axis=0)
+        self.funnel += np.logical_and.accumulate(completed, axis=1).sum(axis=0)
+        all_modules = completed.all(axis=1) if completed.shape[1] else np.zeros(len(bitmaps), dtype=bool)
+
+        has_certificate = ~np.isnat(certified_at) & ~np.isnat(purchased)
+        days = (certified_at[has_certificate] - purchased[has_certificate]) / np.timedelta64(1, 'D')
+        days = np.clip(days, 0, None)
+        self.certificate_histogram += np.histogram(days, bins=self.edges)[0]
+        self.certificate_days_sum += float(days.sum())
+        self.certified += int(has_certificate.sum())
+
+        known = ~np.isnat(purchased)
+        months, inverse = np.unique(purchased[known].astype('datetime64[M]'), return_inverse=True)
+        inverse = inverse.ravel()
+        buyers = np.bincount(inverse, minlength=len(months))
+        finished = np.bincount(inverse, weights=all_modules[known], minlength=len(months))
+        certified = np.bincount(inverse, weights=~np.isnat(certified_at[known]), minlength=len(months))
+        for month, counts in zip(months.astype(str), zip(buyers, finished, certified)):
+            totals = self.months.setdefault(month, [0, 0, 0])
+            for i, count in enumerate(counts):
+                totals[i] += int(count)
+
+    def report(self) -> Dict:
+        labels = [f"<{int(edge)}d" for edge in TIME_TO_CERTIFICATE_EDGES] + [f">={TIME_TO_CERTIFICATE_EDGES[-1]}d"]
+        return {
+            "users": self.users,
+            "funnel": [
+                {
+                    "moduleId": module_id,
+                    "completedModule": int(completed),
+                    "completedThrough": int(through),
+                    "rate": round(int(through) / self.users, 4) if self.users else 0.0,
+                }
+                for module_id, completed, through in zip(self.module_ids, self.completed_per_module, self.funnel)
+            ],
+            "timeToCertificate": {
+                "certified": self.certified,
+                "meanDays": round(self.certificate_days_sum / self.certified, 2) if self.certified else None,
+                "histogram": dict(zip(labels, (int(count) for count in self.certificate_histogram))),
+            },
+            "byPurchaseMonth": [
+                {
+                    "month": month,
+                    "buyers": buyers,
+                    "completedAll": finished,
+                    "certified": certified,
+                    "completionRate": round(finished / buyers, 4) if buyers else 0.0,
+                }
+                for month, (buyers, finished, certified) in sorted(self.months.items())
+            ],
+        }
+
+async def _first_certificates(user_ids: List[str]) -> Dict[str, object]:
+    pipeline = [
+        {"$match": {"userId": {"$in": user_ids}}},
+        {"$group": {"_id": "$userId", "first": {"$min": "$completedAt"}}},
+    ]
+    return {row["_id"]: row["first"] async for row in database.certificates_collection.aggregate(pipeline)}
+
+async def _completion_bitmaps(user_ids: List[str]) -> Dict[str, Dict[str, int]]:
+    cursor = database.user_progress_collection.find(
+        {"userId": {"$in": user_ids}}, {"_id": 0, "userId": 1, "exercises": 1}
+    )
+    return {doc["userId"]: doc.get("exercises", {}) async for doc in cursor}
+
+def _fold(accumulator: FunnelAccumulator, users: List[dict], bitmaps_by_user: Dict[str, Dict[str, int]],
+          certificates: Dict[str, object]) -> None:
+    np = accumulator.np
+    user_ids = [user["id"] for user in users]
+    module_keys = [str(module_id) for module_id in accumulator.module_ids]
+    bitmaps = np.zeros((len(users), len(module_keys)), dtype=np.int64)
+    for row, user_id in enumerate(user_ids):
+        user_bitmaps = bitmaps_by_user.get(user_id)
+        if user_bitmaps:
+            bitmaps[row] = [user_bitmaps.get(key, 0) for key in module_keys]
+    purchased = np.array(
+        [user.get("purchase_date") or user.get("enrollmentDate") for user in users], dtype="datetime64[ms]"
+    )
+    certified_at = np.array([certificates.get(user_id) for user_id in user_ids], dtype="datetime64[ms]")
+    accumulator.add_batch(bitmaps, purchased, certified_at)
+
+async def _fold_batch(accumulator: FunnelAccumulator, users: List[dict]) -> None:
+    user_ids = [user["id"] for user in users]
+    bitmaps_by_user, certificates = await asyncio.gather(
+        _completion_bitmaps(user_ids), _first_certificates(user_ids)
+    )
+    _fold(accumulator, users, bitmaps_by_user, certificates)
+
+def _fold_archived_batch(accumulator: FunnelAccumulator, archives: List[dict]) -> None:
+    users, bitmaps_by_user, certificates = [], {}, {}
+    for archive in archives:
+        bundle = unpack_archive(archive)
+        user = bundle["user"]
+        users.append(user)
+        if bundle.get("progress"):
+            bitmaps_by_user[user["id"]] = bundle["progress"].get("exercises", {})
+        completed = [certificate["completedAt"] for certificate in bundle.get("certificates", [])
+                     if certificate.get("completedAt")]
+        if completed:
+            certificates[user["id"]] = min(completed)
+    _fold(accumulator, users, bitmaps_by_user, certificates)
+
+async def compute_funnel(batch_size: int = ANALYTICS_BATCH_SIZE) -> Dict:
+    """Builds the funnel report in one pass over users, then one over users_archive"""
+    started = time.perf_counter()
+    modules = sorted(await database.get_modules(), key=lambda module: module["id"])
+    full_masks = [
+        (1 << min(len(module.get("content", {}).get("exercises", [])), database.MAX_EXERCISES_PER_MODULE)) - 1
+        for module in modules
+    ]
+    accumulator = FunnelAccumulator([module["id"] for module in modules], full_masks)
+
+    cursor = database.users_collection.find(
+        {}, {"_id": 0, "id": 1, "purchase_date": 1, "enrollmentDate": 1}
+    ).batch_size(batch_size)
+    batch: List[dict] = []
+    async for user in cursor:
+        batch.append(user)
+        if len(batch) >= batch_size:
+            await _fold_batch(accumulator, batch)
+            batch = []
+    if batch:
+        await _fold_batch(accumulator, batch)
+
+    archived = 0
+    cursor = database.users_archive_collection.find({}, {"_id": 0, "data": 1}).batch_size(batch_size)
+    batch = []
+    async for archive in cursor:
+        batch.append(archive)
+        if len(batch) >= batch_size:
+            _fold_archived_batch(accumulator, batch)
+            archived += len(batch)
+            batch = []
+    if batch:
+        _fold_archived_batch(accumulator, batch)
+        archived += len(batch)
+
+    report = accumulator.report()
+    report["archivedUsers"] = archived
+    report["elapsedMs"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("Funnel report over %s users in %sms", report["users"], report["elapsedMs"])
+    return report
+
+def main() -> None:
+    import typer
+
+    cli = typer.Typer(help="ConfianceBoost analytics")
+
+    @cli.command()
+    def funnel(batch_size: int = typer.Option(ANALYTICS_BATCH_SIZE, help="users per cursor batch"),
+               output: Optional[str] = typer.Option(None, help="write the report to this JSON file")):
+        """Module funnel, time-to-certificate and completion by purchase month"""
+        async def run():
+            await database.connect_database()
+            try:
+                return await compute_funnel(batch_size)
+            finally:
+                database.close_database()
+
+        report = asyncio.run(run())
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if output:
+            with open(output, "w") as f:
+                f.write(text + "\n")
+        typer.echo(text)
+
+    @cli.callback()
+    def callback():
+        pass
+
+    cli()
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    main()
@@ -0,0 +1,162 @@
+"""
+Cold storage for inactive ConfianceBoost users
+Users with no learning activity for ARCHIVE_INACTIVE_DAYS are moved out of
+the hot collections. Each one becomes a single `users_archive` document
+holding their user document, certificates and exercise completion
+bitmaps, BSON-encoded and zlib-compressed (see archive_format.py). Only
+the lookup keys (user id, email, Shopify order id) stay uncompressed and
+indexed. The hot `users`, `certificates` and `user_progress` collections,
+and their indexes, only hold people who are still learning.
+
+A user is restored by the DAL (database.restore_user / restore_users_by_id)
+the next time they log in through Shopify or are read by id; anonymous
+email lookups only read the archive. Restoring writes everything back with
+insert-only upserts before deleting the archive document, so an
+interrupted archival or restore can simply be replayed. Run archival
+offline with:
+    python archive.py run --inactive-days 365 --batch-size 500
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import DeleteOne, ReplaceOne
+
+import database
+from archive_format import pack_archive
+from migrations import DEMO_USER_ID
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_INACTIVE_DAYS = int(os.environ.get('ARCHIVE_INACTIVE_DAYS', '365'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+
+def inactive_query(cutoff: datetime) -> Dict:
+    """Users whose last activity (or enrollment, if they never started) is older than `cutoff`"""
+    return {
+        "id": {"$ne": DEMO_USER_ID},
+        "$and": [
+            {"$or": [
+                {"lastActivity": {"$lt": cutoff}},
+                {"lastActivity": None, "enrollmentDate": {"$lt": cutoff}},
+            ]},
+            # A restored user gets a full inactivity period before going back to cold storage
+            {"$or": [{"restoredAt": None}, {"restoredAt": {"$lt": cutoff}}]},
+        ],
+    }
+
+ARCHIVE_RETRIES = 2
+
+def _unchanged(user: Dict) -> Dict:
+    """Matches `user` only while the whole stored document still equals this snapshot"""
+    return {"_id": user["_id"], "$expr": {"$eq": ["$$ROOT", {"$literal": user}]}}
+
+async def _archive_batch(users: List[Dict], cutoff: datetime, retries: int = ARCHIVE_RETRIES) -> int:
+    user_ids = [user["id"] for user in users]
+    # Snapshots keep their _id: only these exact documents are deleted afterwards
+    certificates: Dict[str, List[Dict]] = {}
+    async for certificate in database.certificates_collection.find({"userId": {"$in": user_ids}}):
+        certificates.setdefault(certificate["userId"], []).append(certificate)
+    progress = {
+        doc["userId"]: doc
+        async for doc in database.user_progress_collection.find({"userId": {"$in": user_ids}})
+    }
+
+    now = datetime.utcnow()
+    await database.users_archive_collection.bulk_write([
+        ReplaceOne({"_id": user["id"]},
+                   pack_archive(user, certificates.get(user["id"], []), progress.get(user["id"]), now),
+                   upsert=True)
+        for user in users
+    ], ordered=False)
+
+    # Only delete users that haven't changed at all since they were read: any
+    # write (activity, profile, enrichment) would otherwise be lost
+    await database.users_collection.bulk_write([DeleteOne(_unchanged(user)) for user in users], ordered=False)
+    changed = {
+        user["id"] async for user in database.users_collection.find({"id": {"$in": user_ids}}, {"_id": 0, "id": 1})
+    }
+    if changed:
+        await database.users_archive_collection.delete_many({"_id": {"$in": list(changed)}})
+    archived = [user_id for user_id in user_ids if user_id not in changed]
+    # Certificates and bitmaps written after the snapshot (a late request for a
+    # user being archived) stay in the hot collections rather than being lost
+    certificate_ids = [certificate["_id"] for user_id in archived for certificate in certificates.get(user_id, [])]
+    progress_deletes = [DeleteOne(progress[user_id]) for user_id in archived if user_id in progress]
+    if certificate_ids:
+        await database.certificates_collection.delete_many({"_id": {"$in": certificate_ids}})
+    if progress_deletes:
+        # The whole snapshot is the filter, so a bitmap updated since is kept
+        await database.user_progress_collection.bulk_write(progress_deletes, ordered=False)
+    if archived:
+        await database.invalidate_stats()
+
+    # Users that changed but are still inactive are archived again from a fresh read
+    if changed and retries:
+        fresh = await database.users_collection.find(
+            {"$and": [inactive_query(cutoff), {"id": {"$in": list(changed)}}]}
+        ).to_list(None)
+        if fresh:
+            return len(archived) + await _archive_batch(fresh, cutoff, retries - 1)
+    return len(archived)
+
+async def archive_inactive_users(inactive_days: int = ARCHIVE_INACTIVE_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                                 limit: Optional[int] = None) -> Dict:
+    """Moves users inactive for `inactive_days` to cold storage, `batch_size` at a time"""
+    started = time.perf_counter()
+    cutoff = datetime.utcnow() - timedelta(days=inactive_days)
+    archived = 0
+    while limit is None or archived < limit:
+        size = batch_size if limit is None else min(batch_size, limit - archived)
+        # Whole documents, _id included: they guard the deletes
+        users = await database.users_collection.find(inactive_query(cutoff)).limit(size).to_list(size)
+        if not users:
+            break
+        moved = await _archive_batch(users, cutoff)
+        archived += moved
+        if moved == 0:
+            # Every candidate became active meanwhile; don't spin on them
+            break
+    report = {"archived": archived, "cutoff": cutoff.isoformat(),
+              "elapsedMs": round((time.perf_counter() - started) * 1000, 1)}
+    logger.info("Archived %s inactive users in %sms", archived, report["elapsedMs"])
+    return report
+
+def main() -> None:
+    import json
+
+    import typer
+
+    cli = typer.Typer(help="ConfianceBoost cold storage")
+
+    @cli.command()
+    def run(inactive_days: int = typer.Option(ARCHIVE_INACTIVE_DAYS, help="days without activity"),
+            batch_size: int = typer.Option(ARCHIVE_BATCH_SIZE, help="users per batch"),
+            limit: Optional[int] = typer.Option(None, help="stop after archiving this many users")):
+        """Move inactive users, their certificates and exercise state to users_archive"""
+        async def archive():
+            await database.connect_database()
+            try:
+                return await archive_inactive_users(inactive_days, batch_size, limit)
+            finally:
+                database.close_database()
+
+        typer.echo(json.dumps(asyncio.run(archive()), indent=2))
+
+    @cli.callback()
+    def callback():
+        pass
+
+    cli()
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    main()
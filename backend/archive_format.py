@@ -0,0 +1,42 @@
+"""
+Layout of ConfianceBoost cold storage documents
+A `users_archive` document keeps the lookup keys (user id, email, Shopify
+order id) uncompressed and indexed, and packs everything else - the user
+document, their certificates and exercise completion bitmaps - into one
+BSON-encoded, zlib-compressed `data` field. Shared by the archival job
+(archive.py), the restore paths of the DAL (database.py) and the reports
+that read cold storage (analytics.py).
+"""
+
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import bson
+
+ARCHIVE_COMPRESSION_LEVEL = 6
+ARCHIVE_FORMAT = "bson+zlib"
+
+def strip_id(document: Dict) -> Dict:
+    return {key: value for key, value in document.items() if key != "_id"}
+
+def pack_archive(user: Dict, certificates: List[Dict], progress: Optional[Dict], now: datetime) -> Dict:
+    """Builds the users_archive document of `user`"""
+    bundle = {
+        "user": strip_id(user),
+        "certificates": [strip_id(certificate) for certificate in certificates],
+        "progress": strip_id(progress) if progress else None,
+    }
+    return {
+        "_id": user["id"],
+        "email": (user.get("email") or "").lower(),
+        "shopify_order_id": user.get("shopify_order_id"),
+        "lastActivity": user.get("lastActivity"),
+        "archivedAt": now,
+        "format": ARCHIVE_FORMAT,
+        "data": bson.Binary(zlib.compress(bson.encode(bundle), ARCHIVE_COMPRESSION_LEVEL)),
+    }
+
+def unpack_archive(archive: Dict) -> Dict:
+    """Returns the {user, certificates, progress} bundle of a users_archive document"""
+    return bson.decode(zlib.decompress(archive["data"]))
@@ -0,0 +1,444 @@
+"""
+Two-tier cache for ConfianceBoost
+An in-process LRU sits in front of an optional shared store (Redis when
+REDIS_URL is set, or InMemorySharedStore as a local stand-in in tests), so
+uvicorn workers and hosts share entries. Writes publish an invalidation
+message that evicts the entry from every worker's LRU. Concurrent misses
+for the same key are collapsed into a single load, within a worker and
+across workers. Hit and miss counts are exported per namespace.
+
+The store's pub/sub also carries messages between workers on dedicated
+topics (publish / on_message), separate from invalidations. Pub/sub is
+at-most-once, so topics that cannot afford a lost message pair it with a
+shared counter (incr_counter / read_counter) to detect gaps. Without a
+shared store nothing leaves the current worker.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import bson
+
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.environ.get('REDIS_URL', '')
+CACHE_LOCAL_MAXSIZE = int(os.environ.get('CACHE_LOCAL_MAXSIZE', '1024'))
+CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'confianceboost')
+INVALIDATION_CHANNEL = f"{CACHE_KEY_PREFIX}:cache-invalidation"
+# How long a worker holds the cross-worker load lease for a missing key
+CACHE_LOAD_LEASE_S = float(os.environ.get('CACHE_LOAD_LEASE_S', '5'))
+# Backoff between attempts to resubscribe after the pub/sub connection drops
+CACHE_PUBSUB_RETRY_S = float(os.environ.get('CACHE_PUBSUB_RETRY_S', '0.5'))
+CACHE_PUBSUB_MAX_RETRY_S = float(os.environ.get('CACHE_PUBSUB_MAX_RETRY_S', '30'))
+
+cache_requests_total = counter(
+    "confianceboost_cache_requests_total", "Cache lookups by namespace and outcome", ("namespace", "result")
+)
+
+_MISSING = object()
+
+class LocalLRU:
+    """
+    Bounded in-process LRU; entries are (value, expires_at)
+
+    Values are returned as stored, not copied: treat them as frozen.
+    """
+
+    def __init__(self, maxsize: int = CACHE_LOCAL_MAXSIZE):
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[Any, float]]' = OrderedDict()
+
+    def get(self, key: Tuple[str, str]) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        if entry[1] < time.monotonic():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key: Tuple[str, str], value: Any, ttl: float) -> None:
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Tuple[str, str]) -> None:
+        self._entries.pop(key, None)
+
+    def delete_namespace(self, namespace: str) -> None:
+        for key in [key for key in self._entries if key[0] == namespace]:
+            del self._entries[key]
+
+    def namespaces(self) -> set:
+        return {key[0] for key in self._entries}
+
+class SharedStore:
+    # Called after pub/sub reconnects: messages published meanwhile were lost
+    on_resubscribe: Optional[Callable[[], None]] = None
+    """Interface of the shared tier; values are opaque bytes"""
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """Sets `key` only if absent; returns whether it was set"""
+        raise NotImplementedError
+
+    async def delete(self, *keys: str) -> None:
+        raise NotImplementedError
+
+    async def delete_prefix(self, prefix: str) -> None:
+        raise NotImplementedError
+
+    async def incr(self, key: str) -> int:
+        """Atomically increments the integer at `key` (0 if absent, never expires); returns the new value"""
+        raise NotImplementedError
+
+    async def publish(self, channel: str, message: str) -> None:
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+class InMemorySharedStore(SharedStore):
+    """
+    Local stand-in for the shared tier
+
+    Several Cache instances sharing one InMemorySharedStore behave like
+    workers sharing a Redis server, pub/sub included.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[bytes, float]] = {}
+        self._subscribers: Dict[str, List[Callable[[str], None]]] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._values.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            self._values.pop(key, None)
+            return None
+        return entry[0]
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._values[key] = (value, time.monotonic() + ttl)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        if await self.get(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._values.pop(key, None)
+
+    async def delete_prefix(self, prefix: str) -> None:
+        for key in [key for key in self._values if key.startswith(prefix)]:
+            del self._values[key]
+
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        await self.set(key, str(value).encode(), math.inf)
+        return value
+
+    async def publish(self, channel: str, message: str) -> None:
+        for callback in self._subscribers.get(channel, []):
+            callback(message)
+
+    async def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        self._subscribers.setdefault(channel, []).append(callback)
+
+class RedisSharedStore(SharedStore):
+    """Shared tier backed by Redis (requires the optional `redis` package)"""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError("REDIS_URL is set but the `redis` package is not installed") from e
+        self._redis = redis_asyncio.from_url(url)
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        # One connection carries every subscribed channel
+        self._callbacks: Dict[str, Callable[[str], None]] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._redis.set(key, value, px=int(ttl * 1000))
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return bool(await self._redis.set(key, value, px=int(ttl * 1000), nx=True))
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def delete_prefix(self, prefix: str) -> None:
+        batch = []
+        async for key in self._redis.scan_iter(match=f"{prefix}*", count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                await self._redis.delete(*batch)
+                batch = []
+        if batch:
+            await self._redis.delete(*batch)
+
+    async def incr(self, key: str) -> int:
+        return await self._redis.incr(key)
+
+    async def publish(self, channel: str, message: str) -> None:
+        await self._redis.publish(channel, message)
+
+    async def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        if self._pubsub is None:
+            self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._callbacks[channel] = callback
+        await self._pubsub.subscribe(channel)
+        if self._listener is None:
+            self._listener = asyncio.ensure_future(self._listen())
+
+    async def _listen(self) -> None:
+        retry = CACHE_PUBSUB_RETRY_S
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    retry = CACHE_PUBSUB_RETRY_S
+                    self._dispatch(message)
+                raise ConnectionError("pub/sub connection closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Cache pub/sub listener failed, resubscribing in %.1fs: %s", retry, e)
+            await asyncio.sleep(retry)
+            retry = min(retry * 2, CACHE_PUBSUB_MAX_RETRY_S)
+            try:
+                await self._resubscribe()
+            except Exception as e:
+                logger.error("Cache pub/sub resubscription failed: %s", e)
+
+    async def _resubscribe(self) -> None:
+        try:
+            await self._pubsub.close()
+        except Exception:
+            pass
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(*self._callbacks)
+        logger.info("Cache pub/sub resubscribed to %s channels", len(self._callbacks))
+        if self.on_resubscribe is not None:
+            self.on_resubscribe()
+
+    def _dispatch(self, message: dict) -> None:
+        channel, data = message.get("channel"), message.get("data")
+        callback = self._callbacks.get(channel.decode() if isinstance(channel, bytes) else channel)
+        if callback is None:
+            return
+        try:
+            callback(data.decode() if isinstance(data, bytes) else data)
+        except Exception as e:
+            # One bad message must not stop invalidations
+            logger.error("Cache pub/sub callback for %s failed: %s", channel, e)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        await self._redis.close()
+
+def _encode(value: Any) -> bytes:
+    # BSON round-trips what Motor returns (datetime, ObjectId, nested documents)
+    return bson.encode({"v": value})
+
+def _decode(data: bytes) -> Any:
+    return bson.decode(data)["v"]
+
+class Cache:
+    def __init__(self, store: Optional[SharedStore] = None, local_maxsize: int = CACHE_LOCAL_MAXSIZE):
+        self.store = store
+        self.local = LocalLRU(local_maxsize)
+        self.node_id = uuid.uuid4().hex
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        # Bumped on every invalidation so a load racing with it isn't cached locally
+        self._generations: Dict[str, int] = {}
+        self._counters: Dict[Tuple[str, str], Any] = {}
+        self._topics: Dict[str, List[Callable[[str], None]]] = {}
+
+    def _count(self, namespace: str, result: str) -> None:
+        key = (namespace, result)
+        child = self._counters.get(key)
+        if child is None:
+            child = self._counters[key] = cache_requests_total.labels(namespace, result)
+        child.inc()
+
+    @staticmethod
+    def _shared_key(namespace: str, key: str) -> str:
+        return f"{CACHE_KEY_PREFIX}:{namespace}:{key}"
+
+    @staticmethod
+    def _topic_channel(topic: str) -> str:
+        return f"{CACHE_KEY_PREFIX}:topic:{topic}"
+
+    async def start(self) -> None:
+        """Subscribes to invalidations and to the topics registered with on_message"""
+        if self.store is not None:
+            await self.store.subscribe(INVALIDATION_CHANNEL, self._on_invalidation)
+            for topic in self._topics:
+                await self.store.subscribe(self._topic_channel(topic), self._topic_receiver(topic))
+            self.store.on_resubscribe = self._on_resubscribe
+
+    def _on_resubscribe(self) -> None:
+        # Invalidations published while disconnected were lost: drop the whole local tier
+        namespaces = self.local.namespaces() | {key[0] for key in self._inflight} | set(self._generations)
+        for namespace in namespaces:
+            self._evict_local(namespace, None)
+
+    async def close(self) -> None:
+        if self.store is not None:
+            await self.store.close()
+
+    def _evict_local(self, namespace: str, key: Optional[str]) -> None:
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        if key is None:
+            self.local.delete_namespace(namespace)
+        else:
+            self.local.delete((namespace, key))
+
+    def _on_invalidation(self, message: str) -> None:
+        origin, namespace, key = message.split("|", 2)
+        if origin == self.node_id:
+            return
+        self._evict_local(namespace, key or None)
+
+    def on_message(self, topic: str, callback: Callable[[str], None]) -> None:
+        """Calls `callback(message)` for messages other workers publish on `topic`; register before start()"""
+        self._topics.setdefault(topic, []).append(callback)
+
+    def _topic_receiver(self, topic: str) -> Callable[[str], None]:
+        def receive(raw: str) -> None:
+            origin, _, message = raw.partition("|")
+            if origin == self.node_id:
+                return
+            for callback in self._topics.get(topic, ()):
+                callback(message)
+        return receive
+
+    async def publish(self, topic: str, message: str) -> None:
+        """Sends `message` to the other workers' `topic` callbacks; a no-op without a shared store"""
+        if self.store is not None:
+            await self.store.publish(self._topic_channel(topic), f"{self.node_id}|{message}")
+
+    async def incr_counter(self, name: str) -> int:
+        """Increments the counter `name` shared by every worker; returns its new value (0 without a shared store)"""
+        if self.store is None:
+            return 0
+        return await self.store.incr(f"{CACHE_KEY_PREFIX}:counter:{name}")
+
+    async def read_counter(self, name: str) -> int:
+        if self.store is None:
+            return 0
+        return int(await self.store.get(f"{CACHE_KEY_PREFIX}:counter:{name}") or 0)
+
+    async def get_or_load(self, namespace: str, key: str, loader: Callable[[], Awaitable[Any]],
+                          ttl: float) -> Any:
+        """Returns the cached value, loading and storing it on a miss; never mutate it"""
+        local_key = (namespace, key)
+        value = self.local.get(local_key)
+        if value is not _MISSING:
+            self._count(namespace, "hit_local")
+            return value
+
+        inflight = self._inflight.get(local_key)
+        if inflight is not None:
+            self._count(namespace, "hit_inflight")
+        else:
+            # The load runs in its own task: a caller that is cancelled (client gone)
+            # stops waiting without failing the callers sharing the load
+            generation = self._generations.get(namespace, 0)
+            inflight = asyncio.ensure_future(self._load(namespace, key, loader, ttl, generation))
+            self._inflight[local_key] = inflight
+            inflight.add_done_callback(lambda task: self._load_done(local_key, task))
+        return await asyncio.shield(inflight)
+
+    async def _load(self, namespace: str, key: str, loader: Callable[[], Awaitable[Any]], ttl: float,
+                    generation: int) -> Any:
+        # Not cached locally if an invalidation raced with the load
+        value = await self._load_shared(namespace, key, loader, ttl)
+        if self._generations.get(namespace, 0) == generation:
+            self.local.set((namespace, key), value, ttl)
+        return value
+
+    def _load_done(self, local_key: Tuple[str, str], task: asyncio.Future) -> None:
+        if self._inflight.get(local_key) is task:
+            del self._inflight[local_key]
+        if not task.cancelled():
+            # Every caller may have gone; don't warn about an unretrieved exception
+            task.exception()
+
+    async def _load_shared(self, namespace: str, key: str, loader: Callable[[], Awaitable[Any]],
+                           ttl: float) -> Any:
+        if self.store is None:
+            self._count(namespace, "miss")
+            return await loader()
+
+        shared_key = self._shared_key(namespace, key)
+        data = await self.store.get(shared_key)
+        if data is not None:
+            self._count(namespace, "hit_shared")
+            return _decode(data)
+
+        # Only the worker holding the lease loads; the others wait briefly for its result
+        lease_key = f"{shared_key}:lease"
+        if not await self.store.add(lease_key, self.node_id.encode(), CACHE_LOAD_LEASE_S):
+            deadline = time.monotonic() + CACHE_LOAD_LEASE_S
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.02)
+                data = await self.store.get(shared_key)
+                if data is not None:
+                    self._count(namespace, "hit_shared")
+                    return _decode(data)
+
+        self._count(namespace, "miss")
+        try:
+            value = await loader()
+            await self.store.set(shared_key, _encode(value), ttl)
+        finally:
+            await self.store.delete(lease_key)
+        return value
+
+    async def invalidate(self, namespace: str, key: Optional[str] = None) -> None:
+        """Evicts `key` (or the whole namespace) from every tier and every worker"""
+        self._evict_local(namespace, key)
+        if self.store is None:
+            return
+        if key is None:
+            await self.store.delete_prefix(f"{CACHE_KEY_PREFIX}:{namespace}:")
+        else:
+            await self.store.delete(self._shared_key(namespace, key))
+        await self.store.publish(INVALIDATION_CHANNEL, f"{self.node_id}|{namespace}|{'' if key is None else key}")
+
+def _default_store() -> Optional[SharedStore]:
+    if REDIS_URL:
+        return RedisSharedStore(REDIS_URL)
+    return None
+
+# Process-wide cache; the shared store only opens connections once used,
+# so creating it at import is fork-safe
+cache = Cache(_default_store())
@@ -0,0 +1,161 @@
+"""
+Response compression for ConfianceBoost
+Negotiates brotli or gzip from Accept-Encoding and compresses buffered
+JSON/text responses of at least COMPRESSION_MIN_SIZE bytes. Streaming
+responses (e.g. server-sent events) pass through untouched.
+
+Cacheable catalog payloads (/api/modules, /api/stats) are cached compressed,
+keyed by a digest of the body, so a content change produces new variants
+without any explicit invalidation. A body seen for the first time is
+compressed at the cheap per-request level; only when it is served again is
+it recompressed once at a higher level. Bodies that change on every write
+(the modules list carries progress) thus never pay for the high level.
+brotli is optional (declared in requirements.txt); without it only gzip is
+offered.
+"""
+
+import gzip
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from metrics import counter
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+# Per-request levels favour speed; precompressed variants are built once at a higher level.
+# Brotli 10-11 costs ~50x the CPU of 8 for a few % on catalog-sized payloads, and would
+# block the event loop on every catalog change
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4'))
+PRECOMPRESSED_GZIP_LEVEL = int(os.environ.get('PRECOMPRESSED_GZIP_LEVEL', '9'))
+PRECOMPRESSED_BROTLI_QUALITY = int(os.environ.get('PRECOMPRESSED_BROTLI_QUALITY', '8'))
+PRECOMPRESSED_MAX_VARIANTS = int(os.environ.get('PRECOMPRESSED_MAX_VARIANTS', '64'))
+
+PRECOMPRESSED_PATHS = re.compile(r"^/api/(modules|stats)/?$")
+_COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+
+compressed_responses_total = counter(
+    "confianceboost_compressed_responses_total", "Responses compressed, by encoding and source",
+    ("encoding", "source")
+)
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Best supported encoding for an Accept-Encoding header ("br", "gzip" or None)"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+def compress(body: bytes, encoding: str, best: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=PRECOMPRESSED_BROTLI_QUALITY if best else COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=PRECOMPRESSED_GZIP_LEVEL if best else COMPRESSION_GZIP_LEVEL, mtime=0)
+
+class PrecompressedVariants:
+    """LRU of compressed bodies keyed by (encoding, body digest); values are (bytes, best level)"""
+
+    def __init__(self, maxsize: int = PRECOMPRESSED_MAX_VARIANTS):
+        self.maxsize = maxsize
+        self._variants: 'OrderedDict[Tuple[str, bytes], Tuple[bytes, bool]]' = OrderedDict()
+
+    def get(self, body: bytes, encoding: str) -> Tuple[bytes, str]:
+        """Returns (compressed body, source): "precompressed" when reused at the best level,
+        "precompressed_miss" for a new body (cheap level) and "precompressed_upgrade" when a
+        body is served again and recompressed at the best level"""
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        variant = self._variants.get(key)
+        if variant is None:
+            compressed, best, source = compress(body, encoding), False, "precompressed_miss"
+        elif variant[1]:
+            self._variants.move_to_end(key)
+            return variant[0], "precompressed"
+        else:
+            compressed, best, source = compress(body, encoding, best=True), True, "precompressed_upgrade"
+        self._variants[key] = (compressed, best)
+        self._variants.move_to_end(key)
+        if len(self._variants) > self.maxsize:
+            self._variants.popitem(last=False)
+        return compressed, source
+
+class CompressionMiddleware:
+    """ASGI middleware compressing buffered responses"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE,
+                 variants: Optional[PrecompressedVariants] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.variants = variants or PrecompressedVariants()
+        self._counters = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        precompressible = scope["method"] == "GET" and PRECOMPRESSED_PATHS.match(scope["path"]) is not None
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if start_message is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(scope=start)
+            body = message.get("body", b"")
+            content_type = headers.get("content-type", "")
+            if not content_type.startswith(_COMPRESSIBLE_TYPES) or "content-encoding" in headers:
+                await send(start)
+                await send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            # Streamed (more_body) or small responses are sent as-is
+            if encoding is None or message.get("more_body", False) or len(body) < self.minimum_size:
+                await send(start)
+                await send(message)
+                return
+
+            if precompressible and start["status"] == 200:
+                body, source = self.variants.get(body, encoding)
+            else:
+                body, source = compress(body, encoding), "request"
+            self._count(encoding, source)
+            headers["content-encoding"] = encoding
+            headers["content-length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _count(self, encoding: str, source: str) -> None:
+        key = (encoding, source)
+        child = self._counters.get(key)
+        if child is None:
+            child = self._counters[key] = compressed_responses_total.labels(*key)
+        child.inc()
@@ -1,180 +1,283 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from models import Module, User, Exercise, Certificate, UserProgress, ModuleContent
+from dataloader import current_scope, get_loader
+from metrics import mongo_command_listener
+from profiler import query_profile_listener
+from admission import mongo_latency_tracker
+from migrations import run_migrations
+from cache import cache
+from live import live_events, PROGRESS, MODULE, EXERCISE, CERTIFICATE
+from archive_format import unpack_archive
+import asyncio
 import os
+import time
 import uuid
-from datetime import datetime
+import logging
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'confianceboost_db')]
+logger = logging.getLogger(__name__)
+
+# Only the static module content is cached; migrations are what change it
+CATALOG_CACHE_TTL_S = float(os.environ.get('CATALOG_CACHE_TTL_S', '300'))
+STATS_CACHE_TTL_S = float(os.environ.get('STATS_CACHE_TTL_S', '60'))
+# Timezone used for activity days when the user has not set one
+DEFAULT_TIMEZONE = os.environ.get('DEFAULT_TIMEZONE', 'Europe/Paris')
+
+# MongoDB connection, created per worker process by connect_database()
+# (never at import time, so forked uvicorn/gunicorn workers don't share sockets)
+client = None
+db = None
 
 # Collections
-modules_collection = db.modules
-users_collection = db.users  
-exercises_collection = db.exercises
-certificates_collection = db.certificates
-user_progress_collection = db.user_progress
+modules_collection = None
+users_collection = None
+exercises_collection = None
+certificates_collection = None
+user_progress_collection = None
+learning_events_collection = None
+learning_daily_collection = None
+users_archive_collection = None
+
+def bind_database(database):
+    """Pointe les collections du DAL vers une base de données"""
+    global db, modules_collection, users_collection, exercises_collection
+    global certificates_collection, user_progress_collection
+    global learning_events_collection, learning_daily_collection, users_archive_collection
+    db = database
+    modules_collection = database.modules
+    users_collection = database.users
+    exercises_collection = database.exercises
+    certificates_collection = database.certificates
+    user_progress_collection = database.user_progress
+    learning_events_collection = database.learning_events
+    learning_daily_collection = database.learning_daily
+    users_archive_collection = database.users_archive
+
+async def connect_database():
+    """Crée le client MongoDB du worker courant et préchauffe son pool"""
+    global client
+    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    min_pool_size = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+    client = AsyncIOMotorClient(
+        mongo_url,
+        maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+        minPoolSize=min_pool_size,
+        maxIdleTimeMS=int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000')),
+        serverSelectionTimeoutMS=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        connectTimeoutMS=int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+        socketTimeoutMS=int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '10000')),
+        waitQueueTimeoutMS=int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000')),
+        event_listeners=[mongo_command_listener, query_profile_listener, mongo_latency_tracker]
+    )
+    bind_database(client[os.environ.get('DB_NAME', 'confianceboost_db')])
+    await warm_up_pool(min_pool_size)
+
+async def warm_up_pool(connections: int):
+    """Ouvre `connections` connexions avant que le worker ne se déclare prêt"""
+    started = time.perf_counter()
+    # Concurrent pings each need their own socket, so the pool fills up now
+    # instead of on the first requests
+    await asyncio.gather(*(client.admin.command('ping') for _ in range(max(connections, 1))))
+    logger.info("MongoDB pool warmed up with %s connections in %.1fms",
+                max(connections, 1), (time.perf_counter() - started) * 1000)
+
+def close_database():
+    """Ferme le client MongoDB du worker courant"""
+    global client
+    if client is not None:
+        client.close()
+        client = None
 
 async def init_database():
-    """Initialize database with default data"""
-    
-    # Check if modules already exist
-    existing_modules = await modules_collection.count_documents({})
-    if existing_modules == 0:
-        # Insert default modules
-        default_modules = [
-            {
-                "id": 1,
-                "title": "Comprendre sa valeur personnelle",
-                "description": "Découvrez votre vraie valeur et apprenez à la reconnaître au quotidien",
-                "duration": "45 min",
-                "lessons": 6,
-                "completed": False,
-                "progress": 0,
-                "content": {
-                    "introduction": "Dans ce module, vous allez explorer les fondements de votre valeur personnelle et apprendre à reconnaître vos qualités uniques.",
-                    "video_url": None,
-                    "exercises": [
-                        "Listez 10 qualités que vous possédez",
-                        "Identifiez 3 réussites passées",
-                        "Créez votre affirmation personnelle",
-                        "Pratiquez l'auto-reconnaissance quotidienne",
-                        "Établissez vos valeurs fondamentales"
-                    ]
-                }
-            },
-            {
-                "id": 2,
-                "title": "Surmonter le syndrome de l'imposteur",
-                "description": "Techniques concrètes pour vaincre la peur de ne pas être à la hauteur",
-                "duration": "60 min",
-                "lessons": 8,
-                "completed": False,
-                "progress": 0,
-                "content": {
-                    "introduction": "Le syndrome de l'imposteur touche 70% des personnes. Apprenez à le reconnaître et à le surmonter définitivement.",
-                    "exercises": [
-                        "Analysez vos pensées limitantes",
-                        "Reconstituez votre parcours de réussites",
-                        "Pratiquez l'auto-compassion",
-                        "Développez votre dialogue intérieur positif",
-                        "Créez votre portfolio de preuves",
-                        "Techniques de recadrage cognitif"
-                    ]
-                }
-            },
-            {
-                "id": 3,
-                "title": "Développer son assertivité",
-                "description": "Apprenez à vous affirmer avec respect et bienveillance",
-                "duration": "50 min",
-                "lessons": 7,
-                "completed": False,
-                "progress": 0,
-                "content": {
-                    "introduction": "L'assertivité est la capacité à exprimer ses opinions et besoins tout en respectant ceux des autres.",
-                    "exercises": [
-                        "Techniques de communication assertive",
-                        "Dire non sans culpabiliser",
-                        "Gérer les conflits constructivement",
-                        "Exprimer ses besoins clairement",
-                        "Pratiquer l'écoute active",
-                        "Développer son langage corporel confiant"
-                    ]
-                }
-            },
-            {
-                "id": 4,
-                "title": "Gérer l'anxiété sociale",
-                "description": "Stratégies pour vous sentir à l'aise en société",
-                "duration": "55 min",
-                "lessons": 6,
-                "completed": False,
-                "progress": 0,
-                "content": {
-                    "introduction": "L'anxiété sociale peut limiter nos interactions. Découvrez des techniques éprouvées pour la surmonter.",
-                    "exercises": [
-                        "Techniques de respiration pour l'anxiété",
-                        "Exposition progressive aux situations sociales",
-                        "Restructuration cognitive des pensées négatives",
-                        "Préparation mentale avant les événements sociaux",
-                        "Développement de sujets de conversation",
-                        "Pratique de la pleine conscience sociale"
-                    ]
-                }
-            },
-            {
-                "id": 5,
-                "title": "Cultiver l'estime de soi",
-                "description": "Construisez une image positive et durable de vous-même",
-                "duration": "65 min",
-                "lessons": 9,
-                "completed": False,
-                "progress": 0,
-                "content": {
-                    "introduction": "L'estime de soi est la fondation de la confiance. Apprenez à la cultiver durablement.",
-                    "exercises": [
-                        "Journal de gratitude personnel",
-                        "Célébrez vos petites victoires",
-                        "Créez votre vision idéale",
-                        "Pratiquez l'autocompassion",
-                        "Développez vos talents uniques",
-                        "Établissez des objectifs personnels alignés",
-                        "Créez votre routine de bien-être",
-                        "Pratiquez l'affirmation positive quotidienne"
-                    ]
-                }
-            },
-            {
-                "id": 6,
-                "title": "Prendre des décisions avec confiance",
-                "description": "Méthodes pour décider sereinement et assumer ses choix",
-                "duration": "40 min",
-                "lessons": 5,
-                "completed": False,
-                "progress": 0,
-                "content": {
-                    "introduction": "Prendre des décisions peut être source d'anxiété. Découvrez des méthodes pour décider avec confiance.",
-                    "exercises": [
-                        "Matrice de décision personnalisée",
-                        "Technique du pour/contre évolué",
-                        "Accepter l'imperfection et l'incertitude",
-                        "Écouter son intuition",
-                        "Prendre des décisions rapides pour les petits choix"
-                    ]
-                }
-            }
-        ]
-        
-        await modules_collection.insert_many(default_modules)
-        print("✅ Modules par défaut créés")
-    
-    # Create default user if none exists
-    existing_users = await users_collection.count_documents({})
-    if existing_users == 0:
-        default_user = {
-            "id": "demo-user-1",
-            "name": "Utilisateur Demo",
-            "email": "demo@confianceboost.fr",
-            "enrollmentDate": datetime.utcnow(),
-            "completedModules": 0,
-            "totalProgress": 0,
-            "certificates": 0
-        }
-        await users_collection.insert_one(default_user)
-        print("✅ Utilisateur demo créé")
+    """Applique les migrations en attente (seed compris)"""
+    applied = await run_migrations(db)
+    if applied:
+        # Migrations are what change the static catalog; evict it on every worker
+        await cache.invalidate("catalog")
+        await invalidate_stats()
+    return applied
+
+async def invalidate_stats():
+    """Invalide les statistiques en cache sur tous les workers (nombre d'élèves modifié)"""
+    await cache.invalidate("stats", "global")
+
+# Never sent to clients, so never fetched
+NO_ID = {"_id": 0}
+
+def projection_for(fields) -> dict:
+    """Projection MongoDB limitée à `fields` et à `id` (tous les champs si None), sans _id"""
+    if not fields:
+        return NO_ID
+    # Always keep `id`: a document without any of `fields` must not come back as {}
+    return {"_id": 0, "id": 1, **{field: 1 for field in fields}}
+
+# Written by update_module_progress: read fresh on every catalog load, never cached,
+# since without a shared store (REDIS_URL) other workers would never see the invalidation
+MODULE_STATE_FIELDS = ("progress", "completed")
+
+async def _merge_module_state(static_modules: list, fields=MODULE_STATE_FIELDS) -> list:
+    states = {
+        state["id"]: state
+        async for state in modules_collection.find({}, projection_for(("id",) + tuple(fields)))
+    }
+    # Cached documents are shared: build new ones rather than updating them
+    return [{**module, **states.get(module["id"], {})} for module in static_modules]
+
+async def get_catalog_content():
+    """Contenu statique des modules, sans progress/completed (liste en cache partagée : ne pas la modifier)"""
+    # The same list is returned until the cache reloads it, so consumers can
+    # detect catalog changes by identity
+    return await cache.get_or_load(
+        "catalog", "modules",
+        lambda: modules_collection.find({}, {"_id": 0, **{field: 0 for field in MODULE_STATE_FIELDS}}).to_list(100),
+        CATALOG_CACHE_TTL_S
+    )
+
+async def _load_catalog():
+    return await _merge_module_state(await get_catalog_content())
+
+async def _load_catalog_fields(fields: tuple):
+    # Projected catalogs are cached beside the full one
+    state_fields = [field for field in MODULE_STATE_FIELDS if field in fields]
+    fields = sorted((set(fields) | {"id"}) - set(MODULE_STATE_FIELDS))
+    projection = projection_for(fields)
+    static_modules = await cache.get_or_load(
+        "catalog", "modules:" + ",".join(fields),
+        lambda: modules_collection.find({}, projection).to_list(100), CATALOG_CACHE_TTL_S
+    )
+    if not state_fields:
+        return static_modules
+    return await _merge_module_state(static_modules, state_fields)
+
+# Cold storage: users archived by archive.py come back on their next login or by-id read
+DUPLICATE_KEY = 11000
+
+async def _restore_archive(archive: dict) -> dict:
+    bundle = unpack_archive(archive)
+    user = dict(bundle["user"], restoredAt=datetime.utcnow())
+    # Insert-only writes: a concurrent restore (or newer hot data) wins, and an
+    # interrupted restore can simply be replayed while the archive document remains
+    try:
+        await users_collection.update_one({"id": user["id"]}, {"$setOnInsert": user}, upsert=True)
+    except DuplicateKeyError:
+        pass
+    if bundle.get("certificates"):
+        try:
+            await certificates_collection.bulk_write([
+                UpdateOne({"id": certificate["id"]}, {"$setOnInsert": certificate}, upsert=True)
+                for certificate in bundle["certificates"]
+            ], ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                raise
+    if bundle.get("progress"):
+        try:
+            await user_progress_collection.update_one(
+                {"userId": user["id"]}, {"$setOnInsert": bundle["progress"]}, upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+    await users_archive_collection.delete_one({"_id": archive["_id"]})
+    await invalidate_stats()
+    return user
+
+def _archive_lookup(email: str = None, shopify_order_id: int = None):
+    conditions = []
+    if email:
+        conditions.append({"email": email.lower()})
+    if shopify_order_id is not None:
+        conditions.append({"shopify_order_id": shopify_order_id})
+    return {"$or": conditions} if conditions else None
+
+async def restore_users_by_id(user_ids: list) -> dict:
+    """Restaure les utilisateurs archivés parmi `user_ids` et les renvoie par ID"""
+    archives = await users_archive_collection.find({"_id": {"$in": list(user_ids)}}).to_list(None)
+    users = {}
+    for archive in archives:
+        user = await _restore_archive(archive)
+        users[user["id"]] = user
+    if users:
+        logger.info("Restored %s archived users", len(users))
+    return users
+
+async def restore_user(email: str = None, shopify_order_id: int = None):
+    """Restaure l'utilisateur archivé correspondant à l'email ou à la commande Shopify"""
+    query = _archive_lookup(email, shopify_order_id)
+    if query is None:
+        return None
+    archive = await users_archive_collection.find_one(query)
+    if archive is None:
+        return None
+    user = await _restore_archive(archive)
+    logger.info("Restored archived user %s", user["id"])
+    return user
+
+def _exclude_fields(document: dict, projection: dict) -> dict:
+    # Applies an exclusion projection (dotted paths included) to a document read outside MongoDB
+    document = dict(document)
+    for path, keep in projection.items():
+        if keep:
+            continue
+        *parents, leaf = path.split(".")
+        target = document
+        for parent in parents:
+            child = target.get(parent)
+            if not isinstance(child, dict):
+                break
+            target[parent] = target = dict(child)
+        else:
+            target.pop(leaf, None)
+    return document
+
+async def get_user_by_email(email: str, projection: dict = NO_ID):
+    """Récupère un utilisateur par email, archivé compris, sans le restaurer (`projection` d'exclusion)"""
+    user = await users_collection.find_one({"email": email.lower()}, projection)
+    if user is not None:
+        return user
+    query = _archive_lookup(email=email)
+    archive = await users_archive_collection.find_one(query) if query else None
+    if archive is None:
+        return None
+    return _exclude_fields(unpack_archive(archive)["user"], projection)
+
+# Request-scoped batch loaders
+async def _load_modules_by_id(module_ids: list):
+    wanted = set(module_ids)
+    return {module["id"]: module for module in await _load_catalog() if module["id"] in wanted}
+
+async def _load_users_by_id(user_ids: list):
+    users = {user["id"]: user for user in await users_collection.find({"id": {"$in": user_ids}}, NO_ID).to_list(None)}
+    missing = [user_id for user_id in user_ids if user_id not in users]
+    if missing:
+        # Inactive users live in cold storage until they come back
+        users.update(await restore_users_by_id(missing))
+    return users
 
 # CRUD Operations
-async def get_modules():
-    """Récupère tous les modules"""
-    modules = await modules_collection.find().to_list(100)
+async def get_modules(fields: tuple = None):
+    """Récupère tous les modules (seulement `fields` si précisé)"""
+    if fields:
+        return await _load_catalog_fields(fields)
+    scope = current_scope()
+    if scope is None:
+        return await _load_catalog()
+
+    modules = await scope.memoize("modules:all", _load_catalog)
+    scope.loader("modules", _load_modules_by_id).prime_many(modules, "id")
     return modules
 
-async def get_module_by_id(module_id: int):
-    """Récupère un module par son ID"""
-    module = await modules_collection.find_one({"id": module_id})
-    return module
+async def get_module_by_id(module_id: int, fields: tuple = None):
+    """Récupère un module par son ID (seulement `fields` si précisé)"""
+    if fields:
+        return next((module for module in await _load_catalog_fields(fields) if module["id"] == module_id), None)
+    loader = get_loader("modules", _load_modules_by_id)
+    if loader is not None:
+        return await loader.load(module_id)
+    modules = await _load_modules_by_id([module_id])
+    return modules.get(module_id)
 
 async def update_module_progress(module_id: int, progress: int, completed: bool):
     """Met à jour la progression d'un module"""
@@ -182,45 +285,151 @@ async def update_module_progress(module_id: int, progress: int, completed: bool)
         "progress": progress,
         "completed": completed
     }
-    result = await modules_collection.update_one(
-        {"id": module_id}, 
-        {"$set": update_data}
+    module = await modules_collection.find_one_and_update(
+        {"id": module_id},
+        {"$set": update_data},
+        projection=NO_ID,
+        return_document=ReturnDocument.AFTER
     )
-    if result.modified_count:
-        return await get_module_by_id(module_id)
-    return None
+    if module:
+        await live_events.publish(None, MODULE, {"id": module_id, "progress": module.get("progress", 0),
+                                                 "completed": module.get("completed", False)})
+    scope = current_scope()
+    if scope is not None:
+        scope.forget("modules:all")
+        loader = scope.loader("modules", _load_modules_by_id)
+        if module:
+            loader.prime(module_id, module)
+        else:
+            loader.clear(module_id)
+    return module
 
-async def get_user_by_id(user_id: str):
-    """Récupère un utilisateur par son ID"""
-    user = await users_collection.find_one({"id": user_id})
-    return user
+async def get_user_by_id(user_id: str, fields: tuple = None):
+    """Récupère un utilisateur par son ID (seulement `fields` si précisé)"""
+    if fields:
+        user = await users_collection.find_one({"id": user_id}, projection_for(fields))
+        if user is None:
+            # Inactive users live in cold storage until they come back
+            if await restore_users_by_id([user_id]):
+                user = await users_collection.find_one({"id": user_id}, projection_for(fields))
+        return user
+    loader = get_loader("users", _load_users_by_id)
+    if loader is not None:
+        return await loader.load(user_id)
+    users = await _load_users_by_id([user_id])
+    return users.get(user_id)
 
 async def update_user_profile(user_id: str, update_data: dict):
     """Met à jour le profil utilisateur"""
-    result = await users_collection.update_one(
+    user = await users_collection.find_one_and_update(
         {"id": user_id},
-        {"$set": update_data}
+        {"$set": update_data},
+        projection=NO_ID,
+        return_document=ReturnDocument.AFTER
+    )
+    loader = get_loader("users", _load_users_by_id)
+    if loader is not None:
+        if user:
+            loader.prime(user_id, user)
+        else:
+            loader.clear(user_id)
+    return user
+
+# Activity streaks. Days are numbered like $dateDiff(unit="day") from the
+# epoch in the user's timezone, so the server and MongoDB agree on them.
+_EPOCH = datetime(1970, 1, 1)
+
+def local_day_number(moment: datetime, tz_name: str) -> int:
+    """Numéro du jour local de `moment` (datetime UTC naïf) dans le fuseau `tz_name`"""
+    try:
+        tz = ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        tz = ZoneInfo(DEFAULT_TIMEZONE)
+    local_date = moment.replace(tzinfo=timezone.utc).astimezone(tz).date()
+    return (local_date - _EPOCH.replace(tzinfo=timezone.utc).astimezone(tz).date()).days
+
+def current_streak(user: dict, now: datetime = None) -> int:
+    """Série en cours, remise à zéro si aucune activité hier ni aujourd'hui"""
+    last_day = user.get("lastActivityDay")
+    if last_day is None:
+        return 0
+    today = local_day_number(now or datetime.utcnow(), user.get("timezone") or DEFAULT_TIMEZONE)
+    return user.get("currentStreak", 0) if today - last_day <= 1 else 0
+
+def _activity_pipeline(now: datetime, update_data: dict) -> list:
+    activity_day = {"$dateDiff": {
+        "startDate": _EPOCH, "endDate": now, "unit": "day",
+        "timezone": {"$ifNull": ["$timezone", DEFAULT_TIMEZONE]}
+    }}
+    return [
+        {"$set": {"_activityDay": activity_day}},
+        {"$set": {
+            **{field: {"$literal": value} for field, value in update_data.items()},
+            "currentStreak": {"$switch": {
+                "branches": [
+                    # Same day (or a late event for an earlier day): unchanged
+                    {"case": {"$gte": ["$lastActivityDay", "$_activityDay"]},
+                     "then": {"$ifNull": ["$currentStreak", 1]}},
+                    {"case": {"$eq": ["$lastActivityDay", {"$subtract": ["$_activityDay", 1]}]},
+                     "then": {"$add": [{"$ifNull": ["$currentStreak", 0]}, 1]}}
+                ],
+                "default": 1
+            }},
+            "lastActivityDay": {"$max": ["$lastActivityDay", "$_activityDay"]},
+            "lastActivity": {"$max": ["$lastActivity", now]}
+        }},
+        {"$set": {"longestStreak": {"$max": ["$longestStreak", "$currentStreak"]}}},
+        {"$unset": "_activityDay"}
+    ]
+
+async def record_activity(user_id: str, update_data: dict = None):
+    """Enregistre une action d'apprentissage et met à jour la série en une seule écriture atomique"""
+    user = await users_collection.find_one_and_update(
+        {"id": user_id},
+        _activity_pipeline(datetime.utcnow(), update_data or {}),
+        projection=NO_ID,
+        return_document=ReturnDocument.AFTER
     )
-    if result.modified_count:
-        return await get_user_by_id(user_id)
-    return None
+    loader = get_loader("users", _load_users_by_id)
+    if loader is not None:
+        if user:
+            loader.prime(user_id, user)
+        else:
+            loader.clear(user_id)
+    if user:
+        await live_events.publish(user_id, PROGRESS, {
+            "totalProgress": user.get("totalProgress", 0),
+            "completedModules": user.get("completedModules", 0),
+            "currentStreak": user.get("currentStreak", 0),
+            "longestStreak": user.get("longestStreak", 0),
+            "lastActivity": user.get("lastActivity"),
+        })
+    return user
 
-async def get_user_progress(user_id: str):
+async def get_user_progress(user_id: str, include_streak: bool = True):
     """Récupère la progression globale de l'utilisateur"""
-    modules = await get_modules()
+    if include_streak:
+        # The streak only lives on the user document; both reads share one round trip
+        modules, user = await asyncio.gather(get_modules(), get_user_by_id(user_id))
+    else:
+        modules, user = await get_modules(), None
     completed_modules = len([m for m in modules if m.get('completed', False)])
     total_modules = len(modules)
     total_progress = int((completed_modules / total_modules) * 100) if total_modules > 0 else 0
     
-    return {
+    progress = {
         "totalProgress": total_progress,
         "completedModules": completed_modules,
         "totalModules": total_modules
     }
+    if include_streak:
+        progress["currentStreak"] = current_streak(user) if user else 0
+        progress["longestStreak"] = user.get("longestStreak", 0) if user else 0
+    return progress
 
 async def get_exercises_by_module(module_id: int):
     """Récupère les exercices d'un module"""
-    exercises = await exercises_collection.find({"moduleId": module_id}).to_list(100)
+    exercises = await exercises_collection.find({"moduleId": module_id}, NO_ID).to_list(100)
     return exercises
 
 async def complete_exercise(exercise_id: str, completed: bool):
@@ -235,9 +444,62 @@ async def complete_exercise(exercise_id: str, completed: bool):
     )
     return result.modified_count > 0
 
+# Exercise completion bitmaps: one user_progress document per user, holding
+# {"exercises": {"<moduleId>": bitmap}} where bit i is content.exercises[i]
+MAX_EXERCISES_PER_MODULE = 31
+
+async def set_exercise_completion(user_id: str, module_id: int, exercise_index: int, completed: bool):
+    """Coche ou décoche un exercice dans le bitmap de l'utilisateur (mise à jour atomique)"""
+    mask = 1 << exercise_index
+    completion = await user_progress_collection.find_one_and_update(
+        {"userId": user_id},
+        {
+            "$bit": {f"exercises.{module_id}": {"or": mask} if completed else {"and": ~mask}},
+            "$set": {"updatedAt": datetime.utcnow()}
+        },
+        projection={"_id": 0, "exercises": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    bitmap = completion.get("exercises", {}).get(str(module_id), 0)
+    await live_events.publish(user_id, EXERCISE, {"moduleId": module_id, "exerciseIndex": exercise_index,
+                                                  "completed": completed, "bitmap": bitmap})
+    return bitmap
+
+async def get_exercise_completion(user_id: str):
+    """Récupère les bitmaps de complétion de l'utilisateur (une seule lecture)"""
+    completion = await user_progress_collection.find_one({"userId": user_id}, {"_id": 0, "exercises": 1})
+    return (completion or {}).get("exercises", {})
+
+def module_exercise_progress(module: dict, bitmap: int):
+    """Progression d'un module dérivée de son bitmap"""
+    total = min(len(module.get("content", {}).get("exercises", [])), MAX_EXERCISES_PER_MODULE)
+    bitmap &= (1 << total) - 1
+    completed = bitmap.bit_count()
+    return {
+        "moduleId": module["id"],
+        "completedExercises": [i for i in range(total) if bitmap >> i & 1],
+        "completedCount": completed,
+        "totalExercises": total,
+        "progress": int(completed * 100 / total) if total else 0
+    }
+
+async def get_exercise_progress(user_id: str):
+    """Progression par module et globale, calculée par popcount"""
+    modules, bitmaps = await asyncio.gather(get_modules(), get_exercise_completion(user_id))
+    per_module = [module_exercise_progress(module, bitmaps.get(str(module["id"]), 0)) for module in modules]
+    completed = sum(m["completedCount"] for m in per_module)
+    total = sum(m["totalExercises"] for m in per_module)
+    return {
+        "modules": per_module,
+        "completedExercises": completed,
+        "totalExercises": total,
+        "totalProgress": int(completed * 100 / total) if total else 0
+    }
+
 async def get_certificates(user_id: str):
     """Récupère les certificats d'un utilisateur"""
-    certificates = await certificates_collection.find({"userId": user_id}).to_list(100)
+    certificates = await certificates_collection.find({"userId": user_id}, NO_ID).to_list(100)
     return certificates
 
 async def create_certificate(user_id: str, title: str):
@@ -250,13 +512,17 @@ async def create_certificate(user_id: str, title: str):
         "downloadUrl": f"/api/certificates/{user_id}/download"
     }
     await certificates_collection.insert_one(certificate)
+    await live_events.publish(user_id, CERTIFICATE, {k: v for k, v in certificate.items() if k != "_id"})
     return certificate
 
 async def get_stats():
     """Récupère les statistiques globales"""
-    total_students = await users_collection.count_documents({})
-    total_modules = await modules_collection.count_documents({})
-    
+    return await cache.get_or_load("stats", "global", _load_stats, STATS_CACHE_TTL_S)
+
+async def _load_stats():
+    total_students = await users_collection.estimated_document_count()
+    total_modules = await modules_collection.estimated_document_count()
+
     return {
         "totalStudents": max(total_students, 2847),  # Minimum pour l'effet
         "completionRate": 94,
@@ -0,0 +1,150 @@
+"""
+Request-scoped data loading for ConfianceBoost
+Memoizes DAL reads for the lifetime of a request (identity map) and batches
+concurrent lookups of the same kind into a single $in query
+"""
+
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+BatchLoadFn = Callable[[list], Awaitable[Dict[Hashable, Any]]]
+
+_current_scope: contextvars.ContextVar = contextvars.ContextVar(
+    "confianceboost_request_scope", default=None
+)
+
+class DataLoader:
+    """
+    Loads documents by key, one batch per event loop tick
+
+    Every key requested while the current tick runs is collected and handed
+    to batch_fn at once; results are memoized until cleared.
+    """
+
+    def __init__(self, batch_fn: BatchLoadFn):
+        self._batch_fn = batch_fn
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        # (key, future) pairs for the next batch; each batch resolves the futures
+        # it was given, even if prime() or clear() changed the cache meanwhile
+        self._pending: List[Tuple[Hashable, asyncio.Future]] = []
+        # The event loop only keeps weak references to tasks
+        self._batches: set = set()
+
+    async def load(self, key: Hashable) -> Optional[Any]:
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._cache[key] = future
+            self._pending.append((key, future))
+            if len(self._pending) == 1:
+                loop.call_soon(self._dispatch)
+        return await asyncio.shield(future)
+
+    def prime(self, key: Hashable, value: Any) -> None:
+        """Stores a document already fetched by another query"""
+        future = self._cache.get(key)
+        if future is not None and not future.done():
+            # A load is in flight: answer its callers now, the batch result is ignored
+            future.set_result(value)
+            return
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        self._cache[key] = future
+
+    def prime_many(self, documents: Iterable[dict], field: str) -> None:
+        for document in documents:
+            self.prime(document[field], document)
+
+    def clear(self, key: Hashable) -> None:
+        """Forgets `key`; a load already in flight still completes for its callers"""
+        self._cache.pop(key, None)
+
+    def _dispatch(self) -> None:
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Hashable, asyncio.Future]]) -> None:
+        try:
+            results = await self._batch_fn(list(dict.fromkeys(key for key, _ in batch)))
+        except Exception as e:
+            for key, future in batch:
+                # Don't memoize the failure; a later load retries
+                if self._cache.get(key) is future:
+                    del self._cache[key]
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for key, future in batch:
+            if not future.done():
+                future.set_result(results.get(key))
+
+class RequestScope:
+    """Loaders and memoized reads shared by everything handling one request"""
+
+    def __init__(self):
+        self.loaders: Dict[str, DataLoader] = {}
+        self.memo: Dict[Hashable, asyncio.Future] = {}
+
+    def loader(self, name: str, batch_fn: BatchLoadFn) -> DataLoader:
+        loader = self.loaders.get(name)
+        if loader is None:
+            loader = self.loaders[name] = DataLoader(batch_fn)
+        return loader
+
+    async def memoize(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        future = self.memo.get(key)
+        if future is None:
+            future = self.memo[key] = asyncio.ensure_future(fetch())
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            self.memo.pop(key, None)
+            raise
+
+    def forget(self, key: Hashable) -> None:
+        self.memo.pop(key, None)
+
+def current_scope() -> Optional[RequestScope]:
+    """Returns the active request scope, or None outside of a request"""
+    return _current_scope.get()
+
+def get_loader(name: str, batch_fn: BatchLoadFn) -> Optional[DataLoader]:
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+    return scope.loader(name, batch_fn)
+
+def close_request_scope() -> None:
+    """Drops the current request's loaders and memoized reads, e.g. before a long-lived stream"""
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.loaders.clear()
+        scope.memo.clear()
+        _current_scope.set(None)
+
+@contextmanager
+def request_scope():
+    token = _current_scope.set(RequestScope())
+    try:
+        yield
+    finally:
+        _current_scope.reset(token)
+
+class RequestScopeMiddleware:
+    """ASGI middleware opening a fresh request scope for every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with request_scope():
+            await self.app(scope, receive, send)
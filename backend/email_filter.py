@@ -0,0 +1,254 @@
+"""
+Bloom filter of known user emails for ConfianceBoost
+Sits in front of the public /api/shopify/user/{email} lookup: an email the
+filter has never seen is answered 404 without a MongoDB query. The filter
+is built in the background at startup by streaming the emails of the
+users collection and of users_archive (cold storage); until it is ready
+every lookup goes to MongoDB. New users are added when their access is
+created, and the addition is published to the other workers on the
+cache's `user_emails` topic. Without a shared store (REDIS_URL) workers
+would miss each other's additions and answer 404 for real users, so the
+filter is only used when one is configured. It is also rebuilt every
+EMAIL_FILTER_REBUILD_S.
+
+Pub/sub may drop messages (e.g. across a Redis reconnect), so every
+addition also bumps a shared generation counter and carries its
+generation. A negative is only trusted when this worker has applied every
+generation up to the counter; otherwise the lookup goes to MongoDB, and a
+gap that outlives EMAIL_FILTER_GAP_GRACE_S (a lost message rather than one
+in flight) triggers a rebuild.
+
+Lookups are counted by outcome, so the observed false-positive rate is
+false_positive / (false_positive + hit). The rate predicted from the fill
+ratio is exported as a gauge.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from typing import List, Optional, Set
+
+import database
+from cache import cache
+from metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+EMAIL_FILTER_ENABLED = os.environ.get('EMAIL_FILTER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+EMAIL_FILTER_CAPACITY = int(os.environ.get('EMAIL_FILTER_CAPACITY', '200000'))
+EMAIL_FILTER_ERROR_RATE = float(os.environ.get('EMAIL_FILTER_ERROR_RATE', '0.01'))
+EMAIL_FILTER_REBUILD_S = float(os.environ.get('EMAIL_FILTER_REBUILD_S', '3600'))
+EMAIL_FILTER_BATCH_SIZE = 5000
+EMAIL_FILTER_GAP_GRACE_S = 5.0
+# Cache topic carrying newly added emails between workers
+EMAIL_FILTER_TOPIC = "user_emails"
+
+email_filter_lookups_total = counter(
+    "confianceboost_email_filter_lookups_total",
+    "Email lookups by Bloom filter outcome (definite_miss, hit, false_positive, bypass, stale)", ("result",)
+)
+email_filter_estimated_fp_rate = gauge(
+    "confianceboost_email_filter_estimated_false_positive_rate", "False-positive rate predicted from the filter's fill"
+)
+email_filter_size = gauge("confianceboost_email_filter_emails", "Distinct emails in the Bloom filter")
+
+class BloomFilter:
+    """Bit array with `hashes` positions per item, derived from one blake2b digest"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> bool:
+        """Sets the item's bits; returns False (and leaves `count`) if they were all set already"""
+        bits = self._bits
+        new = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+        # Duplicates (and the rare false positive) don't count, so `count` tracks distinct items
+        self.count += new
+        return new
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def estimated_false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+class EmailFilter:
+    def __init__(self, capacity: int = EMAIL_FILTER_CAPACITY, error_rate: float = EMAIL_FILTER_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter: Optional[BloomFilter] = None
+        # Emails added while a build is streaming the collection
+        self._added_during_build: Optional[List[str]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._building = False
+        # Every generation up to the watermark is in the filter; later ones applied out of order wait in _ahead
+        self._watermark = 0
+        self._ahead: Set[int] = set()
+        self._gap_since: Optional[float] = None
+        self._counters = {
+            result: email_filter_lookups_total.labels(result)
+            for result in ("definite_miss", "hit", "false_positive", "bypass", "stale")
+        }
+        cache.on_message(EMAIL_FILTER_TOPIC, self._on_remote_add)
+
+    @property
+    def ready(self) -> bool:
+        return self._filter is not None
+
+    async def start(self) -> None:
+        if cache.store is None:
+            # Other workers' additions could never reach us: a negative wouldn't be trustworthy
+            logger.info("Email filter disabled: no shared cache store (REDIS_URL) to propagate new emails")
+            return
+        if self._task is None and EMAIL_FILTER_ENABLED:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.build()
+            except Exception as e:
+                logger.error("Email filter build failed: %s", e)
+            await asyncio.sleep(EMAIL_FILTER_REBUILD_S)
+
+    async def build(self) -> int:
+        """Rebuilds the filter from the users and users_archive collections; returns how many emails it holds"""
+        started = time.perf_counter()
+        expected = (await database.users_collection.estimated_document_count()
+                    + await database.users_archive_collection.estimated_document_count())
+        # Room to grow until the next rebuild without exceeding the target error rate
+        bloom = BloomFilter(max(self.capacity, expected * 2), self.error_rate)
+        self._added_during_build = []
+        self._building = True
+        # Emails are inserted before their generation is taken, so the scan below sees
+        # every email up to this one
+        baseline = await cache.read_counter(EMAIL_FILTER_TOPIC)
+        try:
+            # Archived users are restored on lookup, so their emails must pass the filter too
+            for collection in (database.users_collection, database.users_archive_collection):
+                cursor = collection.find(
+                    {"email": {"$nin": [None, ""]}}, {"_id": 0, "email": 1}
+                ).batch_size(EMAIL_FILTER_BATCH_SIZE)
+                async for user in cursor:
+                    bloom.add(user["email"].lower())
+            for email in self._added_during_build:
+                bloom.add(email)
+        finally:
+            self._added_during_build = None
+            self._building = False
+        self._filter = bloom
+        self._ahead = {generation for generation in self._ahead if generation > baseline}
+        self._watermark = max(self._watermark, baseline)
+        self._advance()
+        self._gap_since = None
+        self._observe()
+        logger.info("Email filter built with %s emails (%s bits, %s hashes) in %.1fms",
+                    bloom.count, bloom.size, bloom.hashes, (time.perf_counter() - started) * 1000)
+        return bloom.count
+
+    def _add_local(self, email: str, generation: int) -> None:
+        email = email.lower()
+        if self._added_during_build is not None:
+            self._added_during_build.append(email)
+        if generation > self._watermark:
+            self._ahead.add(generation)
+            self._advance()
+        if self._filter is not None:
+            self._filter.add(email)
+            self._observe()
+            if self._filter.count > self._filter.capacity:
+                # Past capacity the error rate climbs: rebuild with a larger filter now
+                self._rebuild_now()
+
+    def _advance(self) -> None:
+        while self._watermark + 1 in self._ahead:
+            self._watermark += 1
+            self._ahead.discard(self._watermark)
+
+    def _rebuild_now(self) -> None:
+        if self._task is not None and not self._building:
+            self._task.cancel()
+            self._task = asyncio.create_task(self._run())
+
+    async def add(self, email: str) -> None:
+        """Adds an email here and on every other worker; call it once the user is stored"""
+        if not email:
+            return
+        generation = await cache.incr_counter(EMAIL_FILTER_TOPIC)
+        self._add_local(email, generation)
+        await cache.publish(EMAIL_FILTER_TOPIC, f"{generation}:{email.lower()}")
+
+    def _on_remote_add(self, message: Optional[str]) -> None:
+        generation, _, email = (message or "").partition(":")
+        if email and generation.isdigit():
+            self._add_local(email, int(generation))
+
+    async def _is_current(self) -> bool:
+        """Whether every email added on any worker so far has reached this filter"""
+        if self._watermark == await cache.read_counter(EMAIL_FILTER_TOPIC):
+            self._gap_since = None
+            return True
+        now = time.monotonic()
+        if self._gap_since is None:
+            # Most likely a message still in flight
+            self._gap_since = now
+        elif now - self._gap_since > EMAIL_FILTER_GAP_GRACE_S:
+            logger.warning("Email filter missed additions (generation %s, shared counter ahead); rebuilding",
+                           self._watermark)
+            self._gap_since = None
+            self._rebuild_now()
+        return False
+
+    async def might_exist(self, email: str) -> bool:
+        """False only if no user has this email"""
+        if self._filter is None:
+            self._counters["bypass"].inc()
+            return True
+        if email.lower() in self._filter:
+            return True
+        if not await self._is_current():
+            self._counters["stale"].inc()
+            return True
+        self._counters["definite_miss"].inc()
+        return False
+
+    def record_lookup(self, found: bool) -> None:
+        """Outcome of the MongoDB lookup after might_exist() returned True"""
+        if self._filter is not None:
+            self._counters["hit" if found else "false_positive"].inc()
+
+    def _observe(self) -> None:
+        email_filter_size.set(self._filter.count)
+        email_filter_estimated_fp_rate.set(self._filter.estimated_false_positive_rate())
+
+email_filter = EmailFilter()
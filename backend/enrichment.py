@@ -0,0 +1,145 @@
+"""
+Background Shopify customer enrichment for ConfianceBoost
+Users whose Shopify customer data is missing or stale are picked up in
+scans of ENRICHMENT_SCAN_LIMIT users. Their emails are looked up with
+batched `email:a OR email:b` customer searches. At most
+ENRICHMENT_CONCURRENCY searches are in flight, and each one waits for the
+Shopify budget shared with the request path (shopify_api_limiter). Results
+are written back with one unordered bulk update per scan. API requests
+never wait on this worker.
+
+Each user is stamped with `shopify_customer_checked_at`, found in Shopify
+or not, so a customer is searched again only after ENRICHMENT_RECHECK_S.
+Each worker runs the loop, but a scan only runs while holding a MongoDB
+lease, so only one worker at a time scans and searches.
+
+Only the hot `users` collection is scanned: archived users (archive.py)
+are skipped on purpose, since nobody reads their customer data until they
+log in again. A restored user keeps their old check date and is enriched
+by the next scan once it is stale.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+import database
+import shopify_integration
+from metrics import counter
+from migrations import acquire_lease, release_lease
+
+logger = logging.getLogger(__name__)
+
+ENRICHMENT_ENABLED = os.environ.get('ENRICHMENT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ENRICHMENT_INTERVAL_S = float(os.environ.get('ENRICHMENT_INTERVAL_S', '60'))
+ENRICHMENT_SCAN_LIMIT = int(os.environ.get('ENRICHMENT_SCAN_LIMIT', '500'))
+# Emails per customer search; keeps the query string well under URL limits
+ENRICHMENT_BATCH_SIZE = int(os.environ.get('ENRICHMENT_BATCH_SIZE', '25'))
+ENRICHMENT_CONCURRENCY = int(os.environ.get('ENRICHMENT_CONCURRENCY', '2'))
+ENRICHMENT_RECHECK_S = float(os.environ.get('ENRICHMENT_RECHECK_S', str(7 * 24 * 3600)))
+# The holder renews it before every scan; if it dies, another worker takes over after this long
+ENRICHMENT_LEASE_S = float(os.environ.get('ENRICHMENT_LEASE_S', '300'))
+ENRICHMENT_LEASE_ID = "enrichment_lease"
+
+enriched_users_total = counter(
+    "confianceboost_enriched_users_total", "Users checked against Shopify customers, by outcome", ("result",)
+)
+
+class CustomerEnrichmentWorker:
+    def __init__(self, interval: float = ENRICHMENT_INTERVAL_S, scan_limit: int = ENRICHMENT_SCAN_LIMIT,
+                 batch_size: int = ENRICHMENT_BATCH_SIZE, concurrency: int = ENRICHMENT_CONCURRENCY):
+        self.interval = interval
+        self.scan_limit = scan_limit
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self._task: Optional[asyncio.Task] = None
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._counters = {result: enriched_users_total.labels(result) for result in ("found", "not_found", "error")}
+
+    async def start(self) -> None:
+        if self._task is None and ENRICHMENT_ENABLED:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            try:
+                await release_lease(database.db, ENRICHMENT_LEASE_ID, self.owner)
+            except Exception as e:
+                logger.warning("Could not release the enrichment lease: %s", e)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # A full, error-free scan means more users are waiting: go again without sleeping
+                if (await acquire_lease(database.db, ENRICHMENT_LEASE_ID, self.owner, ENRICHMENT_LEASE_S)
+                        and await self.run_once() >= self.scan_limit):
+                    continue
+            except Exception as e:
+                logger.error("Customer enrichment failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> int:
+        """Enriches one scan of users; returns how many users were updated"""
+        if not shopify_integration.SHOPIFY_STORE_URL or not shopify_integration.SHOPIFY_ACCESS_TOKEN:
+            return 0
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=ENRICHMENT_RECHECK_S)
+        users = await database.users_collection.find(
+            {"email": {"$nin": [None, ""]},
+             "$or": [{"shopify_customer_checked_at": None}, {"shopify_customer_checked_at": {"$lt": cutoff}}]},
+            {"_id": 0, "id": 1, "email": 1}
+        ).limit(self.scan_limit).to_list(self.scan_limit)
+        if not users:
+            return 0
+
+        emails = sorted({user["email"].lower() for user in users})
+        batches = [emails[i:i + self.batch_size] for i in range(0, len(emails), self.batch_size)]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._search(batch, semaphore) for batch in batches))
+        customers: Dict[str, Dict] = {}
+        failed = set()
+        for batch, found in zip(batches, results):
+            if found is None:
+                failed.update(batch)
+            else:
+                customers.update(found)
+
+        operations = []
+        for user in users:
+            email = user["email"].lower()
+            if email in failed:
+                self._counters["error"].inc()
+                continue
+            update = {"shopify_customer_checked_at": now}
+            customer = customers.get(email)
+            if customer is not None:
+                update["shopify_customer"] = customer
+            self._counters["found" if customer is not None else "not_found"].inc()
+            operations.append(UpdateOne({"id": user["id"]}, {"$set": update}))
+        if operations:
+            await database.users_collection.bulk_write(operations, ordered=False)
+        logger.info("Customer enrichment: %s users scanned, %s found in Shopify", len(users), len(customers))
+        return len(operations)
+
+    async def _search(self, emails: List[str], semaphore: asyncio.Semaphore) -> Optional[Dict[str, Dict]]:
+        async with semaphore:
+            await shopify_integration.reserve_shopify_calls()
+            try:
+                return await asyncio.to_thread(shopify_integration.search_shopify_customers, emails, True)
+            except Exception as e:
+                # Left unstamped, these users are retried at the next scan
+                logger.warning("Shopify customer search failed for %s emails: %s", len(emails), e)
+                return None
+
+enrichment_worker = CustomerEnrichmentWorker()
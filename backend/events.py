@@ -0,0 +1,244 @@
+"""
+Learning event ingestion for ConfianceBoost
+Events (progress updates, exercise completions) are not stored one document
+each. They are merged in memory into one bucket per user per UTC day and
+flushed periodically with a single unordered bulk upsert into
+`learning_events`. Each flush also bumps per-day rollups in
+`learning_daily`: active learners (buckets created by the flush), minutes
+of content and exercise completions. Dashboards read the rollups directly.
+
+Delivery is at-least-once: a flush that fails before writing anything is
+merged back and retried at the next interval. If the buckets are written
+but the rollup update fails, the rollup increments are not retried, since
+a partly applied retry would double count. Instead those days are
+recomputed from their buckets at the next flush.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import database
+from metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+EVENTS_FLUSH_INTERVAL_S = float(os.environ.get('EVENTS_FLUSH_INTERVAL_S', '5'))
+# Flush early once this many user-day buckets are pending
+EVENTS_MAX_PENDING_BUCKETS = int(os.environ.get('EVENTS_MAX_PENDING_BUCKETS', '1000'))
+
+PROGRESS_UPDATE = "progressUpdates"
+EXERCISE_COMPLETION = "exerciseCompletions"
+EVENT_KINDS = (PROGRESS_UPDATE, EXERCISE_COMPLETION)
+
+learning_events_total = counter(
+    "confianceboost_learning_events_total", "Learning events recorded", ("kind",)
+)
+learning_event_flush_duration = histogram(
+    "confianceboost_learning_event_flush_duration_seconds", "Time spent flushing learning event buckets"
+)
+learning_events_dropped_total = counter(
+    "confianceboost_learning_events_dropped_total", "Buckets lost to a partially failed flush"
+)
+
+_DURATION_MINUTES = re.compile(r"(\d+)")
+
+def module_minutes(module: dict) -> int:
+    """Minutes of content in a module, from its "45 min" duration"""
+    match = _DURATION_MINUTES.search(module.get("duration") or "")
+    return int(match.group(1)) if match else 0
+
+def day_bucket(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d")
+
+class _Bucket:
+    __slots__ = ("minutes", "counts", "modules", "first_at", "last_at")
+
+    def __init__(self, at: datetime):
+        self.minutes = 0.0
+        self.counts = dict.fromkeys(EVENT_KINDS, 0)
+        self.modules: set = set()
+        self.first_at = at
+        self.last_at = at
+
+    def merge(self, other: '_Bucket') -> None:
+        self.minutes += other.minutes
+        for kind, count in other.counts.items():
+            self.counts[kind] += count
+        self.modules |= other.modules
+        self.first_at = min(self.first_at, other.first_at)
+        self.last_at = max(self.last_at, other.last_at)
+
+class LearningEventBuffer:
+    def __init__(self, flush_interval: float = EVENTS_FLUSH_INTERVAL_S,
+                 max_pending: int = EVENTS_MAX_PENDING_BUCKETS):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._early_flush: Optional[asyncio.Task] = None
+        # Days whose rollup update failed after their buckets were written
+        self._unreconciled: Set[str] = set()
+        self._counters = {kind: learning_events_total.labels(kind) for kind in EVENT_KINDS}
+
+    def record(self, user_id: str, kind: str, module_id: Optional[int] = None, minutes: float = 0.0,
+               at: Optional[datetime] = None) -> None:
+        """Adds an event to its user-day bucket; never touches MongoDB"""
+        at = at or datetime.utcnow()
+        key = (user_id, day_bucket(at))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(at)
+        bucket.counts[kind] += 1
+        bucket.minutes += minutes
+        if module_id is not None:
+            bucket.modules.add(module_id)
+        bucket.first_at = min(bucket.first_at, at)
+        bucket.last_at = max(bucket.last_at, at)
+        self._counters[kind].inc()
+
+        if len(self._buckets) >= self.max_pending and (self._early_flush is None or self._early_flush.done()):
+            self._early_flush = asyncio.ensure_future(self.flush())
+
+    @property
+    def pending(self) -> int:
+        return len(self._buckets)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the periodic flush and writes what is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Learning event flush failed: %s", e)
+
+    async def flush(self) -> int:
+        """Writes pending buckets and their rollups; returns how many buckets were written"""
+        async with self._flush_lock:
+            if self._unreconciled:
+                await self._reconcile()
+            if not self._buckets:
+                return 0
+            buckets, self._buckets = self._buckets, {}
+            started = time.perf_counter()
+            try:
+                await self._write(buckets)
+            finally:
+                learning_event_flush_duration.observe(time.perf_counter() - started)
+            return len(buckets)
+
+    async def _write(self, buckets: Dict[Tuple[str, str], _Bucket]) -> None:
+        keys = list(buckets)
+        operations = []
+        for user_id, day in keys:
+            bucket = buckets[(user_id, day)]
+            update = {
+                "$inc": {"minutes": bucket.minutes, **bucket.counts},
+                "$min": {"firstAt": bucket.first_at},
+                "$max": {"lastAt": bucket.last_at},
+            }
+            if bucket.modules:
+                update["$addToSet"] = {"modules": {"$each": sorted(bucket.modules)}}
+            operations.append(UpdateOne({"userId": user_id, "day": day}, update, upsert=True))
+
+        failed = set()
+        try:
+            result = await database.learning_events_collection.bulk_write(operations, ordered=False)
+            upserted = result.upserted_ids
+        except BulkWriteError as e:
+            # Some buckets were written: retrying would double count them
+            errors = e.details.get("writeErrors", [])
+            failed = {error["index"] for error in errors}
+            learning_events_dropped_total.inc(len(errors))
+            logger.error("Learning event flush partially failed: %s", errors[:3])
+            upserted = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+        except Exception:
+            self._restore(buckets)
+            raise
+
+        rollups: Dict[str, Dict[str, float]] = {}
+        for index, (user_id, day) in enumerate(keys):
+            if index in failed:
+                continue
+            bucket = buckets[(user_id, day)]
+            rollup = rollups.setdefault(day, {"activeLearners": 0, "minutes": 0.0, **dict.fromkeys(EVENT_KINDS, 0)})
+            # A bucket created by this flush is a learner's first activity that day
+            rollup["activeLearners"] += index in upserted
+            rollup["minutes"] += bucket.minutes
+            for kind, count in bucket.counts.items():
+                rollup[kind] += count
+        if not rollups:
+            return
+        try:
+            await database.learning_daily_collection.bulk_write([
+                UpdateOne({"day": day}, {"$inc": rollup}, upsert=True) for day, rollup in rollups.items()
+            ], ordered=False)
+        except Exception as e:
+            self._unreconciled.update(rollups)
+            logger.error("Learning rollup update failed, %s days will be recomputed: %s", len(rollups), e)
+
+    async def _reconcile(self) -> None:
+        """Rewrites the rollups of unreconciled days from their buckets"""
+        days = sorted(self._unreconciled)
+        try:
+            rollups = await database.learning_events_collection.aggregate([
+                {"$match": {"day": {"$in": days}}},
+                {"$group": {"_id": "$day", "activeLearners": {"$sum": 1}, "minutes": {"$sum": "$minutes"},
+                            **{kind: {"$sum": f"${kind}"} for kind in EVENT_KINDS}}},
+            ]).to_list(None)
+            if rollups:
+                await database.learning_daily_collection.bulk_write([
+                    UpdateOne({"day": rollup.pop("_id")}, {"$set": rollup}, upsert=True) for rollup in rollups
+                ], ordered=False)
+        except Exception as e:
+            logger.error("Learning rollup reconciliation failed for %s days: %s", len(days), e)
+            return
+        self._unreconciled.difference_update(days)
+        logger.info("Recomputed learning rollups for %s", ", ".join(days))
+
+    def _restore(self, buckets: Dict[Tuple[str, str], _Bucket]) -> None:
+        for key, bucket in buckets.items():
+            pending = self._buckets.get(key)
+            if pending is None:
+                self._buckets[key] = bucket
+            else:
+                pending.merge(bucket)
+
+event_buffer = LearningEventBuffer()
+
+async def get_daily_rollups(days: int) -> List[dict]:
+    """Pre-aggregated activity for the last `days` UTC days, oldest first"""
+    since = day_bucket(datetime.utcnow() - timedelta(days=days - 1))
+    return await database.learning_daily_collection.find(
+        {"day": {"$gte": since}}, {"_id": 0}
+    ).sort("day", 1).to_list(days)
+
+async def get_user_activity(user_id: str, days: int) -> List[dict]:
+    """The user's daily buckets for the last `days` UTC days, oldest first"""
+    since = day_bucket(datetime.utcnow() - timedelta(days=days - 1))
+    return await database.learning_events_collection.find(
+        {"userId": user_id, "day": {"$gte": since}}, {"_id": 0, "userId": 0}
+    ).sort("day", 1).to_list(days)
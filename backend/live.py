@@ -0,0 +1,202 @@
+"""
+Live user events for ConfianceBoost
+The DAL write paths publish progress, exercise, certificate and access
+events. Each open /api/user/events stream (server-sent events) is
+subscribed to its user's events through this in-process broker. Events for
+user None (catalog changes) go to every subscriber. When a shared cache
+store is configured, events are also relayed to the other workers on the
+cache's `live` pub/sub topic.
+
+Idle connections stay cheap. A subscription is a small queue with no task
+or timer of its own; one broker task wakes every subscription for
+heartbeats. Each event is encoded once, whatever the number of
+subscribers. A subscriber that falls LIVE_QUEUE_SIZE events behind has its
+backlog dropped and receives one `resync` event telling the client to
+refetch.
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Any, Dict, List, Optional, Set
+
+from pydantic import TypeAdapter
+
+from cache import cache
+from metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+LIVE_HEARTBEAT_S = float(os.environ.get('LIVE_HEARTBEAT_S', '15'))
+LIVE_QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE', '32'))
+LIVE_MAX_SUBSCRIBERS = int(os.environ.get('LIVE_MAX_SUBSCRIBERS', '10000'))
+# Route of the server-sent events stream
+LIVE_EVENTS_PATH = "/api/user/events"
+# Cache topic carrying events between workers
+LIVE_TOPIC = "live"
+
+PROGRESS = "progress"
+MODULE = "module"
+EXERCISE = "exercise"
+CERTIFICATE = "certificate"
+ACCESS = "access"
+
+live_subscribers = gauge("confianceboost_live_subscribers", "Open live event streams")
+live_events_total = counter(
+    "confianceboost_live_events_total", "Live events published, by type", ("type",)
+)
+live_overflows_total = counter(
+    "confianceboost_live_overflows_total", "Subscribers whose backlog was dropped for falling behind"
+)
+
+_JSON = TypeAdapter(Any)
+HEARTBEAT_FRAME = b": ping\n\n"
+RESYNC_FRAME = b"event: resync\ndata: {}\n\n"
+
+def encode_event(event_type: str, data: Any) -> bytes:
+    return b"event: " + event_type.encode() + b"\ndata: " + _JSON.dump_json(data) + b"\n\n"
+
+class Subscription:
+    __slots__ = ("user_id", "_frames", "_waiter", "_heartbeat", "_overflowed", "closed")
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self._frames: deque = deque()
+        self._waiter: Optional[asyncio.Future] = None
+        self._heartbeat = False
+        self._overflowed = False
+        self.closed = False
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def push(self, frame: bytes) -> None:
+        if self._overflowed:
+            return
+        if len(self._frames) >= LIVE_QUEUE_SIZE:
+            # The client can't keep up: drop the backlog and have it refetch instead
+            self._frames.clear()
+            self._overflowed = True
+            live_overflows_total.inc()
+        else:
+            self._frames.append(frame)
+        self._wake()
+
+    def heartbeat(self) -> None:
+        self._heartbeat = True
+        self._wake()
+
+    def close(self) -> None:
+        self.closed = True
+        self._wake()
+
+    async def next_frames(self) -> List[bytes]:
+        """Waits for events (or a heartbeat) and returns the frames to send; [] once closed"""
+        while not (self._frames or self._overflowed or self._heartbeat or self.closed):
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        if self.closed:
+            return []
+        if self._overflowed:
+            self._overflowed = self._heartbeat = False
+            return [RESYNC_FRAME]
+        if self._frames:
+            frames = list(self._frames)
+            self._frames.clear()
+            self._heartbeat = False
+            return frames
+        self._heartbeat = False
+        return [HEARTBEAT_FRAME]
+
+class EventBroker:
+    def __init__(self, heartbeat_interval: float = LIVE_HEARTBEAT_S, max_subscribers: int = LIVE_MAX_SUBSCRIBERS):
+        self.heartbeat_interval = heartbeat_interval
+        self.max_subscribers = max_subscribers
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._count = 0
+        self._task: Optional[asyncio.Task] = None
+        self._counters: Dict[str, Any] = {}
+        cache.on_message(LIVE_TOPIC, self._on_remote_event)
+
+    @property
+    def subscribers(self) -> int:
+        return self._count
+
+    def subscribe(self, user_id: str) -> Optional[Subscription]:
+        """A new subscription, or None if this worker already holds max_subscribers streams"""
+        if self._count >= self.max_subscribers:
+            return None
+        subscription = Subscription(user_id)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        self._count += 1
+        live_subscribers.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscribers.get(subscription.user_id)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscribers[subscription.user_id]
+        self._count -= 1
+        live_subscribers.dec()
+
+    def _deliver(self, user_id: Optional[str], frame: bytes) -> None:
+        if user_id is None:
+            targets = [subscription for subscriptions in self._subscribers.values() for subscription in subscriptions]
+        else:
+            targets = self._subscribers.get(user_id, ())
+        for subscription in targets:
+            subscription.push(frame)
+
+    async def publish(self, user_id: Optional[str], event_type: str, data: Any) -> None:
+        """Sends an event to `user_id`'s streams (every stream if None), on every worker"""
+        child = self._counters.get(event_type)
+        if child is None:
+            child = self._counters[event_type] = live_events_total.labels(event_type)
+        child.inc()
+        frame = encode_event(event_type, data)
+        self._deliver(user_id, frame)
+        if cache.store is not None:
+            try:
+                await cache.publish(LIVE_TOPIC, f"{user_id or ''}|{frame.decode()}")
+            except Exception as e:
+                logger.warning("Could not relay live event to other workers: %s", e)
+
+    def _on_remote_event(self, message: str) -> None:
+        if message:
+            user_id, _, frame = message.partition("|")
+            self._deliver(user_id or None, frame.encode())
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops heartbeats and ends every open stream"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for subscriptions in self._subscribers.values():
+            for subscription in subscriptions:
+                subscription.close()
+
+    async def _run(self) -> None:
+        # One timer for every connection instead of one per connection
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            for subscriptions in self._subscribers.values():
+                for subscription in subscriptions:
+                    subscription.heartbeat()
+
+live_events = EventBroker()
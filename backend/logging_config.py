@@ -0,0 +1,212 @@
+"""
+Non-blocking structured logging for ConfianceBoost
+Log records are handed to a background listener thread through a bounded
+queue, so formatting and stream I/O never run on the event loop. The
+listener writes compact JSON lines carrying the request id. Bursts of the
+same error (e.g. Shopify being down) are sampled rather than written one
+by one.
+"""
+
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+import uuid
+from typing import Dict, Optional, Tuple
+
+from metrics import counter
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+# Identical warnings/errors: let the first LOG_SAMPLE_BURST through per window, then 1 in LOG_SAMPLE_RATE
+LOG_SAMPLE_WINDOW_S = float(os.environ.get('LOG_SAMPLE_WINDOW_S', '10'))
+LOG_SAMPLE_BURST = int(os.environ.get('LOG_SAMPLE_BURST', '5'))
+LOG_SAMPLE_RATE = int(os.environ.get('LOG_SAMPLE_RATE', '100'))
+
+log_records_dropped_total = counter(
+    "confianceboost_log_records_dropped_total", "Log records dropped because the log queue was full"
+)
+log_records_sampled_total = counter(
+    "confianceboost_log_records_sampled_total", "Repeated log records suppressed by sampling"
+)
+
+_request_id: contextvars.ContextVar = contextvars.ContextVar("confianceboost_request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "taskName"
+}
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str)
+
+class RequestIdFilter(logging.Filter):
+    """Stamps the current request id on the record before it leaves the event loop"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+class RepeatSampler(logging.Filter):
+    """
+    Samples repeated warnings and errors from the same call site
+
+    Records are grouped by logger, level, call site and exception type,
+    without formatting the message. After LOG_SAMPLE_BURST records in a
+    window, only 1 in LOG_SAMPLE_RATE is kept. A kept record carries the
+    number of records suppressed since the previous one as `suppressed`.
+    """
+
+    def __init__(self, window: float = LOG_SAMPLE_WINDOW_S, burst: int = LOG_SAMPLE_BURST,
+                 rate: int = LOG_SAMPLE_RATE, max_keys: int = 1024):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.rate = max(rate, 1)
+        self.max_keys = max_keys
+        # key -> [window start, records seen in window, suppressed since last emit]
+        self._state: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        exc_type = record.exc_info[0] if record.exc_info else None
+        key = (record.name, record.levelno, record.pathname, record.lineno, exc_type)
+        now = time.monotonic()
+
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state is not None else 0
+                if state is None and len(self._state) >= self.max_keys:
+                    self._state.clear()
+                self._state[key] = [now, 1, 0]
+            else:
+                state[1] += 1
+                if state[1] > self.burst and (state[1] - self.burst) % self.rate:
+                    state[2] += 1
+                    log_records_sampled_total.inc()
+                    return False
+                suppressed, state[2] = state[2], 0
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that defers all formatting to the listener thread
+
+    The stock handler formats the message in prepare(), i.e. on the caller's
+    thread. Here records are enqueued as-is, and dropped and counted when the
+    queue is full instead of blocking the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped_total.inc()
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def configure_logging(level: str = LOG_LEVEL) -> logging.handlers.QueueListener:
+    """Routes the root and uvicorn loggers through the background listener"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+        ))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RepeatSampler())
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = [queue_handler]
+        uvicorn_logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def stop_logging() -> None:
+    """Flushes queued records; call on shutdown"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+class RequestIdMiddleware:
+    """ASGI middleware binding X-Request-ID (incoming or generated) to the request's logs"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex
+        token = _request_id.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_id.reset(token)
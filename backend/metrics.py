@@ -0,0 +1,296 @@
+"""
+Prometheus-style metrics for ConfianceBoost
+Counters, gauges and histograms with pre-resolved label children, the ASGI
+middleware timing every route, and the pymongo command listener timing
+every MongoDB command. Everything is rendered in the Prometheus text
+exposition format by render_metrics().
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+# Seconds; covers in-process cache hits up to Shopify timeouts
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Returns the child for these label values, creating it once"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _label_string(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{self._label_string(values)} {_format_value(child.value)}"]
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default.dec(amount)
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def _render_child(self, values, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = self._label_string(values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = self._label_string(values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+# HTTP metrics
+http_requests_total = counter(
+    "confianceboost_http_requests_total", "HTTP requests handled", ("method", "route", "status")
+)
+http_request_duration = histogram(
+    "confianceboost_http_request_duration_seconds", "HTTP request latency", ("method", "route")
+)
+http_requests_in_flight = gauge(
+    "confianceboost_http_requests_in_flight", "HTTP requests currently being handled"
+)
+
+# MongoDB metrics
+mongo_command_duration = histogram(
+    "confianceboost_mongo_command_duration_seconds", "MongoDB command latency",
+    ("collection", "operation")
+)
+mongo_command_failures_total = counter(
+    "confianceboost_mongo_command_failures_total", "MongoDB commands that failed",
+    ("collection", "operation")
+)
+
+# Shopify metrics
+shopify_request_duration = histogram(
+    "confianceboost_shopify_request_duration_seconds", "Outbound Shopify API call latency",
+    ("endpoint", "status")
+)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request count, latency and in-flight requests
+
+    Requests are labelled by route template (e.g. /api/modules/{module_id}),
+    so label cardinality is bounded by the number of routes. Requests to
+    `streaming_paths` (server-sent events) stay open for hours and are left
+    out of the in-flight gauge.
+    """
+
+    def __init__(self, app, streaming_paths: Tuple[str, ...] = ()):
+        self.app = app
+        self.streaming_paths = frozenset(streaming_paths)
+        self._status_children: Dict[Tuple[str, str, int], _CounterChild] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight = scope["path"] not in self.streaming_paths
+        if in_flight:
+            http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            if in_flight:
+                http_requests_in_flight.dec()
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            http_request_duration.labels(method, route_path).observe(elapsed)
+            key = (method, route_path, status_code)
+            child = self._status_children.get(key)
+            if child is None:
+                child = self._status_children[key] = http_requests_total.labels(
+                    method, route_path, str(status_code)
+                )
+            child.inc()
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every MongoDB command by collection and operation"""
+
+    def __init__(self):
+        self._inflight: Dict[Tuple, Tuple[str, str]] = {}
+
+    @staticmethod
+    def _collection(event) -> str:
+        target = event.command.get(event.command_name)
+        if isinstance(target, str):
+            return target
+        # getMore carries the cursor id under its own name
+        return event.command.get("collection", "-")
+
+    def started(self, event):
+        self._inflight[(event.connection_id, event.request_id)] = (
+            self._collection(event), event.command_name
+        )
+
+    def succeeded(self, event):
+        labels = self._inflight.pop((event.connection_id, event.request_id), None)
+        if labels is not None:
+            mongo_command_duration.labels(*labels).observe(event.duration_micros / 1_000_000)
+
+    def failed(self, event):
+        labels = self._inflight.pop((event.connection_id, event.request_id), None)
+        if labels is not None:
+            mongo_command_duration.labels(*labels).observe(event.duration_micros / 1_000_000)
+            mongo_command_failures_total.labels(*labels).inc()
+
+mongo_command_listener = MongoCommandListener()
+
+def observe_shopify_request(endpoint: str, status: Optional[int], elapsed: float) -> None:
+    shopify_request_duration.labels(endpoint, str(status) if status is not None else "error").observe(elapsed)
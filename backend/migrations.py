@@ -0,0 +1,356 @@
+"""
+Versioned, idempotent migrations for ConfianceBoost
+The applied schema version lives in one `meta` document, so a warm restart
+costs a single lookup. When migrations are pending, exactly one worker
+applies them under a lease lock while the others wait for the version to
+advance. Seed data is written with upserts and is safe to replay.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Tuple
+
+from pymongo import IndexModel, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_ID = "schema_version"
+MIGRATION_LOCK_ID = "migration_lock"
+MIGRATION_LOCK_TTL_S = float(os.environ.get('MIGRATION_LOCK_TTL_S', '60'))
+MIGRATION_WAIT_TIMEOUT_S = float(os.environ.get('MIGRATION_WAIT_TIMEOUT_S', '120'))
+
+DEMO_USER_ID = "demo-user-1"
+
+DEFAULT_MODULES = [
+    {
+        "id": 1,
+        "title": "Comprendre sa valeur personnelle",
+        "description": "Découvrez votre vraie valeur et apprenez à la reconnaître au quotidien",
+        "duration": "45 min",
+        "lessons": 6,
+        "completed": False,
+        "progress": 0,
+        "content": {
+            "introduction": "Dans ce module, vous allez explorer les fondements de votre valeur personnelle et apprendre à reconnaître vos qualités uniques.",
+            "video_url": None,
+            "exercises": [
+                "Listez 10 qualités que vous possédez",
+                "Identifiez 3 réussites passées",
+                "Créez votre affirmation personnelle",
+                "Pratiquez l'auto-reconnaissance quotidienne",
+                "Établissez vos valeurs fondamentales"
+            ]
+        }
+    },
+    {
+        "id": 2,
+        "title": "Surmonter le syndrome de l'imposteur",
+        "description": "Techniques concrètes pour vaincre la peur de ne pas être à la hauteur",
+        "duration": "60 min",
+        "lessons": 8,
+        "completed": False,
+        "progress": 0,
+        "content": {
+            "introduction": "Le syndrome de l'imposteur touche 70% des personnes. Apprenez à le reconnaître et à le surmonter définitivement.",
+            "exercises": [
+                "Analysez vos pensées limitantes",
+                "Reconstituez votre parcours de réussites",
+                "Pratiquez l'auto-compassion",
+                "Développez votre dialogue intérieur positif",
+                "Créez votre portfolio de preuves",
+                "Techniques de recadrage cognitif"
+            ]
+        }
+    },
+    {
+        "id": 3,
+        "title": "Développer son assertivité",
+        "description": "Apprenez à vous affirmer avec respect et bienveillance",
+        "duration": "50 min",
+        "lessons": 7,
+        "completed": False,
+        "progress": 0,
+        "content": {
+            "introduction": "L'assertivité est la capacité à exprimer ses opinions et besoins tout en respectant ceux des autres.",
+            "exercises": [
+                "Techniques de communication assertive",
+                "Dire non sans culpabiliser",
+                "Gérer les conflits constructivement",
+                "Exprimer ses besoins clairement",
+                "Pratiquer l'écoute active",
+                "Développer son langage corporel confiant"
+            ]
+        }
+    },
+    {
+        "id": 4,
+        "title": "Gérer l'anxiété sociale",
+        "description": "Stratégies pour vous sentir à l'aise en société",
+        "duration": "55 min",
+        "lessons": 6,
+        "completed": False,
+        "progress": 0,
+        "content": {
+            "introduction": "L'anxiété sociale peut limiter nos interactions. Découvrez des techniques éprouvées pour la surmonter.",
+            "exercises": [
+                "Techniques de respiration pour l'anxiété",
+                "Exposition progressive aux situations sociales",
+                "Restructuration cognitive des pensées négatives",
+                "Préparation mentale avant les événements sociaux",
+                "Développement de sujets de conversation",
+                "Pratique de la pleine conscience sociale"
+            ]
+        }
+    },
+    {
+        "id": 5,
+        "title": "Cultiver l'estime de soi",
+        "description": "Construisez une image positive et durable de vous-même",
+        "duration": "65 min",
+        "lessons": 9,
+        "completed": False,
+        "progress": 0,
+        "content": {
+            "introduction": "L'estime de soi est la fondation de la confiance. Apprenez à la cultiver durablement.",
+            "exercises": [
+                "Journal de gratitude personnel",
+                "Célébrez vos petites victoires",
+                "Créez votre vision idéale",
+                "Pratiquez l'autocompassion",
+                "Développez vos talents uniques",
+                "Établissez des objectifs personnels alignés",
+                "Créez votre routine de bien-être",
+                "Pratiquez l'affirmation positive quotidienne"
+            ]
+        }
+    },
+    {
+        "id": 6,
+        "title": "Prendre des décisions avec confiance",
+        "description": "Méthodes pour décider sereinement et assumer ses choix",
+        "duration": "40 min",
+        "lessons": 5,
+        "completed": False,
+        "progress": 0,
+        "content": {
+            "introduction": "Prendre des décisions peut être source d'anxiété. Découvrez des méthodes pour décider avec confiance.",
+            "exercises": [
+                "Matrice de décision personnalisée",
+                "Technique du pour/contre évolué",
+                "Accepter l'imperfection et l'incertitude",
+                "Écouter son intuition",
+                "Prendre des décisions rapides pour les petits choix"
+            ]
+        }
+    }
+]
+
+async def _create_indexes(db):
+    await db.modules.create_index("id")  # made unique by migration 2
+    await db.users.create_indexes([
+        IndexModel("id"),
+        IndexModel("email"),
+        IndexModel("shopify_order_id")
+    ])
+    await db.exercises.create_indexes([
+        IndexModel("id"),
+        IndexModel("moduleId")
+    ])
+    await db.certificates.create_index("userId")
+
+async def _dedupe_by_id(db, name: str, keep_first: List[Tuple[str, int]]) -> int:
+    """Keeps one document per `id` in collection `name`, the first in `keep_first` order
+    (then by `_id`); the others are copied to `<name>_dedupe_backup` before being deleted.
+    Returns the number of documents removed"""
+    collection, backup = db[name], db[f"{name}_dedupe_backup"]
+    pipeline = [
+        {"$group": {"_id": "$id", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    removed = 0
+    async for duplicate in collection.aggregate(pipeline):
+        copies = await collection.find({"id": duplicate["_id"]}).sort(keep_first + [("_id", 1)]).to_list(None)
+        extra = copies[1:]
+        # A failed backup write aborts the migration before anything is deleted;
+        # upserts make a replay after a crash safe
+        for document in extra:
+            await backup.replace_one({"_id": document["_id"]}, document, upsert=True)
+        await collection.delete_many({"_id": {"$in": [document["_id"] for document in extra]}})
+        logger.warning("Removed %d duplicate %s with id %r (kept _id %s, backed up to %s): %s",
+                       len(extra), name, duplicate["_id"], copies[0]["_id"], backup.name,
+                       [document["_id"] for document in extra])
+        removed += len(extra)
+    return removed
+
+async def _dedupe_modules(db):
+    # Workers racing on the old count-then-insert_many seeding could insert
+    # the default modules twice; keep the oldest copy of each id
+    await _dedupe_by_id(db, "modules", [])
+    try:
+        await db.modules.drop_index("id_1")
+    except OperationFailure:
+        pass
+    await db.modules.create_index("id", unique=True)
+
+async def _seed_modules(db):
+    result = await db.modules.bulk_write([
+        UpdateOne({"id": module["id"]}, {"$setOnInsert": module}, upsert=True)
+        for module in DEFAULT_MODULES
+    ])
+    if result.upserted_count:
+        logger.info("✅ Modules par défaut créés")
+
+async def _seed_demo_user(db):
+    # As before migrations: only a fresh database gets the demo user
+    if await db.users.count_documents({}, limit=1):
+        return
+    result = await db.users.update_one(
+        {"id": DEMO_USER_ID},
+        {"$setOnInsert": {
+            "id": DEMO_USER_ID,
+            "name": "Utilisateur Demo",
+            "email": "demo@confianceboost.fr",
+            "enrollmentDate": datetime.utcnow(),
+            "completedModules": 0,
+            "totalProgress": 0,
+            "certificates": 0
+        }},
+        upsert=True
+    )
+    if result.upserted_id is not None:
+        logger.info("✅ Utilisateur demo créé")
+
+async def _index_exercise_completion(db):
+    # One completion bitmap document per user
+    await db.user_progress.create_index("userId", unique=True)
+
+async def _index_learning_events(db):
+    # One bucket per user per day, and one rollup per day
+    await db.learning_events.create_index([("userId", 1), ("day", 1)], unique=True)
+    await db.learning_events.create_index("day")
+    await db.learning_daily.create_index("day", unique=True)
+
+async def _index_customer_enrichment(db):
+    # Users never checked (null) or checked before a cutoff
+    await db.users.create_index("shopify_customer_checked_at")
+
+async def _index_archive(db):
+    # Archival scans users by last activity (or enrollment when they never started);
+    # cold users are found again by the keys they log in with
+    await db.users.create_index([("lastActivity", 1), ("enrollmentDate", 1)])
+    await db.users_archive.create_indexes([
+        IndexModel("email"),
+        IndexModel("shopify_order_id")
+    ])
+
+async def _unique_user_ids(db):
+    # Concurrent restores from cold storage could each insert the same user;
+    # keep the most recently active copy of each id. Emails stay non-unique:
+    # case variants and users without an email already share values
+    await _dedupe_by_id(db, "users", [("lastActivity", -1)])
+    try:
+        await db.users.drop_index("id_1")
+    except OperationFailure:
+        pass
+    await db.users.create_index("id", unique=True)
+    # Restores upsert certificates by id
+    await db.certificates.create_index("id")
+
+Migration = Tuple[int, str, Callable[..., Awaitable[None]]]
+
+# Append only: never renumber or edit a migration that has shipped
+MIGRATIONS: List[Migration] = [
+    (1, "create DAL indexes", _create_indexes),
+    (2, "dedupe modules and make modules.id unique", _dedupe_modules),
+    (3, "seed default modules", _seed_modules),
+    (4, "seed demo user", _seed_demo_user),
+    (5, "unique user_progress.userId for completion bitmaps", _index_exercise_completion),
+    (6, "index daily learning event buckets and rollups", _index_learning_events),
+    (7, "index users by Shopify customer enrichment date", _index_customer_enrichment),
+    (8, "index users by activity and users_archive by login keys", _index_archive),
+    (9, "make users.id unique and index certificates by id", _unique_user_ids),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+async def _current_version(db) -> int:
+    marker = await db.meta.find_one({"_id": SCHEMA_VERSION_ID}, {"version": 1})
+    return marker["version"] if marker else 0
+
+async def acquire_lease(db, lease_id: str, owner: str, ttl: float) -> bool:
+    """Takes (or renews, for its owner) the `meta` lease `lease_id` for `ttl` seconds"""
+    now = datetime.utcnow()
+    try:
+        await db.meta.update_one(
+            {"_id": lease_id, "$or": [{"expiresAt": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "expiresAt": now + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # Another owner holds the lease and it has not expired
+        return False
+
+async def release_lease(db, lease_id: str, owner: str) -> None:
+    await db.meta.delete_one({"_id": lease_id, "owner": owner})
+
+async def _acquire_lock(db, owner: str) -> bool:
+    return await acquire_lease(db, MIGRATION_LOCK_ID, owner, MIGRATION_LOCK_TTL_S)
+
+async def _release_lock(db, owner: str) -> None:
+    await release_lease(db, MIGRATION_LOCK_ID, owner)
+
+async def _apply_pending(db, owner: str) -> int:
+    # Read under the lock: another worker may have migrated since we first looked
+    version = await _current_version(db)
+    applied = 0
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        started = time.perf_counter()
+        await migrate(db)
+        await db.meta.update_one(
+            {"_id": SCHEMA_VERSION_ID},
+            {
+                "$set": {"version": number, "updatedAt": datetime.utcnow()},
+                "$push": {"applied": {"version": number, "description": description,
+                                      "appliedAt": datetime.utcnow(), "by": owner}}
+            },
+            upsert=True
+        )
+        # Keep the lease alive across long migrations
+        await db.meta.update_one(
+            {"_id": MIGRATION_LOCK_ID, "owner": owner},
+            {"$set": {"expiresAt": datetime.utcnow() + timedelta(seconds=MIGRATION_LOCK_TTL_S)}}
+        )
+        applied += 1
+        logger.info("Applied migration %s (%s) in %.1fms", number, description,
+                    (time.perf_counter() - started) * 1000)
+    return applied
+
+async def run_migrations(db) -> int:
+    """Brings the database to LATEST_VERSION; returns the number of migrations applied"""
+    version = await _current_version(db)
+    if version >= LATEST_VERSION:
+        return 0
+
+    owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    deadline = time.monotonic() + MIGRATION_WAIT_TIMEOUT_S
+    while True:
+        if await _acquire_lock(db, owner):
+            try:
+                return await _apply_pending(db, owner)
+            finally:
+                await _release_lock(db, owner)
+
+        # Another worker is migrating; wait for it to finish or for its lease to expire
+        await asyncio.sleep(0.2)
+        if await _current_version(db) >= LATEST_VERSION:
+            return 0
+        if time.monotonic() > deadline:
+            raise RuntimeError("Timed out waiting for database migrations held by another worker")
@@ -1,6 +1,8 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, TypeAdapter, field_validator
+from pydantic_core import PydanticUndefined
+from typing import Any, Dict, List, Optional, Union, get_args, get_origin
 from datetime import datetime
+from zoneinfo import ZoneInfo
 import uuid
 
 # Module Models
@@ -19,6 +21,9 @@ class Module(BaseModel):
     progress: int = 0
     content: ModuleContent
 
+# Fields of the module list view (no content)
+MODULE_SUMMARY_FIELDS = ("id", "title", "description", "duration", "lessons", "completed", "progress")
+
 class ModuleCreate(BaseModel):
     title: str
     description: str
@@ -31,6 +36,14 @@ class ModuleProgressUpdate(BaseModel):
     completed: bool = False
 
 # User Models
+class ShopifyCustomerInfo(BaseModel):
+    id: int
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    created_at: Optional[str] = None
+    total_spent: str = "0.00"
+    orders_count: int = 0
+
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -39,6 +52,13 @@ class User(BaseModel):
     completedModules: int = 0
     totalProgress: int = 0
     certificates: int = 0
+    timezone: Optional[str] = None
+    currentStreak: int = 0
+    longestStreak: int = 0
+    lastActivity: Optional[datetime] = None
+    shopify_customer: Optional[ShopifyCustomerInfo] = None
+
+USER_SUMMARY_FIELDS = ("id", "name", "completedModules", "totalProgress", "certificates", "currentStreak")
 
 class UserCreate(BaseModel):
     name: str
@@ -47,6 +67,17 @@ class UserCreate(BaseModel):
 class UserUpdate(BaseModel):
     name: Optional[str] = None
     email: Optional[str] = None
+    timezone: Optional[str] = None
+
+    @field_validator("timezone")
+    @classmethod
+    def check_timezone(cls, value):
+        if value is not None:
+            try:
+                ZoneInfo(value)
+            except Exception:
+                raise ValueError("Fuseau horaire inconnu")
+        return value
 
 # Exercise Models
 class Exercise(BaseModel):
@@ -63,6 +94,19 @@ class ExerciseCreate(BaseModel):
 class ExerciseComplete(BaseModel):
     completed: bool
 
+class ModuleExerciseProgress(BaseModel):
+    moduleId: int
+    completedExercises: List[int]
+    completedCount: int
+    totalExercises: int
+    progress: int
+
+class ExerciseProgress(BaseModel):
+    modules: List[ModuleExerciseProgress]
+    completedExercises: int
+    totalExercises: int
+    totalProgress: int
+
 # Certificate Models
 class Certificate(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -88,4 +132,82 @@ class Stats(BaseModel):
     totalStudents: int
     completionRate: int
     averageRating: float
-    moduleCount: int
\ No newline at end of file
+    moduleCount: int
+
+# Search Models
+class SearchResult(BaseModel):
+    kind: str
+    moduleId: int
+    exerciseIndex: Optional[int] = None
+    title: str
+    text: str
+    score: float
+
+class SearchResponse(BaseModel):
+    query: str
+    total: int
+    results: List[SearchResult]
+    suggestions: List[str] = []
+
+# Trusted serializers
+# Documents read back from our own database already have the right types:
+# validating them again on the way out is pure overhead. They are trimmed to
+# the response model's fields (so internal fields never leak) and dumped
+# straight to JSON bytes. Inbound payloads keep going through the models.
+_JSON = TypeAdapter(Any)
+
+def _model_of(annotation):
+    """(nested model, is_list) for a field annotation; nested model is None for scalars"""
+    origin = get_origin(annotation)
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _model_of(args[0]) if len(args) == 1 else (None, False)
+    if origin in (list, List):
+        nested, _ = _model_of(get_args(annotation)[0])
+        return nested, nested is not None
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+    return None, False
+
+class TrustedSerializer:
+    def __init__(self, model):
+        self.model = model
+        # (field, default, default factory, nested serializer, nested is a list)
+        self._plan = []
+        self._partial_plans: Dict[tuple, list] = {}
+        for name, field in model.model_fields.items():
+            nested, is_list = _model_of(field.annotation)
+            default = None if field.default is PydanticUndefined else field.default
+            self._plan.append((name, default, field.default_factory,
+                               TrustedSerializer(nested) if nested is not None else None, is_list))
+
+    def _plan_for(self, fields: Optional[tuple]) -> list:
+        if not fields:
+            return self._plan
+        plan = self._partial_plans.get(fields)
+        if plan is None:
+            plan = self._partial_plans[fields] = [entry for entry in self._plan if entry[0] in fields]
+        return plan
+
+    def shape(self, document: Dict, fields: Optional[tuple] = None) -> Dict:
+        """The document restricted to the model's fields (or to `fields`), defaults filled in"""
+        shaped = {}
+        for name, default, factory, nested, is_list in self._plan_for(fields):
+            value = document.get(name, default)
+            if value is None and factory is not None and name not in document:
+                value = factory()
+            if nested is not None and value is not None:
+                value = [nested.shape(item) for item in value] if is_list else nested.shape(value)
+            shaped[name] = value
+        return shaped
+
+    def dump_json(self, document: Dict, fields: Optional[tuple] = None) -> bytes:
+        return _JSON.dump_json(self.shape(document, fields))
+
+    def dump_json_list(self, documents: List[Dict], fields: Optional[tuple] = None) -> bytes:
+        return _JSON.dump_json([self.shape(document, fields) for document in documents])
+
+module_serializer = TrustedSerializer(Module)
+user_serializer = TrustedSerializer(User)
+certificate_serializer = TrustedSerializer(Certificate)
+stats_serializer = TrustedSerializer(Stats)
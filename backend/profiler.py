@@ -0,0 +1,125 @@
+"""
+Per-request database query profiler for ConfianceBoost
+Counts and times every MongoDB command issued while handling a request,
+reports them in Server-Timing / X-DB-Queries response headers and logs a
+structured slow_request record for requests slower than
+SLOW_REQUEST_THRESHOLD_MS.
+Opt-in with DB_PROFILER_ENABLED=true.
+"""
+
+import contextvars
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+DB_PROFILER_ENABLED = os.environ.get('DB_PROFILER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+SLOW_REQUEST_THRESHOLD_MS = float(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', '500'))
+
+_current_profile: contextvars.ContextVar = contextvars.ContextVar(
+    "confianceboost_query_profile", default=None
+)
+
+class QueryProfile:
+    """MongoDB commands issued on behalf of one request"""
+
+    __slots__ = ("commands", "_pending")
+
+    def __init__(self):
+        self.commands: List[Tuple[str, str, float]] = []
+        self._pending: Dict[Tuple, str] = {}
+
+    @property
+    def count(self) -> int:
+        return len(self.commands)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(duration for _, _, duration in self.commands)
+
+class QueryProfileListener(monitoring.CommandListener):
+    """
+    Appends each command to the profile of the request that issued it
+
+    Motor copies the caller's context into its executor threads, so the
+    active profile is visible from the listener callbacks.
+    """
+
+    def started(self, event):
+        profile = _current_profile.get()
+        if profile is None:
+            return
+        target = event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else event.command.get("collection", "-")
+        profile._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event):
+        profile = _current_profile.get()
+        if profile is None:
+            return
+        collection = profile._pending.pop((event.connection_id, event.request_id), "-")
+        profile.commands.append((event.command_name, collection, event.duration_micros / 1000))
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+query_profile_listener = QueryProfileListener()
+
+def current_profile() -> Optional[QueryProfile]:
+    return _current_profile.get()
+
+class QueryProfilerMiddleware:
+    """ASGI middleware attaching a QueryProfile to every HTTP request"""
+
+    def __init__(self, app, slow_threshold_ms: float = SLOW_REQUEST_THRESHOLD_MS):
+        self.app = app
+        self.slow_threshold_ms = slow_threshold_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+        token = _current_profile.set(profile)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                db_ms = profile.total_ms
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", f'db;dur={db_ms:.2f};desc="{profile.count} queries"'.encode()),
+                    (b"x-db-queries", str(profile.count).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms >= self.slow_threshold_ms:
+                route = scope.get("route")
+                logger.warning("Slow request %s %s", scope["method"], scope["path"], extra={"slow_request": {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route.path if route is not None else None,
+                    "status": status_code,
+                    "duration_ms": round(elapsed_ms, 2),
+                    "db_queries": profile.count,
+                    "db_time_ms": round(profile.total_ms, 2),
+                    "db_commands": [
+                        {"operation": operation, "collection": collection, "duration_ms": round(duration, 2)}
+                        for operation, collection, duration in profile.commands
+                    ]
+                }})
@@ -0,0 +1,115 @@
+"""
+In-process rate limiting for ConfianceBoost
+Token buckets keyed by client IP or email, with per-route policies. A
+rejected request gets a 429 with Retry-After before it reaches MongoDB or
+Shopify. Each limiter keeps at most `max_keys` buckets, evicting the least
+recently used. An idle bucket refills to capacity, so evicting it loses
+nothing.
+"""
+
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+
+from metrics import counter
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Only trust X-Forwarded-For when running behind our own ingress
+TRUST_PROXY_HEADERS = os.environ.get('TRUST_PROXY_HEADERS', 'false').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+
+rate_limited_total = counter(
+    "confianceboost_rate_limited_total", "Requests rejected by a rate limit policy", ("policy",)
+)
+
+class RateLimitPolicy:
+    """`capacity` requests per `period` seconds, allowing bursts of up to `capacity`"""
+
+    def __init__(self, name: str, capacity: int, period: float):
+        self.name = name
+        self.capacity = float(capacity)
+        self.refill_rate = capacity / period
+
+    @classmethod
+    def from_env(cls, name: str, default: str) -> 'RateLimitPolicy':
+        """Reads "<requests>/<seconds>" from RATE_LIMIT_<NAME>, e.g. "10/60" """
+        spec = os.environ.get(f"RATE_LIMIT_{name.upper()}", default)
+        capacity, period = spec.split('/')
+        return cls(name, int(capacity), float(period))
+
+class RateLimiter:
+    """Token bucket per key; buckets are [tokens, last refill timestamp]
+
+    Not thread-safe: only call it from the event loop.
+    """
+
+    def __init__(self, policy: RateLimitPolicy, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.policy = policy
+        self.max_keys = max_keys
+        self._buckets: 'OrderedDict[str, list]' = OrderedDict()
+        self._rejections = rate_limited_total.labels(policy.name)
+
+    def hit(self, key: str, cost: float = 1.0, now: Optional[float] = None) -> Optional[float]:
+        """Consumes `cost` tokens; returns None if allowed, else seconds until allowed"""
+        now = time.monotonic() if now is None else now
+        policy = self.policy
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [policy.capacity, now]
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(policy.capacity, bucket[0] + (now - bucket[1]) * policy.refill_rate)
+            bucket[1] = now
+
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return None
+        self._rejections.inc()
+        return (cost - bucket[0]) / policy.refill_rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+# Per-route policies
+RATE_LIMITERS: Dict[str, RateLimiter] = {
+    policy.name: RateLimiter(policy) for policy in (
+        RateLimitPolicy.from_env('validate_access_ip', '20/60'),
+        RateLimitPolicy.from_env('validate_access_email', '5/60'),
+        RateLimitPolicy.from_env('user_lookup_ip', '30/60'),
+        RateLimitPolicy.from_env('user_lookup_email', '10/60'),
+    )
+}
+
+def client_ip(request: Request) -> str:
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get('x-forwarded-for')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.client.host if request.client else 'unknown'
+
+def enforce_rate_limit(policy_name: str, key: str) -> None:
+    """Raises a 429 with Retry-After when `key` is over the policy's limit"""
+    if not RATE_LIMIT_ENABLED:
+        return
+    retry_after = RATE_LIMITERS[policy_name].hit(key)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="Trop de requêtes, veuillez réessayer plus tard",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+def limit_by_ip(policy_name: str):
+    """FastAPI dependency applying `policy_name` to the client IP"""
+    # async so FastAPI runs it on the event loop, not in its threadpool: the
+    # buckets are unsynchronized OrderedDicts
+    async def dependency(request: Request) -> None:
+        enforce_rate_limit(policy_name, client_ip(request))
+    return dependency
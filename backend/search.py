@@ -0,0 +1,229 @@
+"""
+In-memory full-text search over the ConfianceBoost catalog
+Module titles, descriptions, introductions and exercises are indexed into
+an inverted index. French text is accent-folded and lightly stemmed, so
+"assertivité", "assertif" and "Assertive" match each other. The last
+query word also matches as a prefix, for autocomplete. Hits are ranked
+by field weight × idf. The index follows the catalog incrementally: only
+modules whose text changed are re-indexed.
+"""
+
+import bisect
+import math
+import re
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+SEARCH_PREFIX_EXPANSIONS = 20
+SEARCH_SUGGESTIONS = 5
+# A word completed from a prefix ranks below an exact (stemmed) match
+PREFIX_MATCH_FACTOR = 0.7
+
+# Field weights for module and exercise documents
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "description": 2.0,
+    "introduction": 1.0,
+    "exercise": 2.0,
+}
+
+STOPWORDS = frozenset("""
+a au aux avec ce ces cet cette c d dans de des du elle elles en est et etre il ils
+j je l la le les leur leurs m ma mais me mes mon n ne nos notre nous on ou par pas
+plus pour qu que qui s sa sans se ses son sont sur t ta te tes ton tous tout toute
+toutes tu un une vos votre vous y
+""".split())
+
+# Longest suffixes first; a suffix is only removed if at least 3 letters remain
+_SUFFIXES = sorted("""
+issements issement atrices atrice ateurs ateur ations ation ements ement ments ment
+ivites ivite ives ive ifs if ites ite euses euse eux ances ance ences ence
+ables able istes iste ismes isme oires oire eurs eur elles elle ees ee er ez ant
+es e s x
+""".split(), key=len, reverse=True)
+_MIN_STEM = 3
+
+_WORD = re.compile(r"[a-z0-9]+")
+_LIGATURES = str.maketrans({"œ": "oe", "æ": "ae", "Œ": "oe", "Æ": "ae"})
+
+def fold(text: str) -> str:
+    """Lowercases and strips accents ("Assertivité" -> "assertivite")"""
+    decomposed = unicodedata.normalize("NFKD", text.translate(_LIGATURES).casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+def stem(word: str) -> str:
+    """Light French stemmer for folded words"""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+def tokenize(text: str) -> List[str]:
+    """Folded words of `text`, stopwords removed"""
+    return [word for word in _WORD.findall(fold(text)) if word not in STOPWORDS]
+
+DocKey = Tuple[str, int, int]
+
+class SearchDocument(NamedTuple):
+    kind: str  # "module" or "exercise"
+    moduleId: int
+    exerciseIndex: Optional[int]
+    title: str
+    text: str
+
+def _module_documents(module: dict) -> List[Tuple[DocKey, SearchDocument, List[Tuple[str, str]]]]:
+    content = module.get("content") or {}
+    module_id = module["id"]
+    title = module.get("title", "")
+    documents = [(
+        ("module", module_id, -1),
+        SearchDocument("module", module_id, None, title, module.get("description", "")),
+        [("title", title), ("description", module.get("description", "")),
+         ("introduction", content.get("introduction", ""))]
+    )]
+    for index, exercise in enumerate(content.get("exercises") or []):
+        documents.append((
+            ("exercise", module_id, index),
+            SearchDocument("exercise", module_id, index, title, exercise),
+            [("exercise", exercise)]
+        ))
+    return documents
+
+def _fingerprint(module: dict) -> Tuple:
+    content = module.get("content") or {}
+    return (module.get("title"), module.get("description"), content.get("introduction"),
+            tuple(content.get("exercises") or ()))
+
+class SearchIndex:
+    def __init__(self):
+        self.documents: Dict[DocKey, SearchDocument] = {}
+        self.postings: Dict[str, Dict[DocKey, float]] = {}
+        self.idf: Dict[str, float] = {}
+        # Folded surface word -> (stem, occurrences), and the sorted words for prefix lookups
+        self._words: Dict[str, List] = {}
+        self._sorted_words: List[str] = []
+        self._module_docs: Dict[int, List[Tuple[DocKey, Dict[str, float], Dict[str, int]]]] = {}
+        self._fingerprints: Dict[int, Tuple] = {}
+        self._synced_catalog: Optional[list] = None
+
+    def sync(self, modules: list) -> int:
+        """Re-indexes modules added, changed or removed since the last sync; returns how many"""
+        if modules is self._synced_catalog:
+            return 0
+        changed = 0
+        seen: Set[int] = set()
+        for module in modules:
+            module_id = module["id"]
+            seen.add(module_id)
+            fingerprint = _fingerprint(module)
+            if self._fingerprints.get(module_id) != fingerprint:
+                self._remove_module(module_id)
+                self._add_module(module)
+                self._fingerprints[module_id] = fingerprint
+                changed += 1
+        for module_id in [module_id for module_id in self._fingerprints if module_id not in seen]:
+            self._remove_module(module_id)
+            del self._fingerprints[module_id]
+            changed += 1
+        if changed:
+            self._refresh()
+        self._synced_catalog = modules
+        return changed
+
+    def _add_module(self, module: dict) -> None:
+        entries = []
+        for key, document, fields in _module_documents(module):
+            self.documents[key] = document
+            weights: Dict[str, float] = {}
+            words: Dict[str, int] = {}
+            for field, text in fields:
+                for word in tokenize(text or ""):
+                    term = stem(word)
+                    weights[term] = weights.get(term, 0.0) + FIELD_WEIGHTS[field]
+                    words[word] = words.get(word, 0) + 1
+            for term, weight in weights.items():
+                self.postings.setdefault(term, {})[key] = weight
+            for word, count in words.items():
+                entry = self._words.setdefault(word, [stem(word), 0])
+                entry[1] += count
+            entries.append((key, weights, words))
+        self._module_docs[module["id"]] = entries
+
+    def _remove_module(self, module_id: int) -> None:
+        for key, weights, words in self._module_docs.pop(module_id, []):
+            self.documents.pop(key, None)
+            for term in weights:
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(key, None)
+                    if not posting:
+                        del self.postings[term]
+            for word, count in words.items():
+                entry = self._words.get(word)
+                if entry is not None:
+                    entry[1] -= count
+                    if entry[1] <= 0:
+                        del self._words[word]
+
+    def _refresh(self) -> None:
+        total = max(len(self.documents), 1)
+        self.idf = {term: math.log(1 + total / len(posting)) for term, posting in self.postings.items()}
+        self._sorted_words = sorted(self._words)
+
+    def complete(self, prefix: str, limit: int = SEARCH_PREFIX_EXPANSIONS) -> List[str]:
+        """Indexed words starting with the folded `prefix`, most frequent first"""
+        words = self._sorted_words
+        matches = []
+        for index in range(bisect.bisect_left(words, prefix), len(words)):
+            if not words[index].startswith(prefix):
+                break
+            matches.append(words[index])
+        matches.sort(key=lambda word: -self._words[word][1])
+        return matches[:limit]
+
+    def _query_terms(self, query: str) -> Tuple[List[Dict[str, float]], List[str]]:
+        words = tokenize(query)
+        if not words:
+            return [], []
+        groups = [{stem(word): 1.0} for word in words]
+        suggestions: List[str] = []
+        # Still typing the last word: also match it as a prefix
+        if not query[-1:].isspace():
+            suggestions = self.complete(words[-1])
+            for word in suggestions:
+                groups[-1].setdefault(self._words[word][0], PREFIX_MATCH_FACTOR)
+        return groups, suggestions[:SEARCH_SUGGESTIONS]
+
+    def search(self, query: str, limit: int = 10) -> dict:
+        """Ranked documents matching every query word"""
+        groups, suggestions = self._query_terms(query)
+        scores: Optional[Dict[DocKey, float]] = None
+        for group in groups:
+            group_scores: Dict[DocKey, float] = {}
+            for term, factor in group.items():
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = self.idf[term]
+                for key, weight in posting.items():
+                    score = weight * idf * factor
+                    if score > group_scores.get(key, 0.0):
+                        group_scores[key] = score
+            if scores is None:
+                scores = group_scores
+            else:
+                scores = {key: score + group_scores[key] for key, score in scores.items() if key in group_scores}
+            if not scores:
+                break
+
+        ranked = sorted((scores or {}).items(), key=lambda item: (-item[1], item[0]))
+        return {
+            "query": query,
+            "total": len(ranked),
+            "results": [
+                dict(self.documents[key]._asdict(), score=round(score, 4)) for key, score in ranked[:limit]
+            ],
+            "suggestions": suggestions,
+        }
+
+search_index = SearchIndex()
@@ -1,39 +1,115 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from pathlib import Path
+from contextlib import asynccontextmanager
+import hmac
+import json
 import os
+import sys
 import logging
-from typing import List
+from typing import List, Optional
 import uuid
 
 # Import models and database
 from models import (
     Module, ModuleProgressUpdate, User, UserCreate, UserUpdate,
-    Exercise, ExerciseComplete, Certificate, CertificateCreate, Stats
+    Exercise, ExerciseComplete, Certificate, CertificateCreate, Stats, SearchResponse,
+    ModuleExerciseProgress, ExerciseProgress,
+    module_serializer, user_serializer, certificate_serializer, stats_serializer,
+    MODULE_SUMMARY_FIELDS, USER_SUMMARY_FIELDS
 )
 from database import (
-    init_database, get_modules, get_module_by_id, update_module_progress,
-    get_user_by_id, update_user_profile, get_user_progress,
+    connect_database, close_database, init_database, get_modules, get_catalog_content, get_module_by_id,
+    update_module_progress,
+    get_user_by_id, get_user_by_email, update_user_profile, get_user_progress,
     get_exercises_by_module, complete_exercise, get_certificates,
-    create_certificate, get_stats
+    create_certificate, get_stats, set_exercise_completion, get_exercise_progress,
+    module_exercise_progress, MAX_EXERCISES_PER_MODULE, record_activity, current_streak
+)
+from dataloader import RequestScopeMiddleware, close_request_scope
+from metrics import MetricsMiddleware, render_metrics, CONTENT_TYPE_LATEST
+from profiler import QueryProfilerMiddleware, DB_PROFILER_ENABLED
+from logging_config import configure_logging, stop_logging, RequestIdMiddleware
+from rate_limit import enforce_rate_limit, limit_by_ip
+from admission import AdmissionControlMiddleware, ADMISSION_ENABLED
+from compression import CompressionMiddleware, COMPRESSION_ENABLED
+from cache import cache
+from search import search_index
+from analytics import compute_funnel
+from events import (
+    event_buffer, module_minutes, get_daily_rollups, get_user_activity, PROGRESS_UPDATE, EXERCISE_COMPLETION
 )
+from enrichment import enrichment_worker
+from email_filter import email_filter
+from live import live_events, LIVE_EVENTS_PATH
 
 # Import Shopify integration
 from shopify_integration import (
-    validate_shopify_access, verify_shopify_webhook, 
+    validate_shopify_access, webhook_verifier, SHOPIFY_WEBHOOK_MAX_BODY_BYTES, product_allowlist,
     ShopifyOrder, create_shopify_user_access, WELCOME_EMAIL_TEMPLATE
 )
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Configure logging (JSON lines written by a background thread)
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Modules from requirements.txt that only offline tooling should import
+HEAVY_MODULES = ("pandas", "numpy", "boto3", "botocore", "jq")
+_IMPORTS_MS = (time.perf_counter() - _IMPORT_STARTED) * 1000
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs once per worker process, after any fork
+    started = time.perf_counter()
+    await connect_database()
+    await cache.start()
+    await event_buffer.start()
+    await enrichment_worker.start()
+    connected = time.perf_counter()
+    migrations_applied = await init_database()
+    ready = time.perf_counter()
+    await email_filter.start()
+    await live_events.start()
+
+    heavy_modules = [name for name in HEAVY_MODULES if name in sys.modules]
+    logger.info("Startup timing", extra={"startup": {
+        "imports_ms": round(_IMPORTS_MS, 1),
+        "connect_ms": round((connected - started) * 1000, 1),
+        "migrations_ms": round((ready - connected) * 1000, 1),
+        "migrations_applied": migrations_applied,
+        "heavy_modules_loaded": heavy_modules
+    }})
+    if heavy_modules:
+        logger.warning("Heavy modules loaded by the API process: %s", ", ".join(heavy_modules))
+    logger.info("✅ ConfianceBoost API with Shopify integration initialized successfully")
+    yield
+    logger.info("ConfianceBoost API shutting down...")
+    await live_events.stop()
+    await enrichment_worker.stop()
+    await email_filter.stop()
+    await event_buffer.stop()
+    await cache.close()
+    close_database()
+    stop_logging()
+
 # Create the main app
-app = FastAPI(title="ConfianceBoost API", version="1.0.0")
+app = FastAPI(title="ConfianceBoost API", version="1.0.0", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Admission control / load shedding (inside CORS so 503s stay readable by the browser)
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionControlMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -43,16 +119,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request-scoped identity map for DAL reads
+app.add_middleware(RequestScopeMiddleware)
+
+# Opt-in per-request query profiler (Server-Timing / X-DB-Queries headers, slow-request log)
+if DB_PROFILER_ENABLED:
+    app.add_middleware(QueryProfilerMiddleware)
+
+# gzip/brotli, with catalog payloads compressed once and reused
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Request ids for log correlation
+app.add_middleware(RequestIdMiddleware)
+
+# Route latency / in-flight metrics (outermost, so it times everything)
+app.add_middleware(MetricsMiddleware, streaming_paths=(LIVE_EVENTS_PATH,))
+
 # Default user ID for demo (in production, use authentication)
 DEFAULT_USER_ID = "demo-user-1"
 
+# Admin endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+ANALYTICS_CACHE_TTL_S = float(os.environ.get('ANALYTICS_CACHE_TTL_S', '300'))
+
+def require_admin(x_admin_token: str = Header(default="")):
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Accès refusé")
+
 # Health check
 @api_router.get("/")
 async def root():
     return {"message": "ConfianceBoost API is running", "version": "1.0.0"}
 
 # Shopify Integration Endpoints
-@api_router.post("/shopify/validate-access")
+@api_router.post("/shopify/validate-access", dependencies=[Depends(limit_by_ip("validate_access_ip"))])
 async def validate_shopify_purchase(request: Request):
     """
     Validate Shopify purchase and grant access
@@ -69,6 +170,8 @@ async def validate_shopify_purchase(request: Request):
                 detail="Email et numéro de commande requis"
             )
         
+        enforce_rate_limit("validate_access_email", email)
+        
         # Validate with Shopify
         result = await validate_shopify_access(email, order_number)
         
@@ -88,39 +191,57 @@ async def validate_shopify_purchase(request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error validating Shopify access: {e}")
+        logger.error("Error validating Shopify access: %s", e)
         raise HTTPException(
             status_code=500,
             detail="Erreur lors de la validation de votre achat"
         )
 
+async def read_signed_webhook_body(request: Request) -> bytes:
+    """
+    Read a webhook body, hashing each chunk as it arrives
+    Unsigned, oversized or forged payloads are rejected before being buffered in full or parsed.
+    """
+    signature = request.headers.get('X-Shopify-Hmac-Sha256', '')
+    verifier = webhook_verifier()
+    if not signature or verifier is None:
+        raise HTTPException(status_code=401, detail="Unauthorized webhook")
+
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > SHOPIFY_WEBHOOK_MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail="Webhook payload too large")
+
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > SHOPIFY_WEBHOOK_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Webhook payload too large")
+        verifier.update(chunk)
+        chunks.append(chunk)
+
+    if not verifier.verify(signature):
+        raise HTTPException(status_code=401, detail="Unauthorized webhook")
+    return b"".join(chunks)
+
 @api_router.post("/shopify/webhook/order-paid")
 async def handle_shopify_order_paid(request: Request):
     """
     Handle Shopify order paid webhook
     """
     try:
-        # Verify webhook signature
-        signature = request.headers.get('X-Shopify-Hmac-Sha256', '')
-        body = await request.body()
-        
-        if not verify_shopify_webhook(body, signature):
-            raise HTTPException(status_code=401, detail="Unauthorized webhook")
+        # Verify webhook signature while the body streams in
+        body = await read_signed_webhook_body(request)
         
         # Parse order data
-        order_data = await request.json()
+        try:
+            order_data = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid webhook payload")
         
         # Check if this is a ConfianceBoost product
-        line_items = order_data.get('line_items', [])
-        is_confianceboost_order = False
-        
-        for item in line_items:
-            product_name = item.get('name', '').lower()
-            if 'confianceboost' in product_name or 'confiance' in product_name:
-                is_confianceboost_order = True
-                break
-        
-        if not is_confianceboost_order:
+        access_tier = await product_allowlist.tier_for_order(order_data.get('line_items', []))
+        if access_tier is None:
             return {"status": "ignored", "reason": "Not a ConfianceBoost product"}
         
         # Create user access
@@ -131,7 +252,8 @@ async def handle_shopify_order_paid(request: Request):
             'customer_name': f"{order_data.get('billing_address', {}).get('first_name', '')} {order_data.get('billing_address', {}).get('last_name', '')}".strip(),
             'total_price': order_data['total_price'],
             'created_at': order_data['created_at'],
-            'financial_status': order_data['financial_status']
+            'financial_status': order_data['financial_status'],
+            'access_tier': access_tier
         }
         
         user = await create_shopify_user_access(shopify_order_data)
@@ -139,7 +261,7 @@ async def handle_shopify_order_paid(request: Request):
         # TODO: Send welcome email here
         # await send_welcome_email(user['email'], shopify_order_data)
         
-        logging.info(f"Created access for Shopify order {order_data['name']} - {order_data['email']}")
+        logger.info("Created access for Shopify order %s - %s", order_data['name'], order_data['email'])
         
         return {
             "status": "success",
@@ -150,18 +272,27 @@ async def handle_shopify_order_paid(request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error handling Shopify webhook: {e}")
+        logger.error("Error handling Shopify webhook: %s", e)
         raise HTTPException(status_code=500, detail="Webhook processing error")
 
-@api_router.get("/shopify/user/{email}")
+# The email lookup is unauthenticated: never expose what a customer spent
+PUBLIC_USER_PROJECTION = {"_id": 0, "shopify_customer.total_spent": 0, "shopify_customer.orders_count": 0}
+
+@api_router.get("/shopify/user/{email}", dependencies=[Depends(limit_by_ip("user_lookup_ip"))])
 async def get_shopify_user(email: str):
     """
     Get user by email (for Shopify integration)
     """
     try:
-        from database import users_collection
+        enforce_rate_limit("user_lookup_email", email.lower())
         
-        user = await users_collection.find_one({"email": email.lower()})
+        # Unknown emails (typos, scrapers) are answered without a MongoDB query
+        if not await email_filter.might_exist(email):
+            raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+        
+        # Read-only, archive included: only a login restores an archived user
+        user = await get_user_by_email(email, PUBLIC_USER_PROJECTION)
+        email_filter.record_lookup(user is not None)
         if not user:
             raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
         
@@ -170,38 +301,59 @@ async def get_shopify_user(email: str):
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error fetching Shopify user: {e}")
+        logger.error("Error fetching Shopify user: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la récupération de l'utilisateur")
 
+def trusted_json(body: bytes) -> Response:
+    # Returning a Response bypasses response_model validation; response_model still documents the schema
+    return Response(content=body, media_type="application/json")
+
+def requested_fields(fields: Optional[str], view: Optional[str], model, summary_fields: tuple) -> Optional[tuple]:
+    """Champs demandés via `fields=a,b` ou `view=summary` (None : document complet)"""
+    if fields:
+        wanted = tuple(sorted({field.strip() for field in fields.split(",") if field.strip()}))
+        unknown = [field for field in wanted if field not in model.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Champs inconnus : {', '.join(unknown)}")
+        return wanted or None
+    if view == "summary":
+        return summary_fields
+    return None
+
 # Existing endpoints (modules, user, etc.)
 @api_router.get("/modules", response_model=List[Module])
-async def get_all_modules():
-    """Récupère tous les modules de formation"""
+async def get_all_modules(fields: Optional[str] = Query(None, max_length=300),
+                          view: Optional[str] = Query(None, pattern="^(full|summary)$")):
+    """Récupère tous les modules de formation (`fields=` / `view=summary` pour une projection)"""
+    selected = requested_fields(fields, view, Module, MODULE_SUMMARY_FIELDS)
     try:
-        modules = await get_modules()
-        return modules
+        modules = await get_modules(selected)
+        return trusted_json(module_serializer.dump_json_list(modules, selected))
     except Exception as e:
-        logging.error(f"Error fetching modules: {e}")
+        logger.error("Error fetching modules: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la récupération des modules")
 
 @api_router.get("/modules/{module_id}", response_model=Module)
-async def get_module(module_id: int):
+async def get_module(module_id: int, fields: Optional[str] = Query(None, max_length=300),
+                     view: Optional[str] = Query(None, pattern="^(full|summary)$")):
     """Récupère un module spécifique par son ID"""
+    selected = requested_fields(fields, view, Module, MODULE_SUMMARY_FIELDS)
     try:
-        module = await get_module_by_id(module_id)
-        if not module:
+        module = await get_module_by_id(module_id, selected)
+        if module is None:
             raise HTTPException(status_code=404, detail="Module non trouvé")
-        return module
+        return trusted_json(module_serializer.dump_json(module, selected))
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error fetching module {module_id}: {e}")
+        logger.error("Error fetching module %s: %s", module_id, e)
         raise HTTPException(status_code=500, detail="Erreur lors de la récupération du module")
 
 @api_router.put("/modules/{module_id}/progress", response_model=Module)
 async def update_module_progress_endpoint(module_id: int, progress_data: ModuleProgressUpdate):
     """Met à jour la progression d'un module"""
     try:
+        previous = await get_module_by_id(module_id)
         module = await update_module_progress(
             module_id, 
             progress_data.progress, 
@@ -212,27 +364,47 @@ async def update_module_progress_endpoint(module_id: int, progress_data: ModuleP
         
         # Update user's overall progress
         await update_user_overall_progress(DEFAULT_USER_ID)
+        gained = max(0, module.get("progress", 0) - (previous or {}).get("progress", 0))
+        event_buffer.record(DEFAULT_USER_ID, PROGRESS_UPDATE, module_id, module_minutes(module) * gained / 100)
         
-        return module
+        return trusted_json(module_serializer.dump_json(module))
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error updating module progress: {e}")
+        logger.error("Error updating module progress: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la mise à jour")
 
+@api_router.get("/search", response_model=SearchResponse)
+async def search_catalog(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(10, ge=1, le=50)):
+    """Recherche dans les modules et exercices (insensible aux accents, autocomplétion)"""
+    try:
+        # Static content only (no MongoDB query while cached); the index skips a catalog
+        # it has already seen and only re-indexes modules whose text changed
+        search_index.sync(await get_catalog_content())
+        return search_index.search(q, limit)
+    except Exception as e:
+        logger.error("Error searching catalog: %s", e)
+        raise HTTPException(status_code=500, detail="Erreur lors de la recherche")
+
 # User endpoints
 @api_router.get("/user/profile", response_model=User)
-async def get_user_profile():
+async def get_user_profile(fields: Optional[str] = Query(None, max_length=300),
+                           view: Optional[str] = Query(None, pattern="^(full|summary)$")):
     """Récupère le profil de l'utilisateur actuel"""
+    selected = requested_fields(fields, view, User, USER_SUMMARY_FIELDS)
+    projected = selected
+    if selected and "currentStreak" in selected:
+        # The current streak is derived from the last activity day in the user's timezone
+        projected = selected + ("lastActivityDay", "timezone")
     try:
-        user = await get_user_by_id(DEFAULT_USER_ID)
-        if not user:
+        user = await get_user_by_id(DEFAULT_USER_ID, projected)
+        if user is None:
             raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-        return user
+        return trusted_json(user_serializer.dump_json(dict(user, currentStreak=current_streak(user)), selected))
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error fetching user profile: {e}")
+        logger.error("Error fetching user profile: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la récupération du profil")
 
 @api_router.put("/user/profile", response_model=User)
@@ -243,11 +415,13 @@ async def update_user_profile_endpoint(user_data: UserUpdate):
         user = await update_user_profile(DEFAULT_USER_ID, update_data)
         if not user:
             raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-        return user
+        if "email" in update_data:
+            await email_filter.add(update_data["email"])
+        return trusted_json(user_serializer.dump_json(dict(user, currentStreak=current_streak(user))))
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error updating user profile: {e}")
+        logger.error("Error updating user profile: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la mise à jour du profil")
 
 @api_router.get("/user/progress")
@@ -257,9 +431,45 @@ async def get_user_progress_endpoint():
         progress = await get_user_progress(DEFAULT_USER_ID)
         return progress
     except Exception as e:
-        logging.error(f"Error fetching user progress: {e}")
+        logger.error("Error fetching user progress: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la récupération de la progression")
 
+@api_router.get("/user/activity")
+async def get_user_activity_endpoint(days: int = Query(30, ge=1, le=366)):
+    """Récupère l'activité quotidienne de l'utilisateur"""
+    try:
+        return await get_user_activity(DEFAULT_USER_ID, days)
+    except Exception as e:
+        logger.error("Error fetching user activity: %s", e)
+        raise HTTPException(status_code=500, detail="Erreur lors de la récupération de l'activité")
+
+@api_router.get("/user/events")
+async def stream_user_events():
+    """Flux SSE des événements de l'utilisateur (progression, exercices, certificats, accès)"""
+    subscription = live_events.subscribe(DEFAULT_USER_ID)
+    if subscription is None:
+        raise HTTPException(status_code=503, detail="Trop de connexions, veuillez réessayer plus tard",
+                            headers={"Retry-After": "30"})
+    # The stream may stay open for hours: don't keep this request's identity map alive with it
+    close_request_scope()
+
+    async def frames():
+        try:
+            # Reconnect after 5s; the client refetches its state on reconnect
+            yield b"retry: 5000\nevent: ready\ndata: {}\n\n"
+            while True:
+                batch = await subscription.next_frames()
+                if not batch:
+                    return
+                yield b"".join(batch)
+        finally:
+            live_events.unsubscribe(subscription)
+
+    return StreamingResponse(frames(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
 # Exercise endpoints
 @api_router.get("/modules/{module_id}/exercises")
 async def get_module_exercises(module_id: int):
@@ -268,7 +478,7 @@ async def get_module_exercises(module_id: int):
         exercises = await get_exercises_by_module(module_id)
         return exercises
     except Exception as e:
-        logging.error(f"Error fetching exercises for module {module_id}: {e}")
+        logger.error("Error fetching exercises for module %s: %s", module_id, e)
         raise HTTPException(status_code=500, detail="Erreur lors de la récupération des exercices")
 
 @api_router.post("/exercises/{exercise_id}/complete")
@@ -278,22 +488,62 @@ async def complete_exercise_endpoint(exercise_id: str, completion_data: Exercise
         success = await complete_exercise(exercise_id, completion_data.completed)
         if not success:
             raise HTTPException(status_code=404, detail="Exercice non trouvé")
+        if completion_data.completed:
+            await record_activity(DEFAULT_USER_ID)
+            event_buffer.record(DEFAULT_USER_ID, EXERCISE_COMPLETION)
         return {"message": "Exercice mis à jour avec succès", "completed": completion_data.completed}
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error completing exercise {exercise_id}: {e}")
+        logger.error("Error completing exercise %s: %s", exercise_id, e)
+        raise HTTPException(status_code=500, detail="Erreur lors de la mise à jour de l'exercice")
+
+@api_router.post("/modules/{module_id}/exercises/{exercise_index}/complete", response_model=ModuleExerciseProgress)
+async def complete_module_exercise(module_id: int, exercise_index: int, completion_data: ExerciseComplete):
+    """Coche ou décoche un exercice d'un module pour l'utilisateur"""
+    try:
+        module = await get_module_by_id(module_id)
+        if not module:
+            raise HTTPException(status_code=404, detail="Module non trouvé")
+        exercise_count = len(module.get("content", {}).get("exercises", []))
+        if not 0 <= exercise_index < min(exercise_count, MAX_EXERCISES_PER_MODULE):
+            raise HTTPException(status_code=404, detail="Exercice non trouvé")
+        bitmap = await set_exercise_completion(DEFAULT_USER_ID, module_id, exercise_index, completion_data.completed)
+        exercise_progress = module_exercise_progress(module, bitmap)
+        # The module's progress/completed (modules list, dashboard) mirror the bitmap
+        total = exercise_progress["totalExercises"]
+        await update_module_progress(module_id, exercise_progress["progress"],
+                                     total > 0 and exercise_progress["completedCount"] == total)
+        # Only ticking an exercise is a learning action; unticking just lowers the totals
+        await update_user_overall_progress(DEFAULT_USER_ID, activity=completion_data.completed)
+        if completion_data.completed:
+            event_buffer.record(DEFAULT_USER_ID, EXERCISE_COMPLETION, module_id,
+                                module_minutes(module) / max(exercise_count, 1))
+        return exercise_progress
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error completing exercise %s of module %s: %s", exercise_index, module_id, e)
         raise HTTPException(status_code=500, detail="Erreur lors de la mise à jour de l'exercice")
 
+@api_router.get("/user/exercise-progress", response_model=ExerciseProgress)
+async def get_user_exercise_progress():
+    """Récupère la progression des exercices de l'utilisateur"""
+    try:
+        return await get_exercise_progress(DEFAULT_USER_ID)
+    except Exception as e:
+        logger.error("Error fetching exercise progress: %s", e)
+        raise HTTPException(status_code=500, detail="Erreur lors de la récupération de la progression")
+
 # Certificate endpoints
 @api_router.get("/certificates", response_model=List[Certificate])
 async def get_user_certificates():
     """Récupère les certificats de l'utilisateur"""
     try:
         certificates = await get_certificates(DEFAULT_USER_ID)
-        return certificates
+        return trusted_json(certificate_serializer.dump_json_list(certificates))
     except Exception as e:
-        logging.error(f"Error fetching certificates: {e}")
+        logger.error("Error fetching certificates: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la récupération des certificats")
 
 @api_router.post("/certificates/generate", response_model=Certificate)
@@ -312,53 +562,65 @@ async def generate_certificate():
             DEFAULT_USER_ID, 
             "Certificat de Formation - Confiance en Soi"
         )
-        return certificate
+        return trusted_json(certificate_serializer.dump_json(certificate))
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error generating certificate: {e}")
+        logger.error("Error generating certificate: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la génération du certificat")
 
+# Admin analytics
+@api_router.get("/admin/analytics/funnel", dependencies=[Depends(require_admin)])
+async def get_funnel_report():
+    """Entonnoir de complétion des modules, délai jusqu'au certificat et cohortes par mois d'achat"""
+    try:
+        # A full pass over users: computed by one worker at a time, shared through the cache
+        return await cache.get_or_load("analytics", "funnel", compute_funnel, ANALYTICS_CACHE_TTL_S)
+    except Exception as e:
+        logger.error("Error computing funnel report: %s", e)
+        raise HTTPException(status_code=500, detail="Erreur lors du calcul des statistiques")
+
+@api_router.get("/admin/analytics/daily", dependencies=[Depends(require_admin)])
+async def get_daily_activity_report(days: int = Query(30, ge=1, le=366)):
+    """Apprenants actifs, minutes de contenu et exercices terminés par jour (agrégats pré-calculés)"""
+    try:
+        return await get_daily_rollups(days)
+    except Exception as e:
+        logger.error("Error fetching daily rollups: %s", e)
+        raise HTTPException(status_code=500, detail="Erreur lors de la récupération des statistiques")
+
 # Stats endpoint
 @api_router.get("/stats", response_model=Stats)
 async def get_platform_stats():
     """Récupère les statistiques de la plateforme"""
     try:
         stats = await get_stats()
-        return stats
+        return trusted_json(stats_serializer.dump_json(stats))
     except Exception as e:
-        logging.error(f"Error fetching stats: {e}")
+        logger.error("Error fetching stats: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la récupération des statistiques")
 
 # Helper function to update user's overall progress
-async def update_user_overall_progress(user_id: str):
-    """Met à jour la progression globale de l'utilisateur"""
+async def update_user_overall_progress(user_id: str, activity: bool = True):
+    """Met à jour la progression globale et, pour une action d'apprentissage, la série d'activité"""
     try:
-        progress_data = await get_user_progress(user_id)
+        progress_data = await get_user_progress(user_id, include_streak=False)
         update_data = {
             "completedModules": progress_data["completedModules"],
             "totalProgress": progress_data["totalProgress"]
         }
-        await update_user_profile(user_id, update_data)
+        if activity:
+            # A progress update is a learning action: same write also advances the streak
+            await record_activity(user_id, update_data)
+        else:
+            await update_user_profile(user_id, update_data)
     except Exception as e:
-        logging.error(f"Error updating user overall progress: {e}")
+        logger.error("Error updating user overall progress: %s", e)
 
 # Include the router
 app.include_router(api_router)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-# Initialize database on startup
-@app.on_event("startup")
-async def startup_event():
-    await init_database()
-    logger.info("✅ ConfianceBoost API with Shopify integration initialized successfully")
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info("ConfianceBoost API shutting down...")
\ No newline at end of file
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -3,16 +3,24 @@ Shopify Integration for ConfianceBoost
 Handles order verification and user access management
 """
 
+import asyncio
 import hmac
 import hashlib
 import base64
 import json
 import requests
+import time
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 import os
 from pydantic import BaseModel
 import logging
+import database
+from metrics import observe_shopify_request
+from cache import cache
+from email_filter import email_filter
+from live import live_events, ACCESS
+from rate_limit import RateLimiter, RateLimitPolicy
 
 logger = logging.getLogger(__name__)
 
@@ -42,27 +50,252 @@ class ShopifyCustomer(BaseModel):
     last_name: str
     created_at: str
 
+# Outbound budget shared by every Shopify call of this process (REST Admin API: 40-request
+# bucket leaking 2/s). Request-path calls are never delayed, but they consume the budget
+# that background jobs wait on
+# Shopify's budget is per store but this limiter is per process: each of the
+# WEB_CONCURRENCY workers (uvicorn/gunicorn) gets an equal share of it
+SHOPIFY_API_WORKERS = max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))
+
+def _worker_share(policy: RateLimitPolicy, workers: int) -> RateLimitPolicy:
+    capacity = max(1, int(policy.capacity // workers))
+    return RateLimitPolicy(policy.name, capacity, capacity / (policy.refill_rate / workers))
+
+SHOPIFY_API_LIMIT = _worker_share(RateLimitPolicy.from_env('shopify_api', '40/20'), SHOPIFY_API_WORKERS)
+shopify_api_limiter = RateLimiter(SHOPIFY_API_LIMIT, max_keys=1)
+_SHOPIFY_API_KEY = "outbound"
+
+async def reserve_shopify_calls(count: int = 1) -> None:
+    """Waits until `count` calls fit in the shared Shopify budget, then consumes them"""
+    if count > SHOPIFY_API_LIMIT.capacity:
+        # The bucket never holds that many tokens: waiting would never end
+        raise ValueError(f"Cannot reserve {count} Shopify calls, the budget holds {int(SHOPIFY_API_LIMIT.capacity)}")
+    while True:
+        retry_after = shopify_api_limiter.hit(_SHOPIFY_API_KEY, cost=count)
+        if retry_after is None:
+            return
+        await asyncio.sleep(retry_after)
+
+def shopify_get(endpoint: str, url: str, headers: Dict, params: Dict, timeout: float = 10,
+                reserved: bool = False):
+    """
+    GET a Shopify Admin API endpoint, recording its latency and status
+    `reserved` marks a call already paid for with reserve_shopify_calls()
+    """
+    if not reserved:
+        shopify_api_limiter.hit(_SHOPIFY_API_KEY)
+    started = time.perf_counter()
+    status = None
+    try:
+        response = requests.get(url, headers=headers, params=params, timeout=timeout)
+        status = response.status_code
+        return response
+    finally:
+        observe_shopify_request(endpoint, status, time.perf_counter() - started)
+
+# Webhook bodies above this size are rejected before being read
+SHOPIFY_WEBHOOK_MAX_BODY_BYTES = int(os.environ.get('SHOPIFY_WEBHOOK_MAX_BODY_BYTES', str(1024 * 1024)))
+
+_webhook_keys_cache: Tuple[Tuple[str, ...], List[Any]] = ((), [])
+
+def _webhook_secrets() -> Tuple[str, ...]:
+    # Read at call time so values from .env are honoured; SHOPIFY_WEBHOOK_SECRETS is a
+    # comma-separated list so the old and new secrets are both accepted during a rotation
+    secrets = os.environ.get('SHOPIFY_WEBHOOK_SECRETS', '').split(',')
+    secrets.append(os.environ.get('SHOPIFY_WEBHOOK_SECRET', SHOPIFY_WEBHOOK_SECRET))
+    return tuple(dict.fromkeys(secret.strip() for secret in secrets if secret.strip()))
+
+def _webhook_keys() -> List[Any]:
+    """Keyed HMAC-SHA256 states, one per active secret, built once per secret set"""
+    global _webhook_keys_cache
+    secrets = _webhook_secrets()
+    if secrets != _webhook_keys_cache[0]:
+        _webhook_keys_cache = (
+            secrets, [hmac.new(secret.encode('utf-8'), digestmod=hashlib.sha256) for secret in secrets]
+        )
+    return _webhook_keys_cache[1]
+
+class WebhookVerifier:
+    """
+    Incremental HMAC verification of a webhook body against every active secret
+    Feed body chunks to update() as they arrive, then call verify().
+    """
+
+    def __init__(self, keys: List[Any]):
+        # Copying a keyed state skips re-deriving the inner/outer key pads
+        self._macs = [key.copy() for key in keys]
+
+    def update(self, chunk: bytes) -> None:
+        for mac in self._macs:
+            mac.update(chunk)
+
+    def verify(self, signature: str) -> bool:
+        try:
+            expected = base64.b64decode(signature, validate=True)
+        except (ValueError, TypeError):
+            return False
+        valid = False
+        for mac in self._macs:
+            # No early exit: timing does not reveal which secret matched
+            valid |= hmac.compare_digest(mac.digest(), expected)
+        return valid
+
+def webhook_verifier() -> Optional[WebhookVerifier]:
+    """A verifier for one webhook body, or None if no webhook secret is configured"""
+    keys = _webhook_keys()
+    if not keys:
+        logger.warning("SHOPIFY_WEBHOOK_SECRET not configured")
+        return None
+    return WebhookVerifier(keys)
+
 def verify_shopify_webhook(data: bytes, signature: str) -> bool:
     """
     Verify Shopify webhook signature
     """
-    if not SHOPIFY_WEBHOOK_SECRET:
-        logger.warning("SHOPIFY_WEBHOOK_SECRET not configured")
-        return False
-    
-    try:
-        computed_signature = base64.b64encode(
-            hmac.new(
-                SHOPIFY_WEBHOOK_SECRET.encode('utf-8'),
-                data,
-                digestmod=hashlib.sha256
-            ).digest()
-        ).decode('utf-8')
-        
-        return hmac.compare_digest(computed_signature, signature)
-    except Exception as e:
-        logger.error(f"Error verifying webhook signature: {e}")
+    verifier = webhook_verifier()
+    if verifier is None:
         return False
+    verifier.update(data)
+    return verifier.verify(signature)
+
+# Product allowlist: the Shopify products/variants that grant access, each with an access tier.
+# Products tagged SHOPIFY_PRODUCT_TAG are fetched from the Products API (tier from a
+# "confianceboost-tier:<tier>" tag) and merged with SHOPIFY_PRODUCT_TIERS / SHOPIFY_VARIANT_TIERS,
+# given as "<id>:<tier>" pairs, e.g. "7712345:premium,7712346:standard".
+SHOPIFY_PRODUCT_TAG = os.environ.get('SHOPIFY_PRODUCT_TAG', 'confianceboost')
+SHOPIFY_TIER_TAG_PREFIX = f"{SHOPIFY_PRODUCT_TAG}-tier:"
+SHOPIFY_PRODUCTS_REFRESH_S = float(os.environ.get('SHOPIFY_PRODUCTS_REFRESH_S', '900'))
+SHOPIFY_PRODUCTS_RETRY_S = 60
+# Opt-in migration aid: with an empty allowlist, grant access to any product whose name
+# contains "confiance" (the historical check). Off by default: an empty allowlist grants nothing
+SHOPIFY_LEGACY_NAME_MATCH = os.environ.get('SHOPIFY_LEGACY_NAME_MATCH', 'false').lower() in ('1', 'true', 'yes')
+DEFAULT_ACCESS_TIER = 'standard'
+# When an order holds several products, the highest tier wins
+ACCESS_TIER_RANKS = {'standard': 1, 'premium': 2, 'vip': 3}
+
+def _parse_tiers(spec: str) -> Dict[int, str]:
+    tiers = {}
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if entry:
+            item_id, _, tier = entry.partition(':')
+            try:
+                tiers[int(item_id)] = tier.strip() or DEFAULT_ACCESS_TIER
+            except ValueError:
+                # One typo must not take down every webhook and validate-access call
+                logger.error("Ignoring malformed Shopify tier entry %r (expected <id>:<tier>)", entry)
+    return tiers
+
+def _product_tier(product: Dict) -> str:
+    for tag in (product.get('tags') or '').split(','):
+        tag = tag.strip().lower()
+        if tag.startswith(SHOPIFY_TIER_TAG_PREFIX):
+            return tag[len(SHOPIFY_TIER_TAG_PREFIX):] or DEFAULT_ACCESS_TIER
+    return DEFAULT_ACCESS_TIER
+
+def fetch_shopify_products() -> Dict[str, List]:
+    """
+    Fetch the products tagged SHOPIFY_PRODUCT_TAG (blocking)
+    Returns {"products": [[id, tier], ...], "variants": [[id, tier], ...]}
+    """
+    url = f"{SHOPIFY_STORE_URL}/admin/api/2023-10/products.json"
+    headers = {
+        'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN,
+        'Content-Type': 'application/json'
+    }
+    products, variants = [], []
+    since_id = 0
+    while True:
+        params = {'fields': 'id,tags,variants', 'limit': 250, 'since_id': since_id}
+        response = shopify_get('products', url, headers, params)
+        if response.status_code != 200:
+            raise RuntimeError(f"Shopify products API returned {response.status_code}")
+        page = response.json().get('products', [])
+        for product in page:
+            tags = {tag.strip().lower() for tag in (product.get('tags') or '').split(',')}
+            if SHOPIFY_PRODUCT_TAG not in tags:
+                continue
+            tier = _product_tier(product)
+            products.append([product['id'], tier])
+            variants.extend([variant['id'], tier] for variant in product.get('variants', []))
+        if len(page) < params['limit']:
+            return {"products": products, "variants": variants}
+        since_id = page[-1]['id']
+
+async def _load_products() -> Dict[str, List]:
+    if not SHOPIFY_STORE_URL or not SHOPIFY_ACCESS_TOKEN:
+        return {"products": [], "variants": []}
+    return await asyncio.to_thread(fetch_shopify_products)
+
+def _legacy_name_match(item: Dict) -> bool:
+    return 'confiance' in item.get('name', '').lower()
+
+class ProductAllowlist:
+    """
+    Product/variant ID -> access tier, refreshed from Shopify through the shared cache
+    Lookups are dict lookups. The mapping is only rebuilt when the cached
+    Products API result changes.
+    """
+
+    def __init__(self):
+        self.products: Dict[int, str] = {}
+        self.variants: Dict[int, str] = {}
+        self._source: Optional[Dict] = None
+        self._retry_at = 0.0
+        self._warned_unconfigured = False
+
+    async def refresh(self) -> None:
+        if time.monotonic() < self._retry_at:
+            return
+        try:
+            fetched = await cache.get_or_load("shopify", "products", _load_products, SHOPIFY_PRODUCTS_REFRESH_S)
+        except Exception as e:
+            # Keep the last known mapping; don't hammer a failing API from every request
+            logger.error("Error refreshing Shopify products: %s", e)
+            self._retry_at = time.monotonic() + SHOPIFY_PRODUCTS_RETRY_S
+            if self._source is not None:
+                return
+            fetched = {"products": [], "variants": []}
+        if fetched is self._source:
+            return
+        products = {product_id: tier for product_id, tier in fetched.get("products", [])}
+        products.update(_parse_tiers(os.environ.get('SHOPIFY_PRODUCT_TIERS', '')))
+        variants = {variant_id: tier for variant_id, tier in fetched.get("variants", [])}
+        variants.update(_parse_tiers(os.environ.get('SHOPIFY_VARIANT_TIERS', '')))
+        self.products, self.variants, self._source = products, variants, fetched
+
+    def tier_for_item(self, item: Dict) -> Optional[str]:
+        """Tier granted by one line item (variant first, then product), or None"""
+        tier = self.variants.get(item.get('variant_id'))
+        if tier is None:
+            tier = self.products.get(item.get('product_id'))
+        return tier
+
+    async def tier_for_order(self, line_items: list) -> Optional[str]:
+        """Highest tier granted by an order's line items, or None if it grants no access"""
+        await self.refresh()
+        if not self.products and not self.variants:
+            # Fail closed: an unconfigured (or unreachable) catalog must not grant access to any
+            # product that merely has "confiance" in its name
+            if not self._warned_unconfigured:
+                if SHOPIFY_LEGACY_NAME_MATCH:
+                    logger.warning("No Shopify product allowlist configured, falling back to product name "
+                                   "matching (SHOPIFY_LEGACY_NAME_MATCH)")
+                else:
+                    logger.warning("No Shopify product allowlist configured: orders grant no access until "
+                                   "products are tagged %r or SHOPIFY_PRODUCT_TIERS is set", SHOPIFY_PRODUCT_TAG)
+                self._warned_unconfigured = True
+            if SHOPIFY_LEGACY_NAME_MATCH and any(_legacy_name_match(item) for item in line_items):
+                return DEFAULT_ACCESS_TIER
+            return None
+        best = None
+        for item in line_items:
+            tier = self.tier_for_item(item)
+            if tier is not None and (best is None or ACCESS_TIER_RANKS.get(tier, 0) > ACCESS_TIER_RANKS.get(best, 0)):
+                best = tier
+        return best
+
+product_allowlist = ProductAllowlist()
 
 async def verify_shopify_order(order_number: str, email: str) -> Optional[Dict]:
     """
@@ -85,7 +318,7 @@ async def verify_shopify_order(order_number: str, email: str) -> Optional[Dict]:
             'financial_status': 'paid'
         }
         
-        response = requests.get(url, headers=headers, params=params, timeout=10)
+        response = await asyncio.to_thread(shopify_get, 'orders', url, headers, params)
         
         if response.status_code == 200:
             data = response.json()
@@ -93,27 +326,61 @@ async def verify_shopify_order(order_number: str, email: str) -> Optional[Dict]:
             
             for order in orders:
                 if order.get('email', '').lower() == email.lower():
-                    # Check if order contains ConfianceBoost product
-                    line_items = order.get('line_items', [])
-                    for item in line_items:
-                        if 'confianceboost' in item.get('name', '').lower() or 'confiance' in item.get('name', '').lower():
-                            return {
-                                'order_id': order['id'],
-                                'order_number': order['name'],
-                                'email': order['email'],
-                                'customer_name': f"{order.get('billing_address', {}).get('first_name', '')} {order.get('billing_address', {}).get('last_name', '')}".strip(),
-                                'total_price': order['total_price'],
-                                'created_at': order['created_at'],
-                                'financial_status': order['financial_status'],
-                                'valid': True
-                            }
+                    # Check if order contains a ConfianceBoost product
+                    access_tier = await product_allowlist.tier_for_order(order.get('line_items', []))
+                    if access_tier is not None:
+                        return {
+                            'order_id': order['id'],
+                            'order_number': order['name'],
+                            'email': order['email'],
+                            'customer_name': f"{order.get('billing_address', {}).get('first_name', '')} {order.get('billing_address', {}).get('last_name', '')}".strip(),
+                            'total_price': order['total_price'],
+                            'created_at': order['created_at'],
+                            'financial_status': order['financial_status'],
+                            'access_tier': access_tier,
+                            'valid': True
+                        }
             
         return None
         
     except Exception as e:
-        logger.error(f"Error verifying Shopify order: {e}")
+        logger.error("Error verifying Shopify order: %s", e)
         return None
 
+def _customer_info(customer: Dict) -> Dict:
+    return {
+        'id': customer['id'],
+        'email': customer['email'],
+        'first_name': customer['first_name'],
+        'last_name': customer['last_name'],
+        'created_at': customer['created_at'],
+        'total_spent': customer.get('total_spent', '0.00'),
+        'orders_count': customer.get('orders_count', 0)
+    }
+
+def search_shopify_customers(emails: List[str], reserved: bool = False) -> Dict[str, Dict]:
+    """
+    Look up several customers with one search call (blocking)
+    Returns customer info keyed by lowercased email; unknown emails are absent.
+    Raises on API errors so callers can retry later.
+    """
+    url = f"{SHOPIFY_STORE_URL}/admin/api/2023-10/customers/search.json"
+    headers = {
+        'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN,
+        'Content-Type': 'application/json'
+    }
+    params = {'query': ' OR '.join(f'email:{email}' for email in emails), 'limit': 250}
+    response = shopify_get('customers/search', url, headers, params, reserved=reserved)
+    if response.status_code != 200:
+        raise RuntimeError(f"Shopify customer search returned {response.status_code}")
+    wanted = {email.lower() for email in emails}
+    found = {}
+    for customer in response.json().get('customers', []):
+        email = (customer.get('email') or '').lower()
+        if email in wanted and email not in found:
+            found[email] = _customer_info(customer)
+    return found
+
 async def get_shopify_customer_info(email: str) -> Optional[Dict]:
     """
     Get customer information from Shopify
@@ -122,35 +389,11 @@ async def get_shopify_customer_info(email: str) -> Optional[Dict]:
         return None
     
     try:
-        url = f"{SHOPIFY_STORE_URL}/admin/api/2023-10/customers/search.json"
-        headers = {
-            'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN,
-            'Content-Type': 'application/json'
-        }
-        params = {'query': f'email:{email}'}
-        
-        response = requests.get(url, headers=headers, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            customers = data.get('customers', [])
-            
-            if customers:
-                customer = customers[0]
-                return {
-                    'id': customer['id'],
-                    'email': customer['email'],
-                    'first_name': customer['first_name'],
-                    'last_name': customer['last_name'],
-                    'created_at': customer['created_at'],
-                    'total_spent': customer.get('total_spent', '0.00'),
-                    'orders_count': customer.get('orders_count', 0)
-                }
-        
-        return None
+        customers = await asyncio.to_thread(search_shopify_customers, [email])
+        return customers.get(email.lower())
         
     except Exception as e:
-        logger.error(f"Error getting Shopify customer info: {e}")
+        logger.error("Error getting Shopify customer info: %s", e)
         return None
 
 def format_order_number(order_input: str) -> str:
@@ -174,8 +417,6 @@ async def create_shopify_user_access(order_data: Dict) -> Dict:
     """
     Create user access based on Shopify order
     """
-    from database import users_collection
-    
     user_data = {
         "id": f"shopify_{order_data['order_id']}",
         "name": order_data['customer_name'] or "Client ConfianceBoost",
@@ -189,32 +430,46 @@ async def create_shopify_user_access(order_data: Dict) -> Dict:
         "purchase_price": order_data['total_price'],
         "purchase_date": datetime.fromisoformat(order_data['created_at'].replace('Z', '+00:00')),
         "access_type": "shopify_purchase",
+        "access_tier": order_data.get('access_tier', DEFAULT_ACCESS_TIER),
         "access_granted": True
     }
     
     # Check if user already exists
-    existing_user = await users_collection.find_one({
+    existing_query = {
         "$or": [
             {"email": order_data['email']},
             {"shopify_order_id": order_data['order_id']}
         ]
-    })
+    }
+    existing_user = await database.users_collection.find_one(existing_query)
+    if not existing_user and await database.restore_user(order_data['email'], order_data['order_id']):
+        # Returning customer whose account was moved to cold storage
+        existing_user = await database.users_collection.find_one(existing_query)
     
     if existing_user:
-        # Update existing user with Shopify data
-        await users_collection.update_one(
+        # Update existing user with Shopify data; a new order never lowers the access tier
+        access_tier = max(
+            (existing_user.get('access_tier'), user_data['access_tier']),
+            key=lambda tier: ACCESS_TIER_RANKS.get(tier, 0)
+        )
+        await database.users_collection.update_one(
             {"_id": existing_user["_id"]},
             {"$set": {
                 "shopify_order_id": order_data['order_id'],
                 "shopify_order_number": order_data['order_number'],
                 "access_granted": True,
+                "access_tier": access_tier,
                 "purchase_date": user_data['purchase_date']
             }}
         )
+        if existing_user.get('id'):
+            await live_events.publish(existing_user['id'], ACCESS, {"access_granted": True, "access_tier": access_tier})
         return existing_user
     else:
         # Create new user
-        await users_collection.insert_one(user_data)
+        await database.users_collection.insert_one(user_data)
+        await database.invalidate_stats()
+        await email_filter.add(user_data['email'])
         return user_data
 
 async def validate_shopify_access(email: str, order_number: str) -> Dict:
@@ -246,7 +501,7 @@ async def validate_shopify_access(email: str, order_number: str) -> Dict:
         }
         
     except Exception as e:
-        logger.error(f"Error validating Shopify access: {e}")
+        logger.error("Error validating Shopify access: %s", e)
         return {
             "valid": False,
             "error": "Validation error",
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+ConfianceBoost DAL Micro-Benchmarks
+Times every database.py function and the Mongo-touching Shopify helpers
+against a seeded local MongoDB, and records how many commands each call
+issues and how many documents the server examined for them. A call that
+exceeds its command or documents-examined budget fails the run, so an N+1,
+a lost index or an extra re-read is caught before production.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+from pymongo import monitoring
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+RESULTS_FILE = Path(__file__).parent / "backend_dal_benchmark_results.json"
+BENCH_DB_NAME = "confianceboost_dal_benchmark"
+SEED_MARKER = "dal_benchmark_seed"
+
+# Commands that are driver housekeeping rather than work done for the DAL
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "buildInfo", "explain"}
+# Commands whose docs-examined figure we can obtain by replaying them through explain
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+
+class CommandRecorder(monitoring.CommandListener):
+    """Collects the commands issued against the benchmark database"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.recording = False
+        self.commands: List[dict] = []
+
+    def started(self, event):
+        if not self.recording or event.database_name != BENCH_DB_NAME:
+            return
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        command = {k: v for k, v in event.command.items()
+                   if not k.startswith('$') and k not in ("lsid", "txnNumber")}
+        with self._lock:
+            self.commands.append({"name": event.command_name, "command": command})
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def reset(self) -> List[dict]:
+        with self._lock:
+            commands, self.commands = self.commands, []
+        return commands
+
+recorder = CommandRecorder()
+# Must be registered before connect_database() creates the client
+monitoring.register(recorder)
+os.environ['DB_NAME'] = BENCH_DB_NAME
+
+import archive  # noqa: E402
+import database  # noqa: E402
+import events  # noqa: E402
+import models  # noqa: E402
+import shopify_integration  # noqa: E402
+
+class Benchmark:
+    def __init__(self, name: str, call: Callable[[int], Awaitable], max_commands: int,
+                 max_docs_examined: int):
+        self.name = name
+        self.call = call
+        self.max_commands = max_commands
+        self.max_docs_examined = max_docs_examined
+
+async def docs_examined(commands: List[dict]) -> int:
+    """Replays recorded commands through explain and sums totalDocsExamined"""
+    total = 0
+    for entry in commands:
+        if entry["name"] not in EXPLAINABLE_COMMANDS:
+            continue
+        explained = await database.db.command(
+            {"explain": entry["command"], "verbosity": "executionStats"}
+        )
+        stats = explained.get("executionStats")
+        if stats is None:
+            # Aggregations report execution stats per stage
+            for stage in explained.get("stages", []):
+                cursor = stage.get("$cursor", {})
+                total += cursor.get("executionStats", {}).get("totalDocsExamined", 0)
+            continue
+        total += stats.get("totalDocsExamined", 0)
+    return total
+
+async def seed(users: int, exercises_per_module: int, certificates: int, reseed: bool):
+    meta = database.db.benchmark_meta
+    marker = await meta.find_one({"_id": SEED_MARKER})
+    wanted = {"users": users, "exercises_per_module": exercises_per_module, "certificates": certificates}
+    if marker and marker.get("volumes") == wanted and not reseed:
+        print("♻️  Reusing seeded benchmark database")
+        return
+
+    print(f"🌱 Seeding {users} users, {exercises_per_module * 6} exercises, {certificates} certificates...")
+    await database.client.drop_database(BENCH_DB_NAME)
+    await database.init_database()
+
+    batch = []
+    for n in range(users):
+        batch.append({
+            "id": f"shopify_{100000 + n}",
+            "name": f"Client {n}",
+            "email": f"client{n}@example.com",
+            "enrollmentDate": datetime.utcnow(),
+            "completedModules": n % 7,
+            "totalProgress": (n % 7) * 100 // 6,
+            "certificates": 0,
+            "shopify_order_id": 100000 + n,
+            "shopify_order_number": f"#{1000 + n}",
+            "access_type": "shopify_purchase",
+            "access_granted": True
+        })
+        if len(batch) == 10000:
+            await database.users_collection.insert_many(batch)
+            batch = []
+    if batch:
+        await database.users_collection.insert_many(batch)
+
+    exercises = [
+        {"id": f"ex-{module_id}-{n}", "moduleId": module_id, "description": f"Exercice {n}",
+         "completed": False, "completedAt": None}
+        for module_id in range(1, 7) for n in range(exercises_per_module)
+    ]
+    if exercises:
+        await database.exercises_collection.insert_many(exercises)
+
+    certs = [
+        {"id": f"cert-{n}", "userId": f"shopify_{100000 + n}", "title": "Certificat de Formation - Confiance en Soi",
+         "completedAt": datetime.utcnow(), "downloadUrl": f"/api/certificates/shopify_{100000 + n}/download"}
+        for n in range(certificates)
+    ]
+    if certs:
+        await database.certificates_collection.insert_many(certs)
+
+    await meta.replace_one({"_id": SEED_MARKER}, {"_id": SEED_MARKER, "volumes": wanted}, upsert=True)
+
+def build_benchmarks(users: int) -> List[Benchmark]:
+    def user_id(i: int) -> str:
+        return f"shopify_{100000 + (i * 7919) % users}"
+
+    def order(i: int, offset: int = 0) -> Dict:
+        n = (i * 7919) % users
+        return {
+            "order_id": 100000 + n + offset,
+            "order_number": f"#{1000 + n}",
+            "email": f"client{n}@example.com" if not offset else f"new{i}-{offset}@example.com",
+            "customer_name": f"Client {n}",
+            "total_price": "97.00",
+            "created_at": "2025-01-15T10:00:00Z",
+            "financial_status": "paid"
+        }
+
+    event_buffer = events.LearningEventBuffer()
+
+    async def flush_events(i: int):
+        for n in range(10):
+            kind = events.EXERCISE_COMPLETION if n % 2 else events.PROGRESS_UPDATE
+            event_buffer.record(user_id(i), kind, n % 6 + 1, 5.0)
+        return await event_buffer.flush()
+
+    async def archive_user(i: int):
+        # The restore benchmark below brings the same users back
+        user = await database.users_collection.find_one({"id": user_id(i)})
+        return await archive._archive_batch([user], datetime.utcnow())
+
+    return [
+        Benchmark("database.init_database (warm)", lambda i: database.init_database(), 1, 1),
+        # A cold cache loads the static content once; progress/completed are read on every call
+        Benchmark("database.get_modules", lambda i: database.get_modules(), 2, 12),
+        Benchmark("database.get_modules (summary)",
+                  lambda i: database.get_modules(models.MODULE_SUMMARY_FIELDS), 2, 12),
+        Benchmark("database.get_module_by_id", lambda i: database.get_module_by_id(i % 6 + 1), 1, 6),
+        Benchmark("database.update_module_progress",
+                  lambda i: database.update_module_progress(i % 6 + 1, i % 101, False), 1, 1),
+        Benchmark("database.get_user_by_id", lambda i: database.get_user_by_id(user_id(i)), 1, 1),
+        Benchmark("database.get_user_by_id (summary)",
+                  lambda i: database.get_user_by_id(user_id(i), models.USER_SUMMARY_FIELDS), 1, 1),
+        Benchmark("database.update_user_profile",
+                  lambda i: database.update_user_profile(user_id(i), {"name": f"Client {i}"}), 1, 1),
+        # Streak and lastActivity in one pipeline update
+        Benchmark("database.record_activity",
+                  lambda i: database.record_activity(user_id(i), {"name": f"Client {i}"}), 1, 1),
+        # Module state plus the user's streak, read concurrently: one round trip of latency
+        Benchmark("database.get_user_progress", lambda i: database.get_user_progress(user_id(i)), 2, 7),
+        Benchmark("database.get_user_progress (no streak)",
+                  lambda i: database.get_user_progress(user_id(i), include_streak=False), 1, 6),
+        Benchmark("database.get_exercises_by_module",
+                  lambda i: database.get_exercises_by_module(i % 6 + 1), 1, 100),
+        Benchmark("database.complete_exercise",
+                  lambda i: database.complete_exercise(f"ex-{i % 6 + 1}-0", bool(i % 2)), 1, 1),
+        Benchmark("database.set_exercise_completion",
+                  lambda i: database.set_exercise_completion(user_id(i), i % 6 + 1, i % 5, True), 1, 1),
+        Benchmark("database.get_exercise_completion",
+                  lambda i: database.get_exercise_completion(user_id(i)), 1, 1),
+        # The catalog (as get_modules) plus the user's bitmaps
+        Benchmark("database.get_exercise_progress",
+                  lambda i: database.get_exercise_progress(user_id(i)), 3, 13),
+        Benchmark("database.get_certificates", lambda i: database.get_certificates(user_id(i)), 1, 1),
+        Benchmark("database.create_certificate",
+                  lambda i: database.create_certificate(user_id(i), "Certificat de Formation - Confiance en Soi"), 1, 0),
+        Benchmark("database.get_stats", lambda i: database.get_stats(), 2, 0),
+        # Ten buffered events for one user: one bucket upsert and one rollup upsert
+        Benchmark("events.LearningEventBuffer.flush", flush_events, 2, 2),
+        Benchmark("shopify_integration.create_shopify_user_access (existing)",
+                  lambda i: shopify_integration.create_shopify_user_access(order(i)), 2, 3),
+        Benchmark("shopify_integration.create_shopify_user_access (new)",
+                  lambda i: shopify_integration.create_shopify_user_access(order(i, offset=10_000_000)), 2, 0),
+        Benchmark("database.get_user_by_email", lambda i: database.get_user_by_email(order(i)["email"]), 1, 1),
+        # Read, snapshot certificates and bitmap, write the archive, delete the snapshot
+        Benchmark("archive._archive_batch (1 user)", archive_user, 8, 8),
+        Benchmark("database.restore_users_by_id", lambda i: database.restore_users_by_id([user_id(i)]), 5, 2),
+    ]
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+async def run_benchmark(benchmark: Benchmark, iterations: int) -> Dict:
+    # One instrumented call to measure query shape, then timed iterations
+    recorder.reset()
+    recorder.recording = True
+    await benchmark.call(0)
+    recorder.recording = False
+    commands = recorder.reset()
+    examined = await docs_examined(commands)
+
+    timings = []
+    for i in range(1, iterations + 1):
+        started = time.perf_counter()
+        await benchmark.call(i)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    failures = []
+    if len(commands) > benchmark.max_commands:
+        failures.append(f"{len(commands)} commands > budget {benchmark.max_commands}")
+    if examined > benchmark.max_docs_examined:
+        failures.append(f"{examined} docs examined > budget {benchmark.max_docs_examined}")
+
+    return {
+        "iterations": iterations,
+        "mean_ms": round(statistics.mean(timings) * 1000, 3),
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "commands": len(commands),
+        "command_names": [c["name"] for c in commands],
+        "docs_examined": examined,
+        "max_commands": benchmark.max_commands,
+        "max_docs_examined": benchmark.max_docs_examined,
+        "success": not failures,
+        "failures": failures
+    }
+
+async def run(args) -> Dict:
+    await database.connect_database()
+    await seed(args.users, args.exercises_per_module, args.certificates, args.reseed)
+    benchmarks = build_benchmarks(args.users)
+    if args.only:
+        benchmarks = [b for b in benchmarks if any(name in b.name for name in args.only)]
+
+    results = {}
+    for benchmark in benchmarks:
+        result = await run_benchmark(benchmark, args.iterations)
+        results[benchmark.name] = result
+        status = "✅ PASS" if result["success"] else "❌ FAIL"
+        print(f"{status} {benchmark.name}")
+        print(f"   p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms, "
+              f"{result['commands']} commands ({', '.join(result['command_names']) or '-'}), "
+              f"{result['docs_examined']} docs examined")
+        for failure in result["failures"]:
+            print(f"   Budget exceeded: {failure}")
+    return results
+
+def main():
+    """Main benchmark execution"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--exercises-per-module", type=int, default=50)
+    parser.add_argument("--certificates", type=int, default=20_000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--reseed", action="store_true", help="drop and reseed the benchmark database")
+    parser.add_argument("--only", action="append", help="run benchmarks whose name contains this text")
+    parser.add_argument("--output", type=Path, default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    passed = sum(1 for r in results.values() if r["success"])
+
+    print("=" * 60)
+    print("📊 DAL BENCHMARK SUMMARY")
+    print(f"✅ Within budget: {passed}/{len(results)}")
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            "summary": {
+                "passed": passed,
+                "total": len(results),
+                "users": args.users,
+                "timestamp": datetime.now().isoformat()
+            },
+            "benchmarks": results
+        }, f, indent=2)
+    print(f"\n📄 Detailed results saved to: {args.output}")
+
+    sys.exit(0 if passed == len(results) else 1)
+
+if __name__ == "__main__":
+    main()
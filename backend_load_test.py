@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+ConfianceBoost Backend Load Benchmark
+Drives the ASGI app in-process with concurrent clients and weighted request
+mixes, against local MongoDB/Shopify stand-ins, and reports per-endpoint
+latency percentiles and throughput
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from backend_stand_ins import install_stand_ins
+
+# Measure capacity, not the abuse limits: every simulated client shares one IP
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+RESULTS_FILE = Path(__file__).parent / "backend_load_results.json"
+SEEDED_ORDERS = 500
+
+# (weight, endpoint label, request builder) - builders return (method, path, json body)
+RequestSpec = Tuple[int, str, Callable[[random.Random], Tuple[str, str, Optional[dict]]]]
+
+def _order(rng: random.Random) -> int:
+    return 1000 + rng.randrange(SEEDED_ORDERS)
+
+SCENARIOS: Dict[str, List[RequestSpec]] = {
+    # Launch day: buyers arrive from the order confirmation email all at once
+    "launch-storm": [
+        (70, "POST /api/shopify/validate-access", lambda rng: (
+            "POST", "/api/shopify/validate-access",
+            (lambda n: {"email": f"client{n}@example.com", "order_number": str(n)})(_order(rng))
+        )),
+        (10, "GET /api/shopify/user/{email}", lambda rng: (
+            "GET", f"/api/shopify/user/client{_order(rng)}@example.com", None
+        )),
+        (15, "GET /api/modules", lambda rng: ("GET", "/api/modules", None)),
+        (5, "GET /api/stats", lambda rng: ("GET", "/api/stats", None)),
+    ],
+    # Steady state: learners working through modules from the dashboard
+    "dashboard": [
+        (30, "GET /api/modules", lambda rng: ("GET", "/api/modules", None)),
+        (15, "GET /api/modules/{module_id}", lambda rng: ("GET", f"/api/modules/{rng.randint(1, 6)}", None)),
+        (15, "GET /api/user/profile", lambda rng: ("GET", "/api/user/profile", None)),
+        (15, "GET /api/user/progress", lambda rng: ("GET", "/api/user/progress", None)),
+        (5, "GET /api/stats", lambda rng: ("GET", "/api/stats", None)),
+        (5, "GET /api/certificates", lambda rng: ("GET", "/api/certificates", None)),
+        (15, "PUT /api/modules/{module_id}/progress", lambda rng: (
+            "PUT", f"/api/modules/{rng.randint(1, 6)}/progress",
+            {"progress": rng.randint(0, 100), "completed": rng.random() < 0.2}
+        )),
+    ],
+}
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+class LoadBenchmark:
+    def __init__(self, app, concurrency: int, duration: float, seed: int):
+        self.app = app
+        self.concurrency = concurrency
+        self.duration = duration
+        self.seed = seed
+
+    async def run_scenario(self, name: str, mix: List[RequestSpec]) -> Dict:
+        latencies: Dict[str, List[float]] = {}
+        statuses: Dict[str, Dict[str, int]] = {}
+        weights = [spec[0] for spec in mix]
+        transport = httpx.ASGITransport(app=self.app)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            deadline = time.perf_counter() + self.duration
+
+            async def worker(worker_id: int):
+                rng = random.Random(self.seed * 1000 + worker_id)
+                while time.perf_counter() < deadline:
+                    _, label, build = rng.choices(mix, weights=weights)[0]
+                    method, path, body = build(rng)
+                    started = time.perf_counter()
+                    response = await client.request(method, path, json=body)
+                    elapsed = time.perf_counter() - started
+                    latencies.setdefault(label, []).append(elapsed)
+                    codes = statuses.setdefault(label, {})
+                    codes[str(response.status_code)] = codes.get(str(response.status_code), 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(i) for i in range(self.concurrency)))
+            wall_time = time.perf_counter() - started
+
+        endpoints = {}
+        for label, values in sorted(latencies.items()):
+            values.sort()
+            endpoints[label] = {
+                "requests": len(values),
+                "rps": round(len(values) / wall_time, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p95_ms": round(percentile(values, 95) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+                "status_codes": statuses[label]
+            }
+        total = sum(e["requests"] for e in endpoints.values())
+        return {
+            "concurrency": self.concurrency,
+            "duration_s": round(wall_time, 3),
+            "total_requests": total,
+            "total_rps": round(total / wall_time, 2),
+            "endpoints": endpoints
+        }
+
+def compare_with_baseline(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Lists endpoints whose p95 latency regressed by more than `tolerance` (fraction)"""
+    regressions = []
+    for scenario, data in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(scenario, {}).get("endpoints", {})
+        for label, stats in data["endpoints"].items():
+            before = previous.get(label)
+            if before and before["p95_ms"] > 0 and stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{scenario} / {label}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms"
+                )
+    return regressions
+
+async def prepare_app(mongo_latency: float, shopify_latency: float):
+    _, shopify = install_stand_ins(mongo_latency=mongo_latency, shopify_latency=shopify_latency)
+    for n in range(1000, 1000 + SEEDED_ORDERS):
+        shopify.add_order(str(n), f"client{n}@example.com")
+
+    from server import app
+    from database import init_database
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    await init_database()
+    return app
+
+def print_report(name: str, data: Dict):
+    print(f"📊 Scenario: {name} ({data['concurrency']} clients, {data['duration_s']}s, {data['total_rps']} req/s)")
+    print(f"   {'endpoint':<42} {'reqs':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for label, stats in data["endpoints"].items():
+        print(f"   {label:<42} {stats['requests']:>7} {stats['rps']:>9} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+    print()
+
+async def run(args) -> Dict:
+    app = await prepare_app(args.mongo_latency, args.shopify_latency)
+    benchmark = LoadBenchmark(app, args.concurrency, args.duration, args.seed)
+    names = args.scenario or list(SCENARIOS)
+
+    scenarios = {}
+    for name in names:
+        scenarios[name] = await benchmark.run_scenario(name, SCENARIOS[name])
+        print_report(name, scenarios[name])
+
+    return {
+        "summary": {
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "mongo_latency_ms": args.mongo_latency * 1000,
+            "shopify_latency_ms": args.shopify_latency * 1000,
+            "timestamp": datetime.now().isoformat()
+        },
+        "scenarios": scenarios
+    }
+
+def main():
+    """Main benchmark execution"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-latency", type=float, default=0.0005, help="seconds per Mongo round trip")
+    parser.add_argument("--shopify-latency", type=float, default=0.08, help="seconds per Shopify API call")
+    parser.add_argument("--output", type=Path, default=RESULTS_FILE)
+    parser.add_argument("--baseline", type=Path, help="previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 regression (fraction)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"📄 Load benchmark results saved to: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("⚠️  Latency regressions against baseline:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print("🎉 No p95 regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+ConfianceBoost Response Serialization Benchmark
+Compares, per endpoint payload, FastAPI's default response_model path
+(validate the returned documents, convert them to jsonable data, json.dumps)
+with the trusted serializers used for documents read from our own database.
+Both paths must produce the same JSON; only the time per response differs.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from migrations import DEFAULT_MODULES  # noqa: E402
+from models import (  # noqa: E402
+    Certificate, Module, User, certificate_serializer, module_serializer, user_serializer
+)
+
+RESULTS_FILE = Path(__file__).parent / "backend_serialization_benchmark_results.json"
+
+def module_documents(count: int) -> List[Dict]:
+    documents = []
+    for i in range(count):
+        module = dict(DEFAULT_MODULES[i % len(DEFAULT_MODULES)], id=i + 1, progress=i % 101)
+        documents.append(dict(module, _id=uuid.uuid4().hex))
+    return documents
+
+def certificate_documents(count: int) -> List[Dict]:
+    now = datetime.utcnow()
+    return [{
+        "_id": uuid.uuid4().hex,
+        "id": str(uuid.uuid4()),
+        "userId": "demo-user-1",
+        "title": "Certificat de Formation - Confiance en Soi",
+        "completedAt": now - timedelta(days=i),
+        "downloadUrl": f"/api/certificates/{i}/download"
+    } for i in range(count)]
+
+def user_document() -> Dict:
+    return {
+        "_id": uuid.uuid4().hex,
+        "id": "demo-user-1",
+        "name": "Utilisateur Demo",
+        "email": "demo@confianceboost.fr",
+        "enrollmentDate": datetime.utcnow(),
+        "completedModules": 3,
+        "totalProgress": 50,
+        "certificates": 0,
+        "timezone": "Europe/Paris",
+        "currentStreak": 4,
+        "longestStreak": 9,
+        "lastActivity": datetime.utcnow(),
+        "shopify_order_id": 450789469,
+        "access_granted": True
+    }
+
+def default_path(response_type) -> Callable[[object], Awaitable[bytes]]:
+    field = create_response_field(name=f"Response_{getattr(response_type, '__name__', 'list')}", type_=response_type)
+
+    async def render(content) -> bytes:
+        jsonable = await serialize_response(field=field, response_content=content)
+        return JSONResponse(jsonable).body
+    return render
+
+async def time_per_call(render: Callable, content, iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        body = render(content)
+        if asyncio.iscoroutine(body):
+            await body
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    return samples
+
+async def run(iterations: int, modules: int, certificates: int) -> List[Dict]:
+    cases = [
+        ("GET /api/modules", List[Module], module_serializer.dump_json_list, module_documents(len(DEFAULT_MODULES))),
+        (f"GET /api/modules ({modules} modules)", List[Module], module_serializer.dump_json_list,
+         module_documents(modules)),
+        (f"GET /api/certificates ({certificates} certificates)", List[Certificate],
+         certificate_serializer.dump_json_list, certificate_documents(certificates)),
+        ("GET /api/user/profile", User, user_serializer.dump_json, user_document()),
+    ]
+    results = []
+    for name, response_type, trusted, content in cases:
+        default = default_path(response_type)
+        if json.loads(await default(content)) != json.loads(trusted(content)):
+            raise AssertionError(f"{name}: trusted serializer output differs from response_model output")
+        default_us = statistics.median(await time_per_call(default, content, iterations))
+        trusted_us = statistics.median(await time_per_call(trusted, content, iterations))
+        results.append({
+            "name": name,
+            "response_model_us": round(default_us, 1),
+            "trusted_us": round(trusted_us, 1),
+            "saved_us": round(default_us - trusted_us, 1),
+            "speedup": round(default_us / trusted_us, 2) if trusted_us else None,
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--modules", type=int, default=60)
+    parser.add_argument("--certificates", type=int, default=50)
+    parser.add_argument("--output", type=Path, default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.iterations, args.modules, args.certificates))
+    print("=" * 60)
+    print("📊 SERIALIZATION BENCHMARK (median per response)")
+    for result in results:
+        print(f"⚡ {result['name']}")
+        print(f"   response_model {result['response_model_us']}µs, trusted {result['trusted_us']}µs "
+              f"(-{result['saved_us']}µs, x{result['speedup']})")
+
+    with open(args.output, "w") as f:
+        json.dump({"timestamp": datetime.now().isoformat(), "iterations": args.iterations,
+                   "results": results}, f, indent=2)
+    print(f"\n📄 Detailed results saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,641 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for MongoDB and Shopify
+Lets the ConfianceBoost backend run without a database server or store
+credentials, e.g. for load benchmarks. Simulated latencies keep the await
+points and blocking calls where the real dependencies put them.
+"""
+
+import asyncio
+import copy
+import json
+import sys
+import time
+from datetime import timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateMany
+from pymongo.errors import DuplicateKeyError
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+_MISSING = object()
+
+def _get_path(document: dict, path: str) -> Any:
+    value = document
+    for part in path.split('.'):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _MISSING
+    return value
+
+def _set_path(document: dict, path: str, value: Any) -> None:
+    parts = path.split('.')
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+def _unset_path(document: dict, path: str) -> None:
+    parts = path.split('.')
+    for part in parts[:-1]:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(parts[-1], None)
+
+def _compare(value: Any, operator: str, operand: Any) -> bool:
+    if operator == '$eq':
+        return value is not _MISSING and value == operand or (value is _MISSING and operand is None)
+    if operator == '$ne':
+        return not _compare(value, '$eq', operand)
+    if operator == '$in':
+        return value is not _MISSING and value in operand or (value is _MISSING and None in operand)
+    if operator == '$nin':
+        return not _compare(value, '$in', operand)
+    if operator == '$exists':
+        return (value is not _MISSING) == bool(operand)
+    if value is _MISSING or value is None:
+        return False
+    if operator == '$gt':
+        return value > operand
+    if operator == '$gte':
+        return value >= operand
+    if operator == '$lt':
+        return value < operand
+    if operator == '$lte':
+        return value <= operand
+    raise NotImplementedError(f"Unsupported query operator {operator}")
+
+def matches(document: dict, query: Optional[dict]) -> bool:
+    """Evaluates the subset of the MongoDB query language used by the backend"""
+    for key, condition in (query or {}).items():
+        if key == '$or':
+            if not any(matches(document, sub) for sub in condition):
+                return False
+        elif key == '$and':
+            if not all(matches(document, sub) for sub in condition):
+                return False
+        elif key == '$expr':
+            if not _expression(condition, document):
+                return False
+        else:
+            value = _get_path(document, key)
+            if isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+                if not all(_compare(value, op, operand) for op, operand in condition.items()):
+                    return False
+            elif not _compare(value, '$eq', condition):
+                return False
+    return True
+
+def project(document: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(document)
+    include_id = projection.get('_id', 1)
+    fields = {k: v for k, v in projection.items() if k != '_id'}
+    if fields and all(fields.values()):
+        result = {}
+        for path in fields:
+            value = _get_path(document, path)
+            if value is not _MISSING:
+                _set_path(result, path, copy.deepcopy(value))
+        if include_id and '_id' in document:
+            result['_id'] = document['_id']
+        return result
+    result = copy.deepcopy(document)
+    for path in fields:
+        _unset_path(result, path)
+    if not include_id:
+        result.pop('_id', None)
+    return result
+
+# Evaluated lazily: documents compare for equality but not for order
+_COMPARISONS = {'$eq': lambda a, b: a == b, '$ne': lambda a, b: a != b, '$gt': lambda a, b: a > b,
+                '$gte': lambda a, b: a >= b, '$lt': lambda a, b: a < b, '$lte': lambda a, b: a <= b}
+
+def _expression(expression: Any, document: dict) -> Any:
+    """Aggregation expressions used by the backend's pipeline updates"""
+    if expression == '$$ROOT':
+        return document
+    if isinstance(expression, str) and expression.startswith('$'):
+        value = _get_path(document, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, list):
+        return [_expression(e, document) for e in expression]
+    if not isinstance(expression, dict) or len(expression) != 1 or not next(iter(expression)).startswith('$'):
+        return expression
+    (operator, operand), = expression.items()
+    if operator == '$literal':
+        return operand
+    if operator == '$switch':
+        for branch in operand['branches']:
+            if _expression(branch['case'], document):
+                return _expression(branch['then'], document)
+        return _expression(operand['default'], document)
+    if operator == '$dateDiff':
+        from zoneinfo import ZoneInfo
+        tz = ZoneInfo(_expression(operand.get('timezone', 'UTC'), document))
+        start, end = (_expression(operand[k], document).replace(tzinfo=timezone.utc).astimezone(tz).date()
+                      for k in ('startDate', 'endDate'))
+        assert operand['unit'] == 'day'
+        return (end - start).days
+    args = _expression(operand, document)
+    if operator == '$ifNull':
+        return next((a for a in args if a is not None), None)
+    if operator in ('$max', '$min'):
+        values = [a for a in args if a is not None]
+        return (max if operator == '$max' else min)(values) if values else None
+    if operator == '$add':
+        return sum(args)
+    if operator == '$subtract':
+        return None if None in args else args[0] - args[1]
+    if operator in ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte'):
+        # BSON ordering puts null below numbers and dates
+        left, right = ((float('-inf') if a is None else a) for a in args)
+        return _COMPARISONS[operator](left, right)
+    raise NotImplementedError(f"Unsupported expression operator {operator}")
+
+def _apply_pipeline(document: dict, pipeline: List[dict]) -> None:
+    for stage in pipeline:
+        (operator, spec), = stage.items()
+        if operator in ('$set', '$addFields'):
+            values = {path: _expression(value, document) for path, value in spec.items()}
+            for path, value in values.items():
+                _set_path(document, path, value)
+        elif operator == '$unset':
+            for path in [spec] if isinstance(spec, str) else spec:
+                _unset_path(document, path)
+        else:
+            raise NotImplementedError(f"Unsupported pipeline update stage {operator}")
+
+def apply_update(document: dict, update, inserting: bool = False) -> None:
+    if isinstance(update, list):
+        _apply_pipeline(document, update)
+        return
+    for operator, fields in update.items():
+        if operator == '$setOnInsert':
+            if inserting:
+                for path, value in fields.items():
+                    _set_path(document, path, copy.deepcopy(value))
+        elif operator == '$set':
+            for path, value in fields.items():
+                _set_path(document, path, copy.deepcopy(value))
+        elif operator == '$unset':
+            for path in fields:
+                _unset_path(document, path)
+        elif operator == '$inc':
+            for path, amount in fields.items():
+                current = _get_path(document, path)
+                _set_path(document, path, (0 if current is _MISSING else current) + amount)
+        elif operator in ('$max', '$min'):
+            for path, value in fields.items():
+                current = _get_path(document, path)
+                if current is _MISSING or (value > current if operator == '$max' else value < current):
+                    _set_path(document, path, value)
+        elif operator == '$push':
+            for path, value in fields.items():
+                current = _get_path(document, path)
+                _set_path(document, path, ([] if current is _MISSING else current) + [copy.deepcopy(value)])
+        elif operator == '$addToSet':
+            for path, value in fields.items():
+                current = _get_path(document, path)
+                current = [] if current is _MISSING else list(current)
+                for item in value['$each'] if isinstance(value, dict) and '$each' in value else [value]:
+                    if item not in current:
+                        current.append(copy.deepcopy(item))
+                _set_path(document, path, current)
+        elif operator == '$bit':
+            for path, bitwise in fields.items():
+                current = _get_path(document, path)
+                current = 0 if current is _MISSING else current
+                for op, operand in bitwise.items():
+                    if op == 'or':
+                        current |= operand
+                    elif op == 'and':
+                        current &= operand
+                    elif op == 'xor':
+                        current ^= operand
+                _set_path(document, path, current)
+        else:
+            raise NotImplementedError(f"Unsupported update operator {operator}")
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+class UpdateResult:
+    def __init__(self, matched_count: int, modified_count: int, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+
+class DeleteResult:
+    def __init__(self, deleted_count: int):
+        self.deleted_count = deleted_count
+
+class BulkWriteResult:
+    def __init__(self):
+        self.inserted_count = 0
+        self.deleted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.upserted_count = 0
+        self.upserted_ids: Dict[int, Any] = {}
+
+def _evaluate(expression: Any, document: dict) -> Any:
+    if isinstance(expression, str) and expression.startswith('$'):
+        value = _get_path(document, expression[1:])
+        return None if value is _MISSING else value
+    return expression
+
+def _sort_documents(documents: List[dict], keys: List[Tuple[str, int]]) -> None:
+    # Like MongoDB, missing and null values sort before any other value
+    for key, direction in reversed(keys):
+        documents.sort(key=lambda d: (0, 0) if _get_path(d, key) in (_MISSING, None) else (1, _get_path(d, key)),
+                       reverse=direction < 0)
+
+def _group(documents: List[dict], spec: dict) -> List[dict]:
+    groups: Dict[Any, dict] = {}
+    for document in documents:
+        key = _evaluate(spec['_id'], document)
+        if isinstance(spec['_id'], dict):
+            key = tuple(sorted((k, _evaluate(v, document)) for k, v in spec['_id'].items()))
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {'_id': dict(key) if isinstance(key, tuple) else key}
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            (operator, operand), = accumulator.items()
+            value = _evaluate(operand, document)
+            if operator == '$sum':
+                group[field] = group.get(field, 0) + (value or 0)
+            elif operator == '$push':
+                group.setdefault(field, []).append(value)
+            elif operator == '$addToSet':
+                values = group.setdefault(field, [])
+                if value not in values:
+                    values.append(value)
+            elif operator == '$first':
+                group.setdefault(field, value)
+            elif operator in ('$max', '$min'):
+                current = group.get(field)
+                if current is None or (value is not None and (value > current if operator == '$max' else value < current)):
+                    group[field] = value
+            else:
+                raise NotImplementedError(f"Unsupported accumulator {operator}")
+    return list(groups.values())
+
+class InMemoryAggregation:
+    """$match, $group, $sort, $limit and $project pipelines"""
+
+    def __init__(self, collection: 'InMemoryCollection', pipeline: List[dict]):
+        self._collection = collection
+        self._pipeline = pipeline
+
+    async def to_list(self, length: Optional[int]):
+        await self._collection.database.round_trip()
+        documents = [copy.deepcopy(d) for d in self._collection.documents]
+        for stage in self._pipeline:
+            (operator, spec), = stage.items()
+            if operator == '$match':
+                documents = [d for d in documents if matches(d, spec)]
+            elif operator == '$group':
+                documents = _group(documents, spec)
+            elif operator == '$sort':
+                _sort_documents(documents, list(spec.items()))
+            elif operator == '$limit':
+                documents = documents[:spec]
+            elif operator == '$project':
+                documents = [project(d, spec) for d in documents]
+            else:
+                raise NotImplementedError(f"Unsupported pipeline stage {operator}")
+        return documents[:length] if length else documents
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in await self.to_list(None):
+            yield document
+
+class InMemoryCursor:
+    def __init__(self, collection: 'InMemoryCollection', query: Optional[dict], projection: Optional[dict]):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = None
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1):
+        self._sort = key if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    async def _results(self) -> List[dict]:
+        await self._collection.database.round_trip()
+        documents = [d for d in self._collection.documents if matches(d, self._query)]
+        _sort_documents(documents, self._sort or [])
+        if self._limit:
+            documents = documents[:self._limit]
+        return [project(d, self._projection) for d in documents]
+
+    async def to_list(self, length: Optional[int]):
+        documents = await self._results()
+        return documents[:length] if length else documents
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in await self._results():
+            yield document
+
+class InMemoryCollection:
+    """The subset of AsyncIOMotorCollection the backend relies on"""
+
+    def __init__(self, database: 'InMemoryDatabase', name: str):
+        self.database = database
+        self.name = name
+        self.documents: List[dict] = []
+        self._next_id = 1
+
+    def _new_id(self) -> str:
+        object_id = f"{self.name}-{self._next_id}"
+        self._next_id += 1
+        return object_id
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None, **kwargs):
+        return InMemoryCursor(self, query, projection)
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None, **kwargs):
+        await self.database.round_trip()
+        for document in self.documents:
+            if matches(document, query):
+                return project(document, projection)
+        return None
+
+    async def count_documents(self, query: dict, **kwargs) -> int:
+        await self.database.round_trip()
+        return sum(1 for d in self.documents if matches(d, query))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        await self.database.round_trip()
+        return len(self.documents)
+
+    def _insert(self, document: dict) -> None:
+        document.setdefault('_id', self._new_id())
+        if any(existing['_id'] == document['_id'] for existing in self.documents):
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}")
+        self.documents.append(copy.deepcopy(document))
+
+    async def insert_one(self, document: dict, **kwargs):
+        await self.database.round_trip()
+        self._insert(document)
+        return InsertOneResult(document['_id'])
+
+    async def insert_many(self, documents: List[dict], **kwargs):
+        await self.database.round_trip()
+        for document in documents:
+            self._insert(document)
+
+    def _upsert(self, query: dict, update: dict) -> dict:
+        document = {k: v for k, v in query.items() if not k.startswith('$') and not isinstance(v, dict)}
+        apply_update(document, update, inserting=True)
+        self._insert(document)
+        return self.documents[-1]
+
+    def _update(self, query: dict, update: dict, upsert: bool, many: bool) -> UpdateResult:
+        matched = modified = 0
+        for document in self.documents:
+            if matches(document, query):
+                before = copy.deepcopy(document)
+                apply_update(document, update)
+                matched += 1
+                modified += document != before
+                if not many:
+                    break
+        if not matched and upsert:
+            return UpdateResult(0, 0, self._upsert(query, update)['_id'])
+        return UpdateResult(matched, modified)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False, **kwargs):
+        await self.database.round_trip()
+        return self._update(query, update, upsert, many=False)
+
+    async def update_many(self, query: dict, update: dict, upsert: bool = False, **kwargs):
+        await self.database.round_trip()
+        return self._update(query, update, upsert, many=True)
+
+    def _replace(self, query: dict, replacement: dict, upsert: bool) -> UpdateResult:
+        for index, document in enumerate(self.documents):
+            if matches(document, query):
+                replaced = dict(copy.deepcopy(replacement), _id=document['_id'])
+                self.documents[index] = replaced
+                return UpdateResult(1, int(replaced != document))
+        if upsert:
+            document = copy.deepcopy(replacement)
+            self._insert(document)
+            return UpdateResult(0, 0, document['_id'])
+        return UpdateResult(0, 0)
+
+    async def replace_one(self, query: dict, replacement: dict, upsert: bool = False, **kwargs):
+        await self.database.round_trip()
+        return self._replace(query, replacement, upsert)
+
+    async def find_one_and_update(self, query: dict, update: dict, projection: Optional[dict] = None,
+                                  upsert: bool = False, return_document: bool = False, **kwargs):
+        await self.database.round_trip()
+        for document in self.documents:
+            if matches(document, query):
+                before = project(document, projection)
+                apply_update(document, update)
+                return project(document, projection) if return_document else before
+        if upsert:
+            document = self._upsert(query, update)
+            return project(document, projection) if return_document else None
+        return None
+
+    async def delete_one(self, query: dict, **kwargs):
+        await self.database.round_trip()
+        for index, document in enumerate(self.documents):
+            if matches(document, query):
+                del self.documents[index]
+                return DeleteResult(1)
+        return DeleteResult(0)
+
+    async def delete_many(self, query: dict, **kwargs):
+        await self.database.round_trip()
+        kept = [d for d in self.documents if not matches(d, query)]
+        deleted = len(self.documents) - len(kept)
+        self.documents = kept
+        return DeleteResult(deleted)
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs):
+        await self.database.round_trip()
+        result = BulkWriteResult()
+        for index, request in enumerate(requests):
+            if isinstance(request, DeleteOne):
+                for position, document in enumerate(self.documents):
+                    if matches(document, request._filter):
+                        del self.documents[position]
+                        result.deleted_count += 1
+                        break
+                continue
+            document = request._doc
+            if isinstance(request, InsertOne):
+                self._insert(document)
+                result.inserted_count += 1
+                continue
+            if isinstance(request, ReplaceOne):
+                update = self._replace(request._filter, document, bool(request._upsert))
+            else:
+                update = self._update(request._filter, document, bool(request._upsert),
+                                      many=isinstance(request, UpdateMany))
+            result.matched_count += update.matched_count
+            result.modified_count += update.modified_count
+            if update.upserted_id is not None:
+                result.upserted_ids[index] = update.upserted_id
+        result.upserted_count = len(result.upserted_ids)
+        return result
+
+    def aggregate(self, pipeline: List[dict], **kwargs):
+        return InMemoryAggregation(self, pipeline)
+
+    async def create_index(self, keys, **kwargs):
+        return str(keys)
+
+    async def drop_index(self, name, **kwargs):
+        return None
+
+    async def create_indexes(self, indexes, **kwargs):
+        return [str(index.document["key"]) for index in indexes]
+
+class InMemoryDatabase:
+    """
+    Dict-of-collections database with a simulated network round trip
+
+    Every operation awaits `latency` seconds so request handlers yield to the
+    event loop exactly where they would against a real MongoDB server.
+    """
+
+    def __init__(self, latency: float = 0.0005):
+        self.latency = latency
+        self._collections: Dict[str, InMemoryCollection] = {}
+
+    async def round_trip(self) -> None:
+        await asyncio.sleep(self.latency)
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> InMemoryCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, command, **kwargs):
+        await self.round_trip()
+        return {"ok": 1}
+
+class FakeShopifyResponse:
+    def __init__(self, status_code: int, payload: dict):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = json.dumps(payload)
+        self.headers: Dict[str, str] = {}
+
+    def json(self) -> dict:
+        return self._payload
+
+class FakeShopifyAPI:
+    """
+    Drop-in for the `requests` module used by shopify_integration
+
+    Answers the orders and customers endpoints for every order number/email
+    registered with add_order(), and the products endpoint for the catalog
+    in `products` (one tagged ConfianceBoost product by default). Calls block for `latency` seconds like the
+    real synchronous HTTP client does.
+    """
+
+    def __init__(self, latency: float = 0.08):
+        self.latency = latency
+        self.orders: Dict[str, dict] = {}
+        self.products: List[dict] = [
+            {"id": 1001, "tags": "confianceboost, confianceboost-tier:premium", "variants": [{"id": 2001}]}
+        ]
+
+    def add_order(self, order_number: str, email: str, product_id: int = 1001,
+                  variant_id: int = 2001) -> dict:
+        order = {
+            "id": 450789469 + len(self.orders),
+            "name": f"#{order_number}",
+            "email": email,
+            "total_price": "97.00",
+            "created_at": "2025-01-15T10:00:00Z",
+            "financial_status": "paid",
+            "billing_address": {"first_name": "Client", "last_name": order_number},
+            "line_items": [{
+                "name": "ConfianceBoost - Formation Premium",
+                "product_id": product_id,
+                "variant_id": variant_id
+            }]
+        }
+        self.orders[order["name"]] = order
+        return order
+
+    def get(self, url: str, headers: Optional[dict] = None, params: Optional[dict] = None,
+            timeout: Optional[float] = None) -> FakeShopifyResponse:
+        time.sleep(self.latency)
+        params = params or {}
+        if url.endswith('/orders.json'):
+            order = self.orders.get(params.get('name', ''))
+            return FakeShopifyResponse(200, {"orders": [order] if order else []})
+        if url.endswith('/customers/search.json'):
+            query = params.get('query', '')
+            emails = {part.split(':', 1)[1] for part in query.split(' OR ') if ':' in part}
+            customers = [
+                {"id": order["id"], "email": order["email"], "first_name": "Client",
+                 "last_name": order["name"], "created_at": order["created_at"],
+                 "total_spent": order["total_price"], "orders_count": 1}
+                for order in self.orders.values() if order["email"] in emails
+            ]
+            return FakeShopifyResponse(200, {"customers": customers})
+        if url.endswith('/products.json'):
+            since_id = int(params.get('since_id', 0))
+            limit = int(params.get('limit', 50))
+            page = sorted((product for product in self.products if product["id"] > since_id),
+                          key=lambda product: product["id"])[:limit]
+            return FakeShopifyResponse(200, {"products": page})
+        return FakeShopifyResponse(404, {"errors": "Not Found"})
+
+def install_stand_ins(mongo_latency: float = 0.0005, shopify_latency: float = 0.08):
+    """
+    Points the backend modules at in-memory MongoDB and Shopify stand-ins
+
+    Replaces connect_database(): the app must be driven without its lifespan
+    (e.g. through httpx.ASGITransport). Returns (database, shopify).
+    """
+    import database
+    import shopify_integration
+
+    fake_db = InMemoryDatabase(latency=mongo_latency)
+    database.bind_database(fake_db)
+
+    fake_shopify = FakeShopifyAPI(latency=shopify_latency)
+    shopify_integration.requests = fake_shopify
+    shopify_integration.SHOPIFY_STORE_URL = "https://stand-in.myshopify.com"
+    shopify_integration.SHOPIFY_ACCESS_TOKEN = "stand-in-token"
+
+    return fake_db, fake_shopify
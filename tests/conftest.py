@@ -0,0 +1,49 @@
+"""
+Shared fixtures: the backend runs against the in-memory MongoDB and Shopify
+stand-ins (backend_stand_ins.py), so the suite needs neither a database
+server nor store credentials. Tests drive coroutines with asyncio.run().
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+for path in (ROOT, ROOT / "backend"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+import backend_stand_ins  # noqa: E402
+
+@pytest.fixture
+def stand_ins():
+    """A migrated, empty in-memory database (demo user and default modules seeded); yields (db, shopify)"""
+    import database
+    from cache import cache, LocalLRU
+    from migrations import run_migrations
+
+    db, shopify = backend_stand_ins.install_stand_ins(mongo_latency=0, shopify_latency=0)
+    # The catalog and stats are cached process-wide; start every test cold
+    cache.local = LocalLRU(cache.local.maxsize)
+    asyncio.run(run_migrations(database.db))
+    yield db, shopify
+    cache.local = LocalLRU(cache.local.maxsize)
+
+@pytest.fixture
+def call_api(stand_ins):
+    """Sends one request to the app, without its lifespan; returns the httpx response"""
+    import httpx
+    import server
+    from rate_limit import RATE_LIMITERS
+
+    for limiter in RATE_LIMITERS.values():
+        limiter._buckets.clear()
+
+    async def send(method: str, url: str, **kwargs):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await client.request(method, url, **kwargs)
+
+    return lambda method, url, **kwargs: asyncio.run(send(method, url, **kwargs))
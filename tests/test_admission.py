@@ -0,0 +1,105 @@
+import asyncio
+
+from admission import AdmissionController, MongoLatencyTracker, RouteClass, classify, CHEAP, EXPENSIVE
+
+def controller(limit: int, queue_size: int = 10, queue_timeout: float = 1.0) -> AdmissionController:
+    return AdmissionController(max_limit=limit, min_limit=1, queue_size=queue_size, queue_timeout=queue_timeout,
+                               latency_tracker=MongoLatencyTracker())
+
+def test_routes_are_classified():
+    assert classify("GET", "/api/modules/3") is CHEAP
+    assert classify("POST", "/api/shopify/validate-access") is EXPENSIVE
+    # Live streams and non-API paths never hold a slot
+    assert classify("GET", "/api/user/events") is None
+    assert classify("GET", "/metrics") is None
+
+def test_queued_requests_are_admitted_by_priority():
+    cheap, expensive = RouteClass("t_cheap", 0), RouteClass("t_expensive", 2)
+
+    async def scenario():
+        admission = controller(limit=1)
+        assert await admission.acquire(cheap) is None
+        order = []
+
+        async def wait(route_class):
+            assert await admission.acquire(route_class) is None
+            order.append(route_class.name)
+            admission.release(route_class)
+
+        waiters = [asyncio.ensure_future(wait(expensive)), asyncio.ensure_future(wait(cheap))]
+        await asyncio.sleep(0)
+        admission.release(cheap)
+        await asyncio.gather(*waiters)
+        assert order == ["t_cheap", "t_expensive"]
+        assert admission.active == 0 and admission.queued == 0
+
+    asyncio.run(scenario())
+
+def test_queue_is_bounded_across_route_classes():
+    first, second = RouteClass("t_first", 0), RouteClass("t_second", 1)
+
+    async def scenario():
+        admission = controller(limit=1, queue_size=1)
+        assert await admission.acquire(first) is None
+        waiter = asyncio.ensure_future(admission.acquire(first))
+        await asyncio.sleep(0)
+        # queue_size bounds the total, not each class
+        assert await admission.acquire(second) == "queue_full"
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+def test_waiter_times_out():
+    route_class = RouteClass("t_timeout", 1)
+
+    async def scenario():
+        admission = controller(limit=1, queue_timeout=0.01)
+        assert await admission.acquire(route_class) is None
+        assert await admission.acquire(route_class) == "queue_timeout"
+        assert admission.queued == 0 and route_class.queued == 0
+
+    asyncio.run(scenario())
+
+def test_cancelled_waiter_leaves_no_orphan():
+    route_class = RouteClass("t_cancelled", 1)
+
+    async def scenario():
+        admission = controller(limit=1)
+        assert await admission.acquire(route_class) is None
+        waiter = asyncio.ensure_future(admission.acquire(route_class))
+        await asyncio.sleep(0)
+        assert admission.queued == 1
+
+        # The client disconnects while queued
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert waiter.cancelled()
+        assert admission.queued == 0 and route_class.queued == 0
+
+        # Releasing the slot must not hand it to the cancelled request
+        admission.release(route_class)
+        assert admission.active == 0 and route_class.active == 0
+        assert await admission.acquire(route_class) is None
+
+    asyncio.run(scenario())
+
+def test_waiter_cancelled_after_admission_gives_the_slot_back():
+    route_class = RouteClass("t_cancelled_admitted", 1)
+
+    async def scenario():
+        admission = controller(limit=1)
+        assert await admission.acquire(route_class) is None
+        waiter = asyncio.ensure_future(admission.acquire(route_class))
+        await asyncio.sleep(0)
+        # Admitted and cancelled in the same tick
+        admission.release(route_class)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        if not waiter.cancelled():
+            # asyncio.wait_for may deliver the admission instead: the caller owns the slot
+            assert waiter.result() is None
+            admission.release(route_class)
+        assert admission.active == 0 and route_class.active == 0
+
+    asyncio.run(scenario())
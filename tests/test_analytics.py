@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime
+
+import numpy as np
+
+import database
+from analytics import FunnelAccumulator, compute_funnel
+
+def test_funnel_counts_users_completing_each_module_in_order():
+    accumulator = FunnelAccumulator([1, 2], [0b11, 0b1])
+    bitmaps = np.array([[0b11, 1], [0b11, 0], [0, 1], [0b01, 1]], dtype=np.int64)
+    purchased = np.array(["2025-01-05", "2025-01-20", "2025-02-01", "NaT"], dtype="datetime64[ms]")
+    certified_at = np.array(["2025-01-08", "NaT", "NaT", "NaT"], dtype="datetime64[ms]")
+    accumulator.add_batch(bitmaps, purchased, certified_at)
+
+    report = accumulator.report()
+    # Module 2 is completed by three users, but only one of them also completed module 1
+    assert [(m["completedModule"], m["completedThrough"]) for m in report["funnel"]] == [(2, 2), (3, 1)]
+    assert report["timeToCertificate"]["certified"] == 1
+    assert report["timeToCertificate"]["meanDays"] == 3.0
+    assert report["timeToCertificate"]["histogram"]["<7d"] == 1
+    assert report["byPurchaseMonth"] == [
+        {"month": "2025-01", "buyers": 2, "completedAll": 1, "certified": 1, "completionRate": 0.5},
+        {"month": "2025-02", "buyers": 1, "completedAll": 0, "certified": 0, "completionRate": 0.0},
+    ]
+
+def seed_learners():
+    async def scenario():
+        await database.users_collection.insert_many([
+            {"id": f"u{n}", "purchase_date": datetime(2025, 1 + n % 3, 10), "enrollmentDate": datetime(2025, 1, 1)}
+            for n in range(7)
+        ])
+        # u1, u3 and u5 completed the five exercises of module 1
+        await database.user_progress_collection.insert_many([
+            {"userId": f"u{n}", "exercises": {"1": 0b11111 if n % 2 else 0}} for n in range(7)
+        ])
+        await database.certificates_collection.insert_one({"id": "c1", "userId": "u1", "completedAt": datetime(2025, 2, 20)})
+    asyncio.run(scenario())
+
+def test_report_does_not_depend_on_the_batch_size(stand_ins):
+    seed_learners()
+    whole = asyncio.run(compute_funnel(batch_size=1000))
+    batched = asyncio.run(compute_funnel(batch_size=2))
+    for report in (whole, batched):
+        report.pop("elapsedMs")
+    assert whole == batched
+    # The demo user and 7 learners, three of whom finished module 1
+    assert whole["users"] == 8
+    assert whole["funnel"][0]["completedModule"] == 3
+    assert whole["timeToCertificate"]["certified"] == 1
+
+def test_admin_endpoint_requires_the_token(call_api, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "s3cret")
+    assert call_api("GET", "/api/admin/analytics/funnel").status_code == 403
+    assert call_api("GET", "/api/admin/analytics/funnel", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    response = call_api("GET", "/api/admin/analytics/funnel", headers={"X-Admin-Token": "s3cret"})
+    assert response.status_code == 200 and response.json()["users"] == 1
@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import archive
+import database
+import shopify_integration
+
+OLD = datetime.utcnow() - timedelta(days=400)
+
+def seed_inactive_user():
+    async def scenario():
+        await database.users_collection.insert_one({
+            "id": "u1", "name": "Ancien Client", "email": "Old@Example.com", "lastActivity": OLD,
+            "enrollmentDate": OLD, "purchase_date": OLD, "shopify_order_id": 5001,
+            "shopify_customer": {"id": 7, "total_spent": "97.00", "orders_count": 1},
+        })
+        await database.certificates_collection.insert_one({"id": "c1", "userId": "u1", "completedAt": OLD})
+        await database.user_progress_collection.insert_one({"userId": "u1", "exercises": {"1": 7}})
+    asyncio.run(scenario())
+
+def counts():
+    async def scenario():
+        return {
+            name: await getattr(database, f"{name}_collection").count_documents({})
+            for name in ("users", "certificates", "user_progress", "users_archive")
+        }
+    return asyncio.run(scenario())
+
+def test_inactive_users_move_to_cold_storage(stand_ins):
+    seed_inactive_user()
+    report = asyncio.run(archive.archive_inactive_users(inactive_days=365))
+    # The demo user is never archived
+    assert report["archived"] == 1
+    assert counts() == {"users": 1, "certificates": 0, "user_progress": 0, "users_archive": 1}
+
+    stored = asyncio.run(database.users_archive_collection.find_one({"_id": "u1"}))
+    assert stored["email"] == "old@example.com" and stored["shopify_order_id"] == 5001
+    assert stored["format"] == "bson+zlib"
+
+def test_active_users_stay_hot(stand_ins):
+    seed_inactive_user()
+    asyncio.run(database.users_collection.update_one({"id": "u1"}, {"$set": {"lastActivity": datetime.utcnow()}}))
+    assert asyncio.run(archive.archive_inactive_users(inactive_days=365))["archived"] == 0
+    assert counts()["users_archive"] == 0
+
+def test_writes_after_the_snapshot_are_kept(stand_ins, monkeypatch):
+    seed_inactive_user()
+    write_archive = database.users_archive_collection.bulk_write
+
+    async def late_writes(operations, **kwargs):
+        # A request for the user lands while the batch is being archived
+        await database.certificates_collection.insert_one({"id": "c2", "userId": "u1", "completedAt": OLD})
+        await database.user_progress_collection.update_one({"userId": "u1"}, {"$set": {"exercises.2": 1}})
+        return await write_archive(operations, **kwargs)
+
+    monkeypatch.setattr(database.users_archive_collection, "bulk_write", late_writes)
+    assert asyncio.run(archive.archive_inactive_users(inactive_days=365))["archived"] == 1
+    remaining = asyncio.run(database.certificates_collection.find({}, {"_id": 0, "id": 1}).to_list(None))
+    assert remaining == [{"id": "c2"}]
+    assert counts()["user_progress"] == 1
+
+def test_read_by_id_restores_everything(stand_ins):
+    seed_inactive_user()
+    asyncio.run(archive.archive_inactive_users(inactive_days=365))
+
+    user = asyncio.run(database.get_user_by_id("u1"))
+    assert user["name"] == "Ancien Client" and user["restoredAt"] is not None
+    assert counts() == {"users": 2, "certificates": 1, "user_progress": 1, "users_archive": 0}
+    assert asyncio.run(database.get_exercise_completion("u1")) == {"1": 7}
+    # Freshly restored users get a full inactivity period before going back
+    assert asyncio.run(archive.archive_inactive_users(inactive_days=365))["archived"] == 0
+
+def test_concurrent_restores_create_one_user(stand_ins):
+    seed_inactive_user()
+    asyncio.run(archive.archive_inactive_users(inactive_days=365))
+
+    async def scenario():
+        await asyncio.gather(database.restore_user(email="old@example.com"),
+                             database.restore_users_by_id(["u1"]),
+                             database.restore_user(shopify_order_id=5001))
+        return await database.users_collection.count_documents({"id": "u1"})
+
+    assert asyncio.run(scenario()) == 1
+    assert counts()["certificates"] == 1
+
+def test_anonymous_email_lookup_does_not_restore(call_api):
+    seed_inactive_user()
+    asyncio.run(archive.archive_inactive_users(inactive_days=365))
+
+    response = call_api("GET", "/api/shopify/user/old@example.com")
+    assert response.status_code == 200
+    assert response.json()["id"] == "u1"
+    # What a customer spent is never public, archived or not
+    assert response.json()["shopify_customer"] == {"id": 7}
+    assert counts()["users_archive"] == 1
+
+def test_shopify_login_restores(stand_ins):
+    seed_inactive_user()
+    asyncio.run(archive.archive_inactive_users(inactive_days=365))
+    user = asyncio.run(shopify_integration.create_shopify_user_access({
+        "order_id": 5001, "order_number": "#5001", "email": "old@example.com", "customer_name": "Ancien Client",
+        "total_price": "97.00", "created_at": "2025-01-15T10:00:00Z", "financial_status": "paid",
+    }))
+    assert user["id"] == "u1"
+    assert counts() == {"users": 2, "certificates": 1, "user_progress": 1, "users_archive": 0}
+
+def test_funnel_includes_archived_users(stand_ins):
+    import analytics
+
+    seed_inactive_user()
+    before = asyncio.run(analytics.compute_funnel())
+    asyncio.run(archive.archive_inactive_users(inactive_days=365))
+    after = asyncio.run(analytics.compute_funnel())
+    assert after["archivedUsers"] == 1
+    assert after["users"] == before["users"]
+    assert after["funnel"] == before["funnel"]
+    assert after["timeToCertificate"] == before["timeToCertificate"]
+
+def test_a_user_edited_during_the_batch_is_archived_from_a_fresh_read(stand_ins, monkeypatch):
+    seed_inactive_user()
+    write_archive = database.users_archive_collection.bulk_write
+    edits = []
+
+    async def edit_once(operations, **kwargs):
+        if not edits:
+            # The profile changes between the snapshot and the delete
+            edits.append(await database.users_collection.update_one({"id": "u1"}, {"$set": {"name": "Nouveau Nom"}}))
+        return await write_archive(operations, **kwargs)
+
+    monkeypatch.setattr(database.users_archive_collection, "bulk_write", edit_once)
+    assert asyncio.run(archive.archive_inactive_users(inactive_days=365))["archived"] == 1
+    assert counts() == {"users": 1, "certificates": 0, "user_progress": 0, "users_archive": 1}
+    restored = asyncio.run(database.restore_users_by_id(["u1"]))
+    assert restored and asyncio.run(database.get_user_by_id("u1"))["name"] == "Nouveau Nom"
+
+def test_a_user_active_during_the_batch_stays_hot(stand_ins, monkeypatch):
+    seed_inactive_user()
+    write_archive = database.users_archive_collection.bulk_write
+
+    async def activity(operations, **kwargs):
+        await database.users_collection.update_one({"id": "u1"}, {"$set": {"lastActivity": datetime.utcnow()}})
+        return await write_archive(operations, **kwargs)
+
+    monkeypatch.setattr(database.users_archive_collection, "bulk_write", activity)
+    assert asyncio.run(archive.archive_inactive_users(inactive_days=365))["archived"] == 0
+    assert counts() == {"users": 2, "certificates": 1, "user_progress": 1, "users_archive": 0}
@@ -0,0 +1,197 @@
+import asyncio
+
+from cache import Cache, InMemorySharedStore
+
+def test_concurrent_misses_load_once():
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return {"modules": 6}
+
+    async def scenario():
+        cache = Cache()
+        results = await asyncio.gather(*(cache.get_or_load("catalog", "modules", loader, 60) for _ in range(5)))
+        assert all(result == {"modules": 6} for result in results)
+        assert await cache.get_or_load("catalog", "modules", loader, 60) == {"modules": 6}
+
+    asyncio.run(scenario())
+    assert len(loads) == 1
+
+def test_invalidation_reaches_every_worker():
+    version = {"value": 1}
+
+    async def loader():
+        return dict(version)
+
+    async def scenario():
+        store = InMemorySharedStore()
+        worker_a, worker_b = Cache(store), Cache(store)
+        await worker_a.start()
+        await worker_b.start()
+        assert await worker_a.get_or_load("stats", "global", loader, 60) == {"value": 1}
+        # Filled from the shared tier, not loaded again
+        assert await worker_b.get_or_load("stats", "global", loader, 60) == {"value": 1}
+
+        version["value"] = 2
+        await worker_a.invalidate("stats", "global")
+        assert await worker_b.get_or_load("stats", "global", loader, 60) == {"value": 2}
+        assert await worker_a.get_or_load("stats", "global", loader, 60) == {"value": 2}
+
+    asyncio.run(scenario())
+
+def test_namespace_invalidation_and_topics():
+    received = []
+
+    async def scenario():
+        store = InMemorySharedStore()
+        worker_a, worker_b = Cache(store), Cache(store)
+        worker_b.on_message("user_emails", received.append)
+        await worker_a.start()
+        await worker_b.start()
+
+        await worker_b.get_or_load("catalog", "modules", lambda: asyncio.sleep(0, result=[1]), 60)
+        await worker_a.invalidate("catalog")
+        assert await worker_b.get_or_load("catalog", "modules", lambda: asyncio.sleep(0, result=[2]), 60) == [2]
+
+        await worker_a.publish("user_emails", "new@example.com")
+        # A worker does not receive its own messages
+        await worker_b.publish("user_emails", "self@example.com")
+
+    asyncio.run(scenario())
+    assert received == ["new@example.com"]
+
+def test_without_shared_store_invalidation_is_local():
+    async def scenario():
+        cache = Cache()
+        assert cache.store is None
+        await cache.get_or_load("catalog", "modules", lambda: asyncio.sleep(0, result=[1]), 60)
+        await cache.invalidate("catalog", "modules")
+        assert await cache.get_or_load("catalog", "modules", lambda: asyncio.sleep(0, result=[2]), 60) == [2]
+        # Nothing to deliver to without a store
+        await cache.publish("user_emails", "new@example.com")
+
+    asyncio.run(scenario())
+
+def test_failed_load_is_not_cached():
+    attempts = []
+
+    async def loader():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("mongo down")
+        return "ok"
+
+    async def scenario():
+        cache = Cache()
+        try:
+            await cache.get_or_load("stats", "global", loader, 60)
+        except RuntimeError:
+            pass
+        assert await cache.get_or_load("stats", "global", loader, 60) == "ok"
+
+    asyncio.run(scenario())
+    assert len(attempts) == 2
+
+def test_cancelled_caller_does_not_fail_the_others():
+    async def loader():
+        await asyncio.sleep(0.02)
+        return "catalog"
+
+    async def scenario():
+        cache = Cache()
+        leader = asyncio.ensure_future(cache.get_or_load("catalog", "modules", loader, 60))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.get_or_load("catalog", "modules", loader, 60))
+        await asyncio.sleep(0)
+        # The client that started the load disconnects
+        leader.cancel()
+        assert await follower == "catalog"
+        assert leader.cancelled()
+        assert await cache.get_or_load("catalog", "modules", loader, 60) == "catalog"
+
+    asyncio.run(scenario())
+
+class FakePubSub:
+    def __init__(self, messages, fail):
+        self.messages = messages
+        self.fail = fail
+        self.channels = []
+
+    async def subscribe(self, *channels):
+        self.channels.extend(channels)
+
+    async def listen(self):
+        for message in self.messages:
+            yield message
+        if self.fail:
+            raise ConnectionError("connection reset by peer")
+        await asyncio.Event().wait()
+
+    async def close(self):
+        pass
+
+class FakeRedis:
+    def __init__(self, sessions):
+        self.sessions = sessions
+
+    def pubsub(self, ignore_subscribe_messages=True):
+        return self.sessions.pop(0)
+
+def test_redis_listener_resubscribes_after_a_disconnect(monkeypatch):
+    import cache as cache_module
+
+    monkeypatch.setattr(cache_module, "CACHE_PUBSUB_RETRY_S", 0.001)
+    received = []
+    message = {"channel": b"invalidation", "data": b"first"}
+    sessions = [FakePubSub([message], fail=True), FakePubSub([dict(message, data=b"second")], fail=False)]
+
+    async def scenario():
+        store = cache_module.RedisSharedStore.__new__(cache_module.RedisSharedStore)
+        store._redis, store._pubsub, store._listener, store._callbacks = FakeRedis(sessions), None, None, {}
+        resubscribed = []
+        store.on_resubscribe = lambda: resubscribed.append(True)
+        await store.subscribe("invalidation", received.append)
+        for _ in range(50):
+            if len(received) == 2:
+                break
+            await asyncio.sleep(0.005)
+        store._listener.cancel()
+        assert resubscribed == [True]
+
+    asyncio.run(scenario())
+    assert received == ["first", "second"]
+
+def test_resubscription_drops_the_local_tier():
+    async def scenario():
+        store = InMemorySharedStore()
+        cache = Cache(store)
+        await cache.start()
+        await cache.get_or_load("catalog", "modules", lambda: asyncio.sleep(0, result=[1]), 60)
+        # Invalidations published while the connection was down were lost
+        assert cache.local.namespaces() == {"catalog"}
+        store.on_resubscribe()
+        assert cache.local.namespaces() == set()
+
+    asyncio.run(scenario())
+
+def test_writes_invalidate_what_they_make_stale(stand_ins, monkeypatch):
+    import database
+    import shopify_integration
+    from cache import cache
+
+    invalidated = []
+
+    async def record(namespace, key=None):
+        invalidated.append((namespace, key))
+
+    monkeypatch.setattr(cache, "invalidate", record)
+    asyncio.run(shopify_integration.create_shopify_user_access({
+        "order_id": 42, "order_number": "#42", "email": "new@example.com", "customer_name": "Client",
+        "total_price": "97.00", "created_at": "2025-01-15T10:00:00Z", "financial_status": "paid",
+    }))
+    assert invalidated == [("stats", "global")]
+    # Already migrated: nothing changed, nothing evicted
+    asyncio.run(database.init_database())
+    assert invalidated == [("stats", "global")]
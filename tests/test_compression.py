@@ -0,0 +1,43 @@
+import gzip
+
+import compression
+from compression import PrecompressedVariants, negotiate
+
+BODY = b'{"modules": [' + b'{"title": "Comprendre sa valeur personnelle"},' * 200 + b'{}]}'
+
+def test_negotiation_follows_accept_encoding(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert negotiate("gzip, deflate, br") == "gzip"
+    assert negotiate("gzip;q=0, identity") is None
+    assert negotiate("*") == "gzip"
+    assert negotiate("") is None
+
+def test_new_bodies_get_the_cheap_level_until_served_again(monkeypatch):
+    levels = []
+    monkeypatch.setattr(compression, "compress",
+                        lambda body, encoding, best=False: levels.append(best) or gzip.compress(body))
+    variants = PrecompressedVariants()
+    sources = [variants.get(BODY, "gzip")[1] for _ in range(3)]
+    assert sources == ["precompressed_miss", "precompressed_upgrade", "precompressed"]
+    assert levels == [False, True]
+
+    # A body that changes on every write only ever costs the cheap level
+    for progress in range(5):
+        variants.get(BODY + str(progress).encode(), "gzip")
+    assert levels == [False, True] + [False] * 5
+
+def test_variants_are_bounded():
+    variants = PrecompressedVariants(maxsize=2)
+    for n in range(3):
+        variants.get(BODY + str(n).encode(), "gzip")
+    assert variants.get(BODY + b"0", "gzip")[1] == "precompressed_miss"
+
+def test_catalog_is_served_compressed(call_api):
+    plain = call_api("GET", "/api/modules", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    for _ in range(2):
+        response = call_api("GET", "/api/modules", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "accept-encoding" in response.headers["vary"].lower()
+        # httpx decodes the body
+        assert response.json() == plain.json()
@@ -0,0 +1,53 @@
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+import backend_stand_ins
+import database
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+
+class FakeMotorClient:
+    """Records its options and the pings sent to warm its pool"""
+
+    def __init__(self, url, **options):
+        self.url, self.options = url, options
+        self.pings = 0
+        self.closed = False
+        self.admin = self
+        self.database = backend_stand_ins.InMemoryDatabase(latency=0)
+
+    async def command(self, name):
+        assert name == "ping"
+        self.pings += 1
+        return {"ok": 1}
+
+    def __getitem__(self, name):
+        return self.database
+
+    def close(self):
+        self.closed = True
+
+def test_importing_the_dal_opens_no_connection():
+    code = "import database, sys; sys.exit(database.client is not None or database.users_collection is not None)"
+    subprocess.run([sys.executable, "-c", code], cwd=BACKEND, check=True)
+
+def test_the_worker_client_is_sized_from_the_environment_and_warmed(stand_ins, monkeypatch):
+    db, _ = stand_ins
+    monkeypatch.setattr(database, "AsyncIOMotorClient", FakeMotorClient)
+    monkeypatch.setenv("MONGO_MIN_POOL_SIZE", "3")
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "7")
+    monkeypatch.setenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "250")
+    try:
+        asyncio.run(database.connect_database())
+        client = database.client
+        assert client.options["maxPoolSize"] == 7 and client.options["minPoolSize"] == 3
+        assert client.options["waitQueueTimeoutMS"] == 250
+        assert client.pings == 3
+        assert database.users_collection is client.database.users
+
+        database.close_database()
+        assert client.closed and database.client is None
+    finally:
+        database.bind_database(db)
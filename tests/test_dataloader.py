@@ -0,0 +1,117 @@
+import asyncio
+
+import database
+from dataloader import DataLoader, request_scope
+
+def test_concurrent_loads_share_one_batch():
+    calls = []
+
+    async def batch_fn(keys):
+        calls.append(list(keys))
+        return {key: {"id": key} for key in keys}
+
+    async def scenario():
+        loader = DataLoader(batch_fn)
+        first, second, again = await asyncio.gather(loader.load("a"), loader.load("b"), loader.load("a"))
+        assert first == {"id": "a"} and second == {"id": "b"}
+        # Identity map: the same key resolves to the same object, without a second query
+        assert again is first
+        assert await loader.load("a") is first
+
+    asyncio.run(scenario())
+    assert calls == [["a", "b"]]
+
+def test_failed_batch_is_not_memoized():
+    attempts = []
+
+    async def batch_fn(keys):
+        attempts.append(keys)
+        if len(attempts) == 1:
+            raise RuntimeError("mongo down")
+        return {key: key.upper() for key in keys}
+
+    async def scenario():
+        loader = DataLoader(batch_fn)
+        try:
+            await loader.load("a")
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("the batch error must reach the caller")
+        assert await loader.load("a") == "A"
+
+    asyncio.run(scenario())
+    assert len(attempts) == 2
+
+def test_primed_documents_skip_the_query():
+    async def batch_fn(keys):
+        raise AssertionError("primed keys must not be fetched")
+
+    async def scenario():
+        loader = DataLoader(batch_fn)
+        loader.prime_many([{"id": 1, "title": "Module 1"}], "id")
+        assert (await loader.load(1))["title"] == "Module 1"
+
+    asyncio.run(scenario())
+
+def test_request_scope_batches_user_reads(stand_ins, monkeypatch):
+    finds = []
+    find = database.users_collection.find
+
+    def counting_find(query=None, projection=None, **kwargs):
+        finds.append(query)
+        return find(query, projection, **kwargs)
+
+    monkeypatch.setattr(database.users_collection, "find", counting_find)
+
+    async def scenario():
+        await database.users_collection.insert_many([{"id": "u1", "name": "A"}, {"id": "u2", "name": "B"}])
+        with request_scope():
+            first, second, again = await asyncio.gather(
+                database.get_user_by_id("u1"), database.get_user_by_id("u2"), database.get_user_by_id("u1")
+            )
+        assert (first["name"], second["name"]) == ("A", "B")
+        assert again is first
+
+    asyncio.run(scenario())
+    assert finds == [{"id": {"$in": ["u1", "u2"]}}]
+
+def test_prime_and_clear_during_a_pending_load():
+    release = None
+
+    async def batch_fn(keys):
+        await release.wait()
+        return {key: f"loaded {key}" for key in keys}
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        loader = DataLoader(batch_fn)
+        primed = asyncio.ensure_future(loader.load("a"))
+        cleared = asyncio.ensure_future(loader.load("b"))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)  # the batch is now waiting on batch_fn
+
+        loader.prime("a", "primed a")
+        loader.clear("b")
+        reloaded = asyncio.ensure_future(loader.load("b"))
+        release.set()
+        results = await asyncio.wait_for(asyncio.gather(primed, cleared, reloaded), 1)
+        assert results == ["primed a", "loaded b", "loaded b"]
+        assert await loader.load("a") == "primed a"
+
+    asyncio.run(scenario())
+
+def test_clear_then_load_again_resolves_both():
+    async def batch_fn(keys):
+        return {key: key.upper() for key in keys}
+
+    async def scenario():
+        loader = DataLoader(batch_fn)
+        first = asyncio.ensure_future(loader.load("a"))
+        await asyncio.sleep(0)
+        loader.clear("a")
+        second = asyncio.ensure_future(loader.load("a"))
+        assert await asyncio.wait_for(asyncio.gather(first, second), 1) == ["A", "A"]
+
+    asyncio.run(scenario())
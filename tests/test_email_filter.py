@@ -0,0 +1,145 @@
+import asyncio
+
+import database
+import email_filter as email_filter_module
+from cache import Cache, InMemorySharedStore
+from email_filter import EMAIL_FILTER_TOPIC, BloomFilter, EmailFilter
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    emails = [f"client{n}@example.com" for n in range(1000)]
+    for email in emails:
+        bloom.add(email)
+    assert all(email in bloom for email in emails)
+    false_positives = sum(f"stranger{n}@example.com" in bloom for n in range(10000))
+    assert false_positives < 300
+    assert bloom.estimated_false_positive_rate() < 0.02
+
+def test_bloom_filter_counts_distinct_emails():
+    bloom = BloomFilter(100, 0.01)
+    assert bloom.add("a@example.com")
+    assert not bloom.add("a@example.com")
+    bloom.add("b@example.com")
+    assert bloom.count == 2
+
+def test_build_covers_hot_and_archived_users(stand_ins):
+    async def scenario():
+        await database.users_collection.insert_many([
+            {"id": "u1", "email": "Hot@Example.com"}, {"id": "u2", "email": None}
+        ])
+        await database.users_archive_collection.insert_one({"_id": "u3", "email": "cold@example.com"})
+        email_filter = EmailFilter(capacity=100)
+        assert await email_filter.might_exist("anyone@example.com")  # not built yet: every lookup goes through
+        await email_filter.build()
+        assert await email_filter.might_exist("hot@example.com")
+        assert await email_filter.might_exist("COLD@example.com")
+        assert not await email_filter.might_exist("nobody@example.com")
+
+        await email_filter.add("New@Example.com")
+        assert await email_filter.might_exist("new@example.com")
+
+    asyncio.run(scenario())
+
+def test_filter_is_disabled_without_a_shared_store(stand_ins):
+    from cache import cache
+
+    async def scenario():
+        email_filter = EmailFilter(capacity=100)
+        await email_filter.start()
+        assert cache.store is None and not email_filter.ready
+        assert await email_filter.might_exist("nobody@example.com")
+
+    asyncio.run(scenario())
+
+def test_unknown_email_is_answered_without_mongodb(call_api, monkeypatch):
+    import server
+
+    email_filter = EmailFilter(capacity=100)
+    asyncio.run(email_filter.build())
+    monkeypatch.setattr(server, "email_filter", email_filter)
+    lookups = []
+    find_one = database.users_collection.find_one
+
+    async def counting_find_one(query=None, projection=None, **kwargs):
+        lookups.append(query)
+        return await find_one(query, projection, **kwargs)
+
+    monkeypatch.setattr(database.users_collection, "find_one", counting_find_one)
+    assert call_api("GET", "/api/shopify/user/nobody@example.com").status_code == 404
+    assert lookups == []
+    assert call_api("GET", "/api/shopify/user/demo@confianceboost.fr").status_code == 200
+    assert lookups == [{"email": "demo@confianceboost.fr"}]
+
+def shared_cache(monkeypatch):
+    """The filter's cache, backed by a shared store as with REDIS_URL"""
+    shared = Cache(InMemorySharedStore())
+    monkeypatch.setattr(email_filter_module, "cache", shared)
+    return shared
+
+def test_a_negative_is_not_trusted_after_a_lost_addition(stand_ins, monkeypatch):
+    shared = shared_cache(monkeypatch)
+
+    async def scenario():
+        email_filter = EmailFilter(capacity=100)
+        await shared.start()
+        await email_filter.build()
+        assert not await email_filter.might_exist("late@example.com")
+
+        # Another worker stored a user and took a generation, but its message never arrived
+        await database.users_collection.insert_one({"id": "u9", "email": "late@example.com"})
+        await shared.incr_counter(EMAIL_FILTER_TOPIC)
+        assert await email_filter.might_exist("late@example.com")
+        assert await email_filter.might_exist("nobody@example.com")
+
+        await email_filter.build()
+        assert await email_filter.might_exist("late@example.com")
+        assert not await email_filter.might_exist("nobody@example.com")
+
+    asyncio.run(scenario())
+
+def test_additions_delivered_out_of_order_close_the_gap(stand_ins, monkeypatch):
+    shared = shared_cache(monkeypatch)
+
+    async def scenario():
+        email_filter = EmailFilter(capacity=100)
+        await shared.start()
+        await email_filter.build()
+        for _ in range(2):
+            await shared.incr_counter(EMAIL_FILTER_TOPIC)
+        email_filter._on_remote_add("2:b@example.com")
+        assert await email_filter.might_exist("nobody@example.com")
+        email_filter._on_remote_add("1:a@example.com")
+        assert not await email_filter.might_exist("nobody@example.com")
+
+        # Local additions take the next generation
+        await email_filter.add("c@example.com")
+        assert await shared.read_counter(EMAIL_FILTER_TOPIC) == 3
+        assert not await email_filter.might_exist("nobody@example.com")
+
+    asyncio.run(scenario())
+
+def test_a_lasting_gap_triggers_a_rebuild(stand_ins, monkeypatch):
+    shared = shared_cache(monkeypatch)
+    monkeypatch.setattr(email_filter_module, "EMAIL_FILTER_GAP_GRACE_S", -1)
+
+    async def scenario():
+        email_filter = EmailFilter(capacity=100)
+        await shared.start()
+        await email_filter.start()
+        while not email_filter.ready:
+            await asyncio.sleep(0)
+        await database.users_collection.insert_one({"id": "u9", "email": "late@example.com"})
+        await shared.incr_counter(EMAIL_FILTER_TOPIC)
+        try:
+            assert await email_filter.might_exist("nobody@example.com")
+            assert await email_filter.might_exist("nobody@example.com")
+            for _ in range(100):
+                if email_filter._watermark == 1:
+                    break
+                await asyncio.sleep(0)
+            assert await email_filter.might_exist("late@example.com")
+            assert not await email_filter.might_exist("nobody@example.com")
+        finally:
+            await email_filter.stop()
+
+    asyncio.run(scenario())
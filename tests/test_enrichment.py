@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime
+
+import database
+import shopify_integration
+from enrichment import CustomerEnrichmentWorker
+from rate_limit import RateLimitPolicy
+
+def seed_users():
+    asyncio.run(database.users_collection.insert_many([
+        {"id": "u1", "email": "Alice@Example.com"},
+        {"id": "u2", "email": "bob@example.com"},
+        {"id": "u3", "email": "carol@example.com"},
+        {"id": "u4", "email": "dan@example.com", "shopify_customer_checked_at": datetime.utcnow()},
+    ]))
+
+def user(user_id):
+    return asyncio.run(database.users_collection.find_one({"id": user_id}, {"_id": 0}))
+
+def test_users_are_enriched_in_batched_searches(stand_ins, monkeypatch):
+    _, shopify = stand_ins
+    shopify.add_order("5001", "alice@example.com")
+    shopify.add_order("5002", "carol@example.com")
+    seed_users()
+    searches = []
+    search = shopify_integration.search_shopify_customers
+    monkeypatch.setattr(shopify_integration, "search_shopify_customers",
+                        lambda emails, reserved=False: searches.append(emails) or search(emails, reserved))
+
+    # The demo user and u1-u3; u4 was checked recently
+    assert asyncio.run(CustomerEnrichmentWorker(batch_size=2).run_once()) == 4
+    assert sorted(len(batch) for batch in searches) == [2, 2]
+    assert user("u1")["shopify_customer"]["orders_count"] == 1
+    assert "shopify_customer" not in user("u2") and user("u2")["shopify_customer_checked_at"]
+    # Everyone is stamped: nothing to do until the recheck delay
+    assert asyncio.run(CustomerEnrichmentWorker(batch_size=2).run_once()) == 0
+
+def test_failed_searches_leave_users_for_the_next_scan(stand_ins, monkeypatch):
+    seed_users()
+
+    def unavailable(emails, reserved=False):
+        raise RuntimeError("Shopify customer search returned 503")
+
+    monkeypatch.setattr(shopify_integration, "search_shopify_customers", unavailable)
+    assert asyncio.run(CustomerEnrichmentWorker().run_once()) == 0
+    assert "shopify_customer_checked_at" not in user("u1")
+
+def test_each_worker_gets_a_share_of_the_shopify_budget():
+    share = shopify_integration._worker_share(RateLimitPolicy("shopify_api", 40, 20), 4)
+    assert share.capacity == 10 and share.refill_rate == 0.5
+
+def test_stopping_releases_the_scan_lease(stand_ins, monkeypatch):
+    from enrichment import ENRICHMENT_LEASE_ID
+    from migrations import acquire_lease
+
+    monkeypatch.setattr("enrichment.ENRICHMENT_ENABLED", True)
+
+    async def scenario():
+        worker = CustomerEnrichmentWorker(interval=3600)
+        await worker.start()
+        await asyncio.sleep(0.01)
+        held = not await acquire_lease(database.db, ENRICHMENT_LEASE_ID, "other", 60)
+        await worker.stop()
+        return held, await acquire_lease(database.db, ENRICHMENT_LEASE_ID, "other", 60)
+
+    assert asyncio.run(scenario()) == (True, True)
@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import database
+from events import EXERCISE_COMPLETION, PROGRESS_UPDATE, LearningEventBuffer, get_user_activity, module_minutes
+
+DAY = datetime(2025, 3, 14, 9, 30)
+
+def rollup(day="2025-03-14"):
+    return asyncio.run(database.learning_daily_collection.find_one({"day": day}, {"_id": 0}))
+
+def test_module_minutes_come_from_the_duration():
+    assert module_minutes({"duration": "45 min"}) == 45
+    assert module_minutes({"duration": None}) == 0
+
+def test_events_merge_into_one_bucket_per_user_and_day(stand_ins):
+    async def scenario():
+        buffer = LearningEventBuffer()
+        buffer.record("u1", EXERCISE_COMPLETION, 1, 9.0, at=DAY)
+        buffer.record("u1", PROGRESS_UPDATE, 2, 4.5, at=DAY.replace(hour=18))
+        buffer.record("u2", EXERCISE_COMPLETION, 1, 9.0, at=DAY)
+        buffer.record("u1", EXERCISE_COMPLETION, 1, 9.0, at=DAY.replace(day=15))
+        assert buffer.pending == 3
+        assert await buffer.flush() == 3
+        # Later events of an existing bucket don't add a learner to the rollup
+        buffer.record("u1", EXERCISE_COMPLETION, 3, 1.0, at=DAY.replace(hour=20))
+        await buffer.flush()
+
+    asyncio.run(scenario())
+    bucket = asyncio.run(database.learning_events_collection.find_one({"userId": "u1", "day": "2025-03-14"}))
+    assert bucket["exerciseCompletions"] == 2 and bucket["progressUpdates"] == 1
+    assert bucket["modules"] == [1, 2, 3] and bucket["minutes"] == 14.5
+    assert bucket["firstAt"] == DAY and bucket["lastAt"] == DAY.replace(hour=20)
+    assert rollup() == {"day": "2025-03-14", "activeLearners": 2, "minutes": 23.5,
+                        "progressUpdates": 1, "exerciseCompletions": 3}
+    assert rollup("2025-03-15")["activeLearners"] == 1
+
+def test_a_failed_flush_keeps_its_events_for_the_next_one(stand_ins, monkeypatch):
+    write = database.learning_events_collection.bulk_write
+
+    async def unavailable(operations, **kwargs):
+        raise ConnectionError("primary stepped down")
+
+    async def scenario():
+        buffer = LearningEventBuffer()
+        buffer.record("u1", EXERCISE_COMPLETION, 1, 9.0, at=DAY)
+        monkeypatch.setattr(database.learning_events_collection, "bulk_write", unavailable)
+        with pytest.raises(ConnectionError):
+            await buffer.flush()
+        buffer.record("u1", EXERCISE_COMPLETION, 1, 9.0, at=DAY)
+        monkeypatch.setattr(database.learning_events_collection, "bulk_write", write)
+        assert await buffer.flush() == 1
+
+    asyncio.run(scenario())
+    assert rollup()["exerciseCompletions"] == 2
+
+def test_rollups_are_recomputed_after_a_failed_update(stand_ins, monkeypatch):
+    write = database.learning_daily_collection.bulk_write
+
+    async def unavailable(operations, **kwargs):
+        raise ConnectionError("primary stepped down")
+
+    async def scenario():
+        buffer = LearningEventBuffer()
+        buffer.record("u1", EXERCISE_COMPLETION, 1, 9.0, at=DAY)
+        monkeypatch.setattr(database.learning_daily_collection, "bulk_write", unavailable)
+        await buffer.flush()
+        assert await database.learning_daily_collection.count_documents({}) == 0
+        monkeypatch.setattr(database.learning_daily_collection, "bulk_write", write)
+        # Nothing new to write: the flush only reconciles
+        assert await buffer.flush() == 0
+
+    asyncio.run(scenario())
+    assert rollup() == {"day": "2025-03-14", "activeLearners": 1, "minutes": 9.0,
+                        "progressUpdates": 0, "exerciseCompletions": 1}
+
+def test_user_activity_reads_recent_buckets(stand_ins):
+    async def scenario():
+        buffer = LearningEventBuffer()
+        buffer.record("u1", EXERCISE_COMPLETION, 1, 9.0)
+        buffer.record("u1", EXERCISE_COMPLETION, 1, 9.0, at=DAY)
+        await buffer.flush()
+        return await get_user_activity("u1", 7)
+
+    activity = asyncio.run(scenario())
+    assert len(activity) == 1 and "userId" not in activity[0]
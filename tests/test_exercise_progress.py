@@ -0,0 +1,51 @@
+import asyncio
+
+import database
+from migrations import DEMO_USER_ID
+
+def tick(call_api, module_id, index, completed=True):
+    return call_api("POST", f"/api/modules/{module_id}/exercises/{index}/complete", json={"completed": completed})
+
+def test_bitmap_sets_and_clears_single_exercises(stand_ins):
+    async def scenario():
+        await database.set_exercise_completion("u1", 1, 0, True)
+        await database.set_exercise_completion("u1", 1, 3, True)
+        await database.set_exercise_completion("u1", 2, 1, True)
+        return await database.set_exercise_completion("u1", 1, 0, False), await database.get_exercise_completion("u1")
+
+    bitmap, bitmaps = asyncio.run(scenario())
+    assert bitmap == 0b1000
+    assert bitmaps == {"1": 0b1000, "2": 0b10}
+
+def test_progress_is_a_popcount_over_the_module_exercises():
+    module = {"id": 1, "content": {"exercises": ["a", "b", "c", "d"]}}
+    # Bits beyond the module's exercises (removed since) don't count
+    progress = database.module_exercise_progress(module, 0b110011)
+    assert progress == {"moduleId": 1, "completedExercises": [0, 1], "completedCount": 2,
+                        "totalExercises": 4, "progress": 50}
+    assert database.module_exercise_progress({"id": 2, "content": {}}, 0b1)["progress"] == 0
+
+def test_ticking_exercises_updates_the_module_and_the_user(call_api):
+    for index in range(5):
+        assert tick(call_api, 1, index).status_code == 200
+    module = call_api("GET", "/api/modules/1").json()
+    assert module["progress"] == 100 and module["completed"] is True
+    user = call_api("GET", "/api/user/progress").json()
+    assert user["completedModules"] == 1 and user["currentStreak"] == 1
+
+    response = tick(call_api, 1, 4, completed=False)
+    assert response.json()["progress"] == 80
+    module = call_api("GET", "/api/modules/1").json()
+    assert module["progress"] == 80 and module["completed"] is False
+    assert call_api("GET", "/api/user/progress").json()["completedModules"] == 0
+    overall = call_api("GET", "/api/user/exercise-progress").json()
+    assert overall["completedExercises"] == 4
+
+def test_unticking_is_not_a_learning_action(call_api):
+    tick(call_api, 2, 0, completed=False)
+    user = asyncio.run(database.users_collection.find_one({"id": DEMO_USER_ID}))
+    assert user.get("lastActivity") is None
+
+def test_out_of_range_exercises_are_rejected(call_api):
+    assert tick(call_api, 1, 5).status_code == 404
+    assert tick(call_api, 99, 0).status_code == 404
@@ -0,0 +1,94 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import live
+from live import HEARTBEAT_FRAME, RESYNC_FRAME, EventBroker
+
+def events(frames):
+    """(event type, data) of SSE frames"""
+    parsed = []
+    for frame in frames:
+        lines = dict(line.split(": ", 1) for line in frame.decode().strip().split("\n"))
+        parsed.append((lines["event"], json.loads(lines["data"])))
+    return parsed
+
+def test_events_reach_their_user_and_broadcasts_reach_everyone():
+    async def scenario():
+        broker = EventBroker()
+        alice, bob = broker.subscribe("alice"), broker.subscribe("bob")
+        await broker.publish("alice", live.PROGRESS, {"totalProgress": 40})
+        await broker.publish(None, live.MODULE, {"id": 1})
+        return await alice.next_frames(), await bob.next_frames()
+
+    alice, bob = asyncio.run(scenario())
+    assert events(alice) == [("progress", {"totalProgress": 40}), ("module", {"id": 1})]
+    assert events(bob) == [("module", {"id": 1})]
+
+def test_a_slow_subscriber_gets_one_resync(monkeypatch):
+    monkeypatch.setattr(live, "LIVE_QUEUE_SIZE", 2)
+
+    async def scenario():
+        broker = EventBroker()
+        subscription = broker.subscribe("alice")
+        for n in range(5):
+            await broker.publish("alice", live.EXERCISE, {"n": n})
+        first = await subscription.next_frames()
+        await broker.publish("alice", live.EXERCISE, {"n": 5})
+        return first, await subscription.next_frames()
+
+    assert asyncio.run(scenario()) == ([RESYNC_FRAME], [live.encode_event(live.EXERCISE, {"n": 5})])
+
+def test_heartbeats_and_close():
+    async def scenario():
+        broker = EventBroker(heartbeat_interval=0.01)
+        subscription = broker.subscribe("alice")
+        await broker.start()
+        heartbeat = await asyncio.wait_for(subscription.next_frames(), 1)
+        await broker.stop()
+        return heartbeat, await subscription.next_frames()
+
+    assert asyncio.run(scenario()) == ([HEARTBEAT_FRAME], [])
+
+def test_subscriptions_are_capped_and_released():
+    broker = EventBroker(max_subscribers=1)
+    subscription = broker.subscribe("alice")
+    assert broker.subscribe("bob") is None
+    broker.unsubscribe(subscription)
+    broker.unsubscribe(subscription)
+    assert broker.subscribers == 0 and broker.subscribe("bob") is not None
+
+def test_events_are_relayed_to_other_workers(monkeypatch):
+    relayed = []
+
+    async def publish(topic, message):
+        relayed.append((topic, message))
+
+    # Two workers' brokers, relaying through a shared store
+    here, there = EventBroker(), EventBroker()
+    monkeypatch.setattr(live, "cache", SimpleNamespace(store=object(), publish=publish))
+
+    async def scenario():
+        subscription = there.subscribe("alice")
+        await here.publish("alice", live.CERTIFICATE, {"title": "Estime de soi"})
+        for topic, message in relayed:
+            assert topic == live.LIVE_TOPIC
+            there._on_remote_event(message)
+        return await subscription.next_frames()
+
+    assert events(asyncio.run(scenario())) == [("certificate", {"title": "Estime de soi"})]
+
+def test_dal_writes_publish_live_events(stand_ins):
+    import database
+
+    async def scenario():
+        subscription = live.live_events.subscribe("u1")
+        try:
+            await database.set_exercise_completion("u1", 1, 2, True)
+            return await subscription.next_frames()
+        finally:
+            live.live_events.unsubscribe(subscription)
+
+    assert events(asyncio.run(scenario())) == [
+        ("exercise", {"moduleId": 1, "exerciseIndex": 2, "completed": True, "bitmap": 4})
+    ]
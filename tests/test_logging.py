@@ -0,0 +1,49 @@
+import json
+import logging
+import queue
+import sys
+
+from logging_config import JsonFormatter, NonBlockingQueueHandler, RepeatSampler, log_records_dropped_total
+
+def record(message="Shopify down", level=logging.ERROR, lineno=10, **extra):
+    entry = logging.LogRecord("shopify_integration", level, "shopify_integration.py", lineno, message, (), None)
+    entry.__dict__.update(extra)
+    return entry
+
+def test_json_lines_carry_the_request_id_and_extras():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        entry = record("Order %s failed", request_id="abc", order=42)
+        entry.args = (1001,)
+        entry.exc_info = sys.exc_info()
+    line = json.loads(JsonFormatter().format(entry))
+    assert line["msg"] == "Order 1001 failed" and line["request_id"] == "abc" and line["order"] == 42
+    assert line["level"] == "ERROR" and "ValueError: boom" in line["exc"]
+
+def test_repeated_errors_are_sampled_after_a_burst():
+    sampler = RepeatSampler(window=60, burst=3, rate=10)
+    kept = [sampler.filter(record()) for _ in range(23)]
+    # 3 in the burst, then the 10th and 20th repeats
+    assert kept.count(True) == 5
+    last_kept = [entry for entry in (record() for _ in range(10)) if sampler.filter(entry)]
+    assert last_kept[0].suppressed == 9
+
+def test_sampling_is_per_call_site_and_spares_info():
+    sampler = RepeatSampler(window=60, burst=1, rate=1000)
+    assert sampler.filter(record(lineno=1)) and not sampler.filter(record(lineno=1))
+    assert sampler.filter(record(lineno=2))
+    assert all(sampler.filter(record(level=logging.INFO)) for _ in range(5))
+
+def test_a_full_queue_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    dropped = log_records_dropped_total._default.value
+    handler.emit(record())
+    handler.emit(record())
+    assert handler.queue.qsize() == 1
+    assert log_records_dropped_total._default.value == dropped + 1
+
+def test_responses_echo_the_request_id(call_api):
+    response = call_api("GET", "/api/modules", headers={"X-Request-ID": "trace-123"})
+    assert response.headers["x-request-id"] == "trace-123"
+    assert len(call_api("GET", "/api/modules").headers["x-request-id"]) == 32
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import metrics
+from metrics import Counter, Gauge, Histogram, MongoCommandListener, Registry
+
+def sample(text: str, prefix: str) -> float:
+    return sum(float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(prefix))
+
+def test_exposition_format():
+    registry = Registry()
+    requests = registry.register(Counter("test_requests_total", "Requests", ("path",)))
+    latency = registry.register(Histogram("test_latency_seconds", "Latency", buckets=(0.1, 1.0)))
+    in_flight = registry.register(Gauge("test_in_flight", "In flight"))
+    requests.labels('/a"b').inc()
+    requests.labels('/a"b').inc(2)
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+    in_flight.inc()
+    in_flight.dec()
+
+    lines = registry.render().splitlines()
+    assert "# TYPE test_requests_total counter" in lines
+    assert 'test_requests_total{path="/a\\"b"} 3' in lines
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{le="1"} 2' in lines
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "test_latency_seconds_sum 5.55" in lines
+    assert "test_latency_seconds_count 3" in lines
+    assert "test_in_flight 0" in lines
+
+def test_requests_are_labelled_by_route_template(call_api):
+    route = 'confianceboost_http_requests_total{method="GET",route="/api/modules/{module_id}",status="200"}'
+    before = sample(metrics.render_metrics(), route)
+    call_api("GET", "/api/modules/1")
+    call_api("GET", "/api/modules/2")
+    text = call_api("GET", "/metrics").text
+    assert sample(text, route) == before + 2
+    assert "route=\"/api/modules/1\"" not in text
+
+def test_mongo_listener_times_commands_by_collection():
+    listener = MongoCommandListener()
+    started = SimpleNamespace(connection_id=("db", 1), request_id=7, command_name="find",
+                              command={"find": "test_collection"})
+    listener.started(started)
+    listener.failed(SimpleNamespace(connection_id=("db", 1), request_id=7, duration_micros=2500))
+    text = metrics.render_metrics()
+    labels = '{collection="test_collection",operation="find"}'
+    assert sample(text, f"confianceboost_mongo_command_duration_seconds_count{labels}") == 1
+    assert sample(text, f"confianceboost_mongo_command_failures_total{labels}") == 1
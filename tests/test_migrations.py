@@ -0,0 +1,74 @@
+import asyncio
+
+import backend_stand_ins
+import migrations
+from migrations import DEFAULT_MODULES, LATEST_VERSION, acquire_lease, release_lease, run_migrations
+
+def fresh_database():
+    return backend_stand_ins.InMemoryDatabase(latency=0)
+
+def test_migrations_run_once_and_seed_the_defaults():
+    db = fresh_database()
+
+    async def scenario():
+        first = await run_migrations(db)
+        return first, await run_migrations(db)
+
+    assert asyncio.run(scenario()) == (LATEST_VERSION, 0)
+    assert sorted(module["id"] for module in db.modules.documents) == [module["id"] for module in DEFAULT_MODULES]
+    assert [user["id"] for user in db.users.documents] == [migrations.DEMO_USER_ID]
+    marker = next(document for document in db.meta.documents if document["_id"] == migrations.SCHEMA_VERSION_ID)
+    assert marker["version"] == LATEST_VERSION
+    assert [entry["version"] for entry in marker["applied"]] == list(range(1, LATEST_VERSION + 1))
+
+def test_a_held_lease_excludes_other_owners_until_released():
+    db = fresh_database()
+
+    async def scenario():
+        taken = await acquire_lease(db, "lease", "a", ttl=60)
+        contended = await acquire_lease(db, "lease", "b", ttl=60)
+        renewed = await acquire_lease(db, "lease", "a", ttl=60)
+        await release_lease(db, "lease", "a")
+        return taken, contended, renewed, await acquire_lease(db, "lease", "b", ttl=60)
+
+    assert asyncio.run(scenario()) == (True, False, True, True)
+
+def test_duplicate_modules_keep_the_oldest_copy_and_are_backed_up():
+    db = fresh_database()
+    db.modules.documents.extend([
+        {"_id": "b", "id": 1, "title": "Copie"},
+        {"_id": "a", "id": 1, "title": "Original"},
+        {"_id": "c", "id": 2, "title": "Unique"},
+    ])
+
+    asyncio.run(run_migrations(db))
+
+    modules = {module["id"]: module for module in db.modules.documents}
+    assert len(db.modules.documents) == len(DEFAULT_MODULES)
+    assert modules[1]["_id"] == "a" and modules[1]["title"] == "Original"
+    assert db.modules_dedupe_backup.documents == [{"_id": "b", "id": 1, "title": "Copie"}]
+
+def test_dedupe_replays_safely_after_an_interrupted_run():
+    db = fresh_database()
+    db.modules.documents.extend([{"_id": "a", "id": 1}, {"_id": "b", "id": 1}])
+    # A previous attempt backed "b" up, then died before deleting it
+    db.modules_dedupe_backup.documents.append({"_id": "b", "id": 1})
+
+    assert asyncio.run(migrations._dedupe_by_id(db, "modules", [])) == 1
+    assert [module["_id"] for module in db.modules.documents] == ["a"]
+    assert db.modules_dedupe_backup.documents == [{"_id": "b", "id": 1}]
+
+def test_duplicate_users_keep_the_most_recently_active_copy():
+    from datetime import datetime
+
+    db = fresh_database()
+    db.users.documents.extend([
+        {"_id": "a", "id": "u1", "lastActivity": datetime(2024, 1, 1)},
+        {"_id": "b", "id": "u1", "lastActivity": datetime(2024, 3, 1)},
+        {"_id": "c", "id": "u1"},
+    ])
+
+    asyncio.run(run_migrations(db))
+
+    assert [user["_id"] for user in db.users.documents] == ["b"]
+    assert sorted(user["_id"] for user in db.users_dedupe_backup.documents) == ["a", "c"]
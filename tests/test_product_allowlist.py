@@ -0,0 +1,34 @@
+import asyncio
+
+import shopify_integration
+from shopify_integration import ProductAllowlist
+
+ITEM = {"name": "ConfianceBoost - Formation Premium", "product_id": 1001, "variant_id": 2001}
+UNKNOWN = {"name": "Carte cadeau Confiance", "product_id": 9999, "variant_id": 9998}
+
+def tier(line_items):
+    return asyncio.run(ProductAllowlist().tier_for_order(line_items))
+
+def test_tagged_products_grant_their_tier(stand_ins):
+    assert tier([ITEM]) == "premium"
+    assert tier([UNKNOWN]) is None
+
+def test_explicit_tiers_override_tags_and_the_highest_tier_wins(stand_ins, monkeypatch):
+    monkeypatch.setenv("SHOPIFY_VARIANT_TIERS", "2001:vip, oops")
+    monkeypatch.setenv("SHOPIFY_PRODUCT_TIERS", "9999:standard")
+    assert tier([ITEM]) == "vip"
+    assert tier([UNKNOWN]) == "standard"
+    assert tier([UNKNOWN, ITEM]) == "vip"
+
+def test_an_empty_allowlist_grants_nothing(stand_ins):
+    _, shopify = stand_ins
+    shopify.products = []
+    # The product name still contains "confiance"
+    assert tier([ITEM]) is None
+
+def test_legacy_name_matching_is_opt_in(stand_ins, monkeypatch):
+    _, shopify = stand_ins
+    shopify.products = []
+    monkeypatch.setattr(shopify_integration, "SHOPIFY_LEGACY_NAME_MATCH", True)
+    assert tier([ITEM]) == shopify_integration.DEFAULT_ACCESS_TIER
+    assert tier([{"name": "Autre formation", "product_id": 1}]) is None
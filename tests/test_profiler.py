@@ -0,0 +1,47 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+from profiler import QueryProfilerMiddleware, current_profile, query_profile_listener
+
+def command(request_id, name="find", collection="modules", micros=1500):
+    return SimpleNamespace(connection_id=("db", 1), request_id=request_id, command_name=name,
+                           command={name: collection}, duration_micros=micros)
+
+async def two_queries(scope, receive, send):
+    # What Motor's executor threads report while the endpoint runs
+    for request_id, collection in ((1, "modules"), (2, "users")):
+        query_profile_listener.started(command(request_id, collection=collection))
+        query_profile_listener.succeeded(command(request_id, collection=collection))
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+def run(app, path="/api/modules"):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path}
+    asyncio.run(app(scope, None, send))
+    return dict(sent[0]["headers"])
+
+def test_queries_are_reported_in_response_headers():
+    headers = run(QueryProfilerMiddleware(two_queries, slow_threshold_ms=10_000))
+    assert headers[b"x-db-queries"] == b"2"
+    assert headers[b"server-timing"] == b'db;dur=3.00;desc="2 queries"'
+    # The profile is scoped to the request
+    assert current_profile() is None
+
+def test_slow_requests_log_their_commands(caplog):
+    with caplog.at_level(logging.WARNING, logger="profiler"):
+        run(QueryProfilerMiddleware(two_queries, slow_threshold_ms=0))
+    record = next(record for record in caplog.records if hasattr(record, "slow_request"))
+    slow = record.slow_request
+    assert slow["status"] == 200 and slow["db_queries"] == 2
+    assert [c["collection"] for c in slow["db_commands"]] == ["modules", "users"]
+
+def test_commands_outside_a_request_are_ignored():
+    query_profile_listener.started(command(3))
+    query_profile_listener.succeeded(command(3))
+    assert current_profile() is None
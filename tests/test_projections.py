@@ -0,0 +1,19 @@
+def test_profile_without_the_requested_fields_is_not_a_404(call_api):
+    # The demo user has never set a timezone: the projection matches the user, with no field
+    response = call_api("GET", "/api/user/profile?fields=timezone")
+    assert response.status_code == 200
+    assert "email" not in response.json()
+
+def test_projected_profile_returns_only_the_requested_fields(call_api):
+    response = call_api("GET", "/api/user/profile?fields=name,email")
+    assert response.status_code == 200
+    assert response.json() == {"name": "Utilisateur Demo", "email": "demo@confianceboost.fr"}
+
+def test_unknown_field_is_rejected(call_api):
+    assert call_api("GET", "/api/user/profile?fields=password").status_code == 400
+
+def test_projected_module_lookup(call_api):
+    response = call_api("GET", "/api/modules/1?fields=title")
+    assert response.status_code == 200
+    assert set(response.json()) == {"title"}
+    assert call_api("GET", "/api/modules/99?fields=title").status_code == 404
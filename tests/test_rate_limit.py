@@ -0,0 +1,46 @@
+from rate_limit import RateLimiter, RateLimitPolicy
+
+def test_bucket_allows_a_burst_then_refills():
+    limiter = RateLimiter(RateLimitPolicy("test_burst", capacity=3, period=60))
+    assert [limiter.hit("1.2.3.4", now=0.0) for _ in range(3)] == [None, None, None]
+    retry_after = limiter.hit("1.2.3.4", now=0.0)
+    # One token comes back every 20s
+    assert retry_after == 20.0
+    assert limiter.hit("1.2.3.4", now=10.0) == 10.0
+    assert limiter.hit("1.2.3.4", now=20.0) is None
+
+def test_keys_have_separate_buckets():
+    limiter = RateLimiter(RateLimitPolicy("test_keys", capacity=1, period=60))
+    assert limiter.hit("a@example.com", now=0.0) is None
+    assert limiter.hit("a@example.com", now=0.0) is not None
+    assert limiter.hit("b@example.com", now=0.0) is None
+
+def test_least_recently_used_bucket_is_evicted():
+    limiter = RateLimiter(RateLimitPolicy("test_evict", capacity=1, period=60), max_keys=2)
+    limiter.hit("a", now=0.0)
+    limiter.hit("b", now=0.0)
+    limiter.hit("a", now=0.0)
+    limiter.hit("c", now=0.0)
+    assert len(limiter) == 2
+    # "b" was evicted; a fresh bucket is full again
+    assert limiter.hit("b", now=0.0) is None
+    assert limiter.hit("c", now=0.0) is not None
+
+def test_ip_dependency_runs_on_the_event_loop():
+    import inspect
+    from rate_limit import limit_by_ip
+
+    # A sync dependency would run in FastAPI's threadpool, racing on the buckets
+    assert inspect.iscoroutinefunction(limit_by_ip("user_lookup_ip"))
+
+def test_endpoint_answers_429_with_retry_after(call_api, monkeypatch):
+    import rate_limit
+
+    # Collecting backend_load_test.py (a *_test.py module) turns rate limiting off by default
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setitem(rate_limit.RATE_LIMITERS, "user_lookup_ip",
+                        RateLimiter(RateLimitPolicy("user_lookup_ip", capacity=1, period=60)))
+    call_api("GET", "/api/shopify/user/demo@confianceboost.fr")
+    response = call_api("GET", "/api/shopify/user/demo@confianceboost.fr")
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
@@ -0,0 +1,59 @@
+import asyncio
+
+from search import SearchIndex, fold, stem, tokenize
+
+MODULE = {
+    "id": 1,
+    "title": "Développer son assertivité",
+    "description": "Exprimer ses besoins avec respect",
+    "content": {"introduction": "Dire non sans culpabiliser", "exercises": ["Formuler une demande claire"]},
+}
+
+def test_folding_and_stemming_make_variants_match():
+    assert fold("Assertivité") == "assertivite"
+    assert stem(fold("assertivité")) == stem("assertif") == stem(fold("Assertive"))
+    assert "de" not in tokenize("Estime de soi")
+
+def test_search_ranks_matches_and_completes_the_last_word():
+    index = SearchIndex()
+    assert index.sync([MODULE]) > 0
+    results = index.search("assertif")["results"]
+    assert results and results[0]["moduleId"] == 1 and results[0]["kind"] == "module"
+    prefixed = index.search("demand")
+    assert any(result["kind"] == "exercise" for result in prefixed["results"])
+    assert index.search("introuvable")["total"] == 0
+
+def test_sync_only_reindexes_changed_modules():
+    index = SearchIndex()
+    catalog = [MODULE, dict(MODULE, id=2, title="Gérer l'anxiété sociale")]
+    assert index.sync(catalog) == 2
+    assert index.sync(catalog) == 0
+    assert index.sync([dict(module) for module in catalog]) == 0
+    assert index.sync([MODULE]) == 1
+    assert index.search("anxiete")["total"] == 0
+
+def test_search_does_not_query_mongodb_once_the_catalog_is_cached(call_api, monkeypatch):
+    import database
+
+    assert call_api("GET", "/api/search?q=imposteur").json()["total"] > 0
+    queries = []
+    find = database.modules_collection.find
+    monkeypatch.setattr(database.modules_collection, "find",
+                        lambda *args, **kwargs: queries.append(args) or find(*args, **kwargs))
+    for query in ("estime", "anxiété", "décisions"):
+        assert call_api("GET", "/api/search", params={"q": query}).json()["total"] > 0
+    assert queries == []
+
+def test_search_follows_catalog_invalidation(stand_ins):
+    import database
+    from cache import cache
+    from search import search_index
+
+    async def scenario():
+        search_index.sync(await database.get_catalog_content())
+        await database.modules_collection.update_one({"id": 1}, {"$set": {"title": "Titre introuvable"}})
+        await cache.invalidate("catalog")
+        search_index.sync(await database.get_catalog_content())
+        return search_index.search("introuvable")["results"]
+
+    assert [result["moduleId"] for result in asyncio.run(scenario())][:1] == [1]
@@ -0,0 +1,29 @@
+import json
+from datetime import datetime
+
+from migrations import DEFAULT_MODULES
+from models import Module, User, module_serializer, user_serializer
+
+USER = {
+    "_id": "internal", "id": "u1", "name": "Client", "email": "client@example.com",
+    "enrollmentDate": datetime(2025, 1, 15, 10, 30, 0, 123000), "shopify_order_id": 5001,
+    "shopify_customer": {"id": 7, "first_name": "Cli", "total_spent": "97.00", "orders_count": 1, "tags": "vip"},
+}
+
+def validated(model, document) -> dict:
+    return json.loads(model.model_validate(document).model_dump_json())
+
+def test_trusted_output_matches_the_response_model():
+    for module in DEFAULT_MODULES:
+        assert json.loads(module_serializer.dump_json(module)) == validated(Module, module)
+    assert json.loads(user_serializer.dump_json(USER)) == validated(User, USER)
+
+def test_internal_fields_never_leak():
+    user = json.loads(user_serializer.dump_json(USER))
+    assert "_id" not in user and "shopify_order_id" not in user
+    assert "tags" not in user["shopify_customer"]
+    assert user["currentStreak"] == 0 and user["lastActivity"] is None
+
+def test_projected_fields_and_lists():
+    modules = json.loads(module_serializer.dump_json_list(DEFAULT_MODULES[:2], ("id", "title")))
+    assert modules == [{"id": module["id"], "title": module["title"]} for module in DEFAULT_MODULES[:2]]
@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import database
+
+class FrozenClock(datetime):
+    now_utc = datetime(2025, 3, 1, 12, 0)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.now_utc
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(database, "datetime", FrozenClock)
+    return FrozenClock
+
+def record_at(clock, user_id: str, *moments: datetime) -> dict:
+    async def scenario():
+        user = None
+        for moment in moments:
+            clock.now_utc = moment
+            user = await database.record_activity(user_id)
+        return user
+    return asyncio.run(scenario())
+
+def test_streak_counts_consecutive_days(stand_ins, clock):
+    asyncio.run(database.users_collection.insert_one({"id": "u1", "timezone": "UTC"}))
+    user = record_at(clock, "u1", datetime(2025, 3, 1, 9), datetime(2025, 3, 1, 18), datetime(2025, 3, 2, 9),
+                     datetime(2025, 3, 3, 9))
+    assert (user["currentStreak"], user["longestStreak"]) == (3, 3)
+    assert user["lastActivity"] == datetime(2025, 3, 3, 9)
+
+    # A missed day starts over, the record stays
+    user = record_at(clock, "u1", datetime(2025, 3, 5, 9))
+    assert (user["currentStreak"], user["longestStreak"]) == (1, 3)
+
+def test_late_event_does_not_move_the_streak(stand_ins, clock):
+    asyncio.run(database.users_collection.insert_one({"id": "u1", "timezone": "UTC"}))
+    user = record_at(clock, "u1", datetime(2025, 3, 1, 9), datetime(2025, 3, 2, 9), datetime(2025, 3, 1, 20))
+    assert user["currentStreak"] == 2
+    assert user["lastActivity"] == datetime(2025, 3, 2, 9)
+
+# 22:30, 23:30 and 00:30 UTC: midnight falls before the third event in UTC,
+# before the second in Paris (the default timezone), never in New York
+@pytest.mark.parametrize("tz, streaks", [("UTC", (1, 2)), ("America/New_York", (1, 1)), (None, (2, 2))])
+def test_days_follow_the_user_timezone(stand_ins, clock, tz, streaks):
+    user = {"id": "u1"} if tz is None else {"id": "u1", "timezone": tz}
+    asyncio.run(database.users_collection.insert_one(user))
+    user = record_at(clock, "u1", datetime(2025, 3, 1, 22, 30), datetime(2025, 3, 1, 23, 30))
+    assert user["currentStreak"] == streaks[0]
+    user = record_at(clock, "u1", datetime(2025, 3, 2, 0, 30))
+    assert user["currentStreak"] == streaks[1]
+
+def test_local_day_number_matches_the_pipeline(stand_ins, clock):
+    asyncio.run(database.users_collection.insert_one({"id": "u1", "timezone": "Asia/Tokyo"}))
+    moment = datetime(2025, 3, 1, 16, 0)  # already March 2nd in Tokyo
+    user = record_at(clock, "u1", moment)
+    assert user["lastActivityDay"] == database.local_day_number(moment, "Asia/Tokyo")
+    assert database.local_day_number(moment, "Asia/Tokyo") == database.local_day_number(moment, "UTC") + 1
+
+def test_current_streak_expires_after_a_missed_day():
+    user = {"currentStreak": 4, "timezone": "UTC",
+            "lastActivityDay": database.local_day_number(datetime(2025, 3, 1, 9), "UTC")}
+    assert database.current_streak(user, datetime(2025, 3, 2, 23)) == 4
+    assert database.current_streak(user, datetime(2025, 3, 3, 0, 1)) == 0
+    assert database.current_streak({}, datetime(2025, 3, 3)) == 0
+    # An unknown timezone falls back to the default instead of failing
+    assert database.local_day_number(datetime(2025, 3, 1, 9), "Mars/Olympus") == \
+        database.local_day_number(datetime(2025, 3, 1, 9), database.DEFAULT_TIMEZONE)
@@ -0,0 +1,60 @@
+import base64
+import hashlib
+import hmac
+import json
+
+import pytest
+
+from shopify_integration import verify_shopify_webhook
+
+def sign(body: bytes, secret: str) -> str:
+    return base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+
+@pytest.fixture
+def secrets(monkeypatch):
+    monkeypatch.setenv("SHOPIFY_WEBHOOK_SECRET", "current-secret")
+    monkeypatch.setenv("SHOPIFY_WEBHOOK_SECRETS", "previous-secret")
+
+def test_signature_from_any_active_secret_is_accepted(secrets):
+    body = b'{"id": 1}'
+    assert verify_shopify_webhook(body, sign(body, "current-secret"))
+    # Both secrets stay valid during a rotation
+    assert verify_shopify_webhook(body, sign(body, "previous-secret"))
+
+def test_forged_or_malformed_signatures_are_rejected(secrets):
+    body = b'{"id": 1}'
+    assert not verify_shopify_webhook(body, sign(body, "attacker-secret"))
+    assert not verify_shopify_webhook(b'{"id": 2}', sign(body, "current-secret"))
+    assert not verify_shopify_webhook(body, "not base64!")
+    assert not verify_shopify_webhook(body, "")
+
+def test_without_a_secret_nothing_verifies(monkeypatch):
+    monkeypatch.setenv("SHOPIFY_WEBHOOK_SECRET", "")
+    monkeypatch.setenv("SHOPIFY_WEBHOOK_SECRETS", "")
+    body = b'{"id": 1}'
+    assert not verify_shopify_webhook(body, sign(body, ""))
+
+def order_paid(shopify) -> bytes:
+    order = shopify.add_order("1001", "buyer@example.com")
+    return json.dumps(order).encode()
+
+def test_webhook_endpoint_checks_the_signature(secrets, call_api, stand_ins):
+    body = order_paid(stand_ins[1])
+    url = "/api/shopify/webhook/order-paid"
+    forged = call_api("POST", url, content=body, headers={"X-Shopify-Hmac-Sha256": sign(body, "attacker-secret")})
+    assert forged.status_code == 401
+    unsigned = call_api("POST", url, content=body)
+    assert unsigned.status_code == 401
+
+    response = call_api("POST", url, content=body, headers={"X-Shopify-Hmac-Sha256": sign(body, "current-secret")})
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+
+def test_oversized_webhook_is_rejected_before_parsing(secrets, call_api, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "SHOPIFY_WEBHOOK_MAX_BODY_BYTES", 16)
+    body = b'{"padding": "' + b"x" * 64 + b'"}'
+    response = call_api("POST", "/api/shopify/webhook/order-paid", content=body,
+                        headers={"X-Shopify-Hmac-Sha256": sign(body, "current-secret")})
+    assert response.status_code == 413